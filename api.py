@@ -0,0 +1,317 @@
+"""JSON API for entering deliveries and payments from the field.
+
+    python api.py [--host 127.0.0.1] [--port 8080] [--workers 16]
+
+A small asyncio HTTP/1.1 server with no dependencies beyond the standard
+library, so phones can record a delivery without loading the Streamlit
+app. Requests are parsed on the event loop; database work runs on a
+bounded thread pool whose threads keep their connections open, and
+writes go through the write queue (so concurrent entries share commits).
+
+Endpoints (JSON in and out; ?branch=NAME picks a branch):
+    GET  /prices[?name=NAME]         unit prices, of NAME or of every active distributor
+    GET  /balance?name=NAME          debit, credit and balance of an account
+    GET  /reports/daily[?date=DATE]  the day's production, sales and profit
+    POST /sales                      {date, distributor, delivered, returned, cash_paid}
+    POST /ledger                     {date, name, description, debit, credit}
+
+Dates are YYYY-MM-DD and default to today. Sales need a registered
+distributor (active or not). If BAKERY_API_TOKEN is set,
+every request needs "Authorization: Bearer <token>"; the server only
+listens beyond this machine (e.g. --host 0.0.0.0) when a token is set.
+"""
+import argparse
+import asyncio
+import hmac
+import ipaddress
+import json
+import logging
+import math
+import os
+import sqlite3
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from http import HTTPStatus
+from urllib.parse import parse_qsl, urlsplit
+
+import database as db
+
+API_WORKERS = 16
+MAX_BODY_BYTES = 64 * 1024
+MAX_HEADERS = 100
+IDLE_TIMEOUT_S = 30  # keep-alive connections are closed after this long without a request
+
+logger = logging.getLogger(__name__)
+
+
+class HTTPError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+# Request fields
+
+def _text(params, name, default=None):
+    value = params.get(name, default)
+    if value is None or not str(value).strip():
+        raise HTTPError(400, f"missing field: {name}")
+    return str(value).strip()
+
+
+def _number(params, name, default=0, cast=float):
+    value = params.get(name, default)
+    if value is None:
+        raise HTTPError(400, f"missing field: {name}")
+    try:
+        value = cast(value)
+    except (TypeError, ValueError, OverflowError):
+        raise HTTPError(400, f"{name} must be a number") from None
+    if not math.isfinite(value):
+        raise HTTPError(400, f"{name} must be a finite number")
+    if value < 0:
+        raise HTTPError(400, f"{name} must not be negative")
+    return value
+
+
+def _date(params):
+    date = _text(params, "date", datetime.now().strftime('%Y-%m-%d'))
+    try:
+        datetime.strptime(date, '%Y-%m-%d')
+    except ValueError:
+        raise HTTPError(400, "date must be YYYY-MM-DD") from None
+    return date
+
+
+# Handlers
+# Each runs on a pool thread and returns the response payload; writes
+# return (future, payload) and the event loop waits for the commit.
+
+def get_prices(params):
+    names = [_text(params, "name")] if "name" in params else db.get_distributors()
+    return {"prices": {name: float(price) for name, price in db.resolve_prices(names).items()}}
+
+
+def get_balance(params):
+    name = _text(params, "name")
+    row = db.get_balances(name)
+    if row.empty:
+        return {"name": name, "debit": 0.0, "credit": 0.0, "balance": 0.0, "last_date": None}
+    row = row.iloc[0]
+    return {"name": name, "debit": float(row['debit']), "credit": float(row['credit']),
+            "balance": float(row['balance']), "last_date": row['last_date']}
+
+
+def get_daily_report(params):
+    day = db.get_daily_summary(_date(params))
+    return {key: value if key == "date" else float(value) for key, value in day.items()}
+
+
+def post_sales(params):
+    date = _date(params)
+    distributor = _text(params, "distributor")
+    if distributor not in db.get_distributors(active_only=False):
+        # A typo would otherwise open an account nobody sees in the app
+        raise HTTPError(400, f"unknown distributor: {distributor}")
+    delivered = _number(params, "delivered", None, int)
+    returned = _number(params, "returned", 0, int)
+    if returned > delivered:
+        raise HTTPError(400, "returned must not exceed delivered")
+    cash_paid = _number(params, "cash_paid")
+    # Priced like the sales page: the client can't set its own price
+    price = float(db.resolve_prices([distributor]).iloc[0])
+    net_sales = delivered - returned
+    total_amount = net_sales * price
+    future = db.submit(db.save_sales, date, distributor, delivered, returned, net_sales, price, total_amount, cash_paid)
+    return future, {"date": date, "distributor": distributor, "net_sales": net_sales, "price": price,
+                    "total_amount": total_amount, "cash_paid": cash_paid}
+
+
+def post_ledger(params):
+    date = _date(params)
+    name = _text(params, "name")
+    description = str(params.get("description") or "").strip()
+    debit = _number(params, "debit")
+    credit = _number(params, "credit")
+    if not debit and not credit:
+        raise HTTPError(400, "debit or credit is required")
+    future = db.submit(db.add_ledger_entry, date, name, description, debit, credit)
+    return future, {"date": date, "name": name, "description": description, "debit": debit, "credit": credit}
+
+
+ROUTES = {
+    ("GET", "/prices"): get_prices,
+    ("GET", "/balance"): get_balance,
+    ("GET", "/reports/daily"): get_daily_report,
+    ("POST", "/sales"): post_sales,
+    ("POST", "/ledger"): post_ledger,
+}
+
+
+def _call(handler, branch, params):
+    # Runs on a pool thread; the branch only applies to this call
+    if branch is None:
+        return handler(params)
+    with db.use_branch(branch):
+        return handler(params)
+
+
+# HTTP
+
+async def _read_request(reader):
+    """Return (method, target, headers, body), or None at end of stream."""
+    line = await reader.readline()
+    if not line.strip():
+        return None
+    try:
+        method, target, version = line.decode("latin-1").split()
+    except ValueError:
+        raise HTTPError(400, "bad request line") from None
+    headers = {"version": version}
+    for _ in range(MAX_HEADERS):
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b""):
+            break
+        key, _, value = line.decode("latin-1").partition(":")
+        headers[key.strip().lower()] = value.strip()
+    else:
+        raise HTTPError(431, "too many headers")
+    try:
+        length = int(headers.get("content-length", 0))
+    except ValueError:
+        raise HTTPError(400, "bad Content-Length") from None
+    if length > MAX_BODY_BYTES:
+        raise HTTPError(413, "request body too large")
+    body = await reader.readexactly(length) if length > 0 else b""
+    return method.upper(), target, headers, body
+
+
+def _params(target, body):
+    params = dict(parse_qsl(urlsplit(target).query))
+    if body:
+        try:
+            payload = json.loads(body)
+        except ValueError:
+            raise HTTPError(400, "body must be JSON") from None
+        if not isinstance(payload, dict):
+            raise HTTPError(400, "body must be a JSON object")
+        params.update(payload)
+    return params
+
+
+def _authorized(headers):
+    token = os.environ.get("BAKERY_API_TOKEN")
+    if not token:
+        return True
+    return hmac.compare_digest(headers.get("authorization", "").encode("utf-8"), f"Bearer {token}".encode("utf-8"))
+
+
+async def _respond(pool, method, target, headers, body):
+    """Return (status, payload) for one request."""
+    if not _authorized(headers):
+        raise HTTPError(401, "unauthorized")
+    handler = ROUTES.get((method, urlsplit(target).path.rstrip("/") or "/"))
+    if handler is None:
+        raise HTTPError(404, "not found")
+    params = _params(target, body)
+    branch = params.pop("branch", None)
+    loop = asyncio.get_running_loop()
+    result = await loop.run_in_executor(pool, _call, handler, branch, params)
+    if isinstance(result, tuple):
+        future, result = result
+        await asyncio.wrap_future(future)
+    return 200, result
+
+
+def _response(status, payload, keep_alive):
+    try:
+        body = json.dumps(payload, ensure_ascii=False, allow_nan=False).encode("utf-8")
+    except ValueError:
+        # NaN and Infinity aren't JSON; clients couldn't parse them
+        logger.exception("response is not valid JSON")
+        status, body = 500, b'{"error": "internal error"}'
+    head = (f"HTTP/1.1 {status} {HTTPStatus(status).phrase}\r\n"
+            "Content-Type: application/json; charset=utf-8\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n")
+    return head.encode("latin-1") + body
+
+
+async def _serve_client(pool, reader, writer):
+    try:
+        while True:
+            keep_alive = False
+            try:
+                request = await asyncio.wait_for(_read_request(reader), IDLE_TIMEOUT_S)
+                if request is None:
+                    break
+                method, target, headers, body = request
+                connection = headers.get("connection", "").lower()
+                keep_alive = connection == "keep-alive" if headers["version"] == "HTTP/1.0" else connection != "close"
+                status, payload = await _respond(pool, method, target, headers, body)
+            except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError):
+                break
+            except HTTPError as e:
+                status, payload = e.status, {"error": str(e)}
+            except sqlite3.IntegrityError as e:
+                # e.g. a write into an archived month
+                status, payload = 409, {"error": str(e)}
+            except ValueError as e:
+                status, payload = 400, {"error": str(e)}
+            except Exception:
+                logger.exception("request failed")
+                status, payload = 500, {"error": "internal error"}
+            writer.write(_response(status, payload, keep_alive))
+            await writer.drain()
+            if not keep_alive:
+                break
+    except ConnectionError:
+        pass
+    finally:
+        writer.close()
+
+
+async def serve(host="127.0.0.1", port=8080, workers=API_WORKERS):
+    # One connection per pool thread, opened on first use and kept
+    pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="api")
+    server = await asyncio.start_server(lambda r, w: _serve_client(pool, r, w), host, port)
+    logger.info("serving on %s", ", ".join(str(s.getsockname()) for s in server.sockets))
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        pool.shutdown(wait=True)
+
+
+def _is_loopback(host):
+    if host == "localhost":
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python api.py", description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--workers", type=int, default=API_WORKERS, help="database threads")
+    parser.add_argument("--db", help="database file (default: the app's)")
+    args = parser.parse_args(argv)
+    if not _is_loopback(args.host) and not os.environ.get("BAKERY_API_TOKEN"):
+        parser.error(f"set BAKERY_API_TOKEN to listen on {args.host}")
+    if args.db:
+        db.DB_NAME = args.db
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    try:
+        asyncio.run(serve(args.host, args.port, args.workers))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
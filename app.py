@@ -1,9 +1,17 @@
 import streamlit as st
-import pandas as pd
+import time
 from datetime import datetime
 import database as db
+import exports
+import reports
+import report_cache
+import maintenance
 from PIL import Image
 import os
+import glob
+import tempfile
+
+BACKUP_TEMP_MAX_AGE_S = 24 * 3600  # prepared backups older than this are removed
 
 # Page Config
 st.set_page_config(page_title="نظام إدارة مخبز الوفاء", layout="wide", initial_sidebar_state="expanded")
@@ -68,79 +76,90 @@ st.markdown("""
 if os.path.exists("/home/ubuntu/alwafaa_bakery/logo.png"):
     st.sidebar.image("/home/ubuntu/alwafaa_bakery/logo.png", width=150)
 st.sidebar.title("مخبز الوفاء")
+branches = list(db.list_branches())
+branch = st.sidebar.selectbox("الفرع", branches)
+db.set_branch(branch)
+# Closed months' charts are rendered in the background, once per process
+report_cache.start_prerender(branch)
+# ANALYZE, checkpoints and vacuuming run in idle windows
+maintenance.start()
+
+
+def export_buttons(key, file_stem, sections, *args):
+    """CSV/Excel download buttons; the file is only built when one is clicked."""
+    export_branch = branch
+    formats = ["csv", "xlsx"] if exports.XLSX_AVAILABLE else ["csv"]
+    for col, fmt in zip(st.columns(len(formats)), formats):
+        def build(fmt=fmt):
+            # Runs on a separate thread, so select the branch there too
+            with db.use_branch(export_branch), exports.export(sections(*args), fmt) as f:
+                return f.read()
+        col.download_button(f"📥 تصدير {'Excel' if fmt == 'xlsx' else 'CSV'}", data=build,
+                            file_name=f"{file_stem}.{fmt}", mime=exports.MIME_TYPES[fmt],
+                            key=f"{key}_{fmt}", on_click="ignore")
+
 menu = st.sidebar.radio("القائمة الرئيسية", ["الإنتاج اليومي", "المبيعات والتوزيع", "مبيعات أخرى", "المصروفات", "إدارة الديون", "التقارير", "الإعدادات"])
 
 selected_date = st.sidebar.date_input("اختر التاريخ", datetime.now()).strftime('%Y-%m-%d')
+date_archived = db.is_archived(selected_date)
+if date_archived:
+    st.sidebar.warning("هذا الشهر مؤرشف: بياناته للعرض فقط ولا يمكن تعديلها.")
+
+page_started = time.perf_counter()
 
 # 1. Production Logic
 if menu == "الإنتاج اليومي":
     st.header("📦 الإنتاج اليومي")
     
     # Load existing data if any
-    existing_prod = db.get_data("production", selected_date)
-    default_bags = float(existing_prod['flour_bags'].iloc[0]) if not existing_prod.empty else 0.0
+    existing_prod = db.get_row("production", selected_date)
+    default_bags = float(existing_prod['flour_bags']) if existing_prod else 0.0
     
     flour_bags = st.number_input("عدد أكياس الدقيق", min_value=0.0, step=0.5, format="%.1f", value=default_bags)
     expected_production = int(flour_bags * 1600)
     
     st.info(f"الإنتاج المتوقع: {expected_production} قرص (روتي)")
     
-    if st.button("حفظ بيانات الإنتاج"):
-        db.save_production(selected_date, flour_bags, expected_production)
+    if st.button("حفظ بيانات الإنتاج", disabled=date_archived):
+        db.submit(db.save_production, selected_date, flour_bags, expected_production).result()
         st.success("تم حفظ بيانات الإنتاج بنجاح!")
 
 # 2. Daily Sales & Distribution
 elif menu == "المبيعات والتوزيع":
     st.header("🚚 المبيعات والتوزيع")
-    distributors = ["هيثم", "وجيه", "المفرش", "علي", "درهم", "كاش"]
-    
-    # Load existing sales for the date
-    existing_sales = db.get_data("sales", selected_date)
-    
-    sales_data = []
-    cols = st.columns(2)
-    
-    for i, dist in enumerate(distributors):
-        with cols[i % 2]:
-            st.subheader(f"الموزع: {dist}")
-            
-            # Get existing values if available
-            dist_row = existing_sales[existing_sales['distributor'] == dist]
-            def_del = int(dist_row['delivered'].iloc[0]) if not dist_row.empty else 0
-            def_ret = int(dist_row['returned'].iloc[0]) if not dist_row.empty else 0
-            def_cash = float(dist_row['cash_paid'].iloc[0]) if not dist_row.empty else 0.0
-            
-            delivered = st.number_input(f"الكمية المسلمة ({dist})", min_value=0, key=f"del_{dist}", value=def_del)
-            returned = st.number_input(f"الكمية المرتجعة ({dist})", min_value=0, key=f"ret_{dist}", value=def_ret)
-            cash_paid = st.number_input(f"المبلغ المدفوع نقداً ({dist})", min_value=0.0, key=f"cash_{dist}", value=def_cash)
-            
-            net_sales = delivered - returned
-            
-            # Pricing logic from database (Individual prices for distributors)
-            if dist == "كاش":
-                price = db.get_setting('price_cash', 20)
-            elif dist in ["هيثم", "وجيه", "المفرش", "علي", "درهم"]:
-                price = db.get_distributor_price(dist, 16)
-            else:
-                price = db.get_setting('price_factory', 15)
-                
-            total_amount = net_sales * price
-            sales_data.append({
-                "distributor": dist,
-                "delivered": delivered,
-                "returned": returned,
-                "net_sales": net_sales,
-                "price": price,
-                "total_amount": total_amount,
-                "cash_paid": cash_paid
-            })
-            st.write(f"صافي المبيعات: {net_sales} | السعر: {price} | الإجمالي: {total_amount:,.0f} ريال")
-            st.divider()
+    # One grid for every distributor; saved figures and current prices come from one query
+    sheet = db.get_sales_sheet(selected_date)
+    edited = st.data_editor(
+        sheet,
+        column_order=["distributor", "delivered", "returned", "cash_paid", "price"],
+        column_config={
+            "distributor": st.column_config.TextColumn("الموزع", disabled=True),
+            "delivered": st.column_config.NumberColumn("الكمية المسلمة", min_value=0, step=1),
+            "returned": st.column_config.NumberColumn("الكمية المرتجعة", min_value=0, step=1),
+            "cash_paid": st.column_config.NumberColumn("المبلغ المدفوع نقداً", min_value=0.0, format="%.0f"),
+            "price": st.column_config.NumberColumn("السعر", disabled=True),
+        },
+        hide_index=True,
+        use_container_width=True,
+        key=f"sales_grid_{selected_date}",
+    )
+
+    # Column-wise totals of the edited grid
+    edited['net_sales'] = edited['delivered'] - edited['returned']
+    edited['total_amount'] = edited['net_sales'] * edited['price']
+    sc1, sc2, sc3 = st.columns(3)
+    sc1.metric("صافي المبيعات", f"{edited['net_sales'].sum():,.0f} قرص")
+    sc2.metric("الإجمالي", f"{edited['total_amount'].sum():,.0f} ريال")
+    sc3.metric("المدفوع نقداً", f"{edited['cash_paid'].sum():,.0f} ريال")
+    if (edited['net_sales'] < 0).any():
+        st.warning("المرتجع أكبر من المسلم لدى: " + "، ".join(edited.loc[edited['net_sales'] < 0, 'distributor']))
 
-    if st.button("حفظ بيانات المبيعات"):
-        for data in sales_data:
-            db.save_sales(selected_date, data['distributor'], data['delivered'], data['returned'], 
-                         data['net_sales'], data['price'], data['total_amount'], data['cash_paid'])
+    if st.button("حفظ بيانات المبيعات", disabled=date_archived):
+        # Rows already saved, or with anything entered; untouched zero rows are skipped
+        entered = edited[['delivered', 'returned', 'cash_paid']].any(axis=1) | edited['saved'].astype(bool)
+        sales_data = edited.loc[entered, ['distributor', 'delivered', 'returned', 'net_sales', 'price',
+                                          'total_amount', 'cash_paid']].to_dict('records')
+        db.submit(db.save_sales_batch, selected_date, sales_data).result()
         st.success("تم حفظ بيانات المبيعات بنجاح!")
 
 # 3. Other Sales
@@ -148,31 +167,30 @@ elif menu == "مبيعات أخرى":
     st.header("🥐 مبيعات أخرى")
     items = ["روتي طويل", "كيك", "خبز", "فحم"]
     
-    existing_other = db.get_data("other_sales", selected_date)
+    existing_other = {r['item_name']: r['amount'] for r in db.get_rows("other_sales", selected_date)}
     
     for item in items:
-        item_row = existing_other[existing_other['item_name'] == item]
-        def_val = float(item_row['amount'].iloc[0]) if not item_row.empty else 0.0
+        def_val = float(existing_other.get(item) or 0.0)
         
         amount = st.number_input(f"مبيعات {item} (ريال)", min_value=0.0, key=f"other_{item}", value=def_val)
-        if st.button(f"حفظ {item}", key=f"btn_{item}"):
-            db.save_other_sales(selected_date, item, amount)
+        if st.button(f"حفظ {item}", key=f"btn_{item}", disabled=date_archived):
+            db.submit(db.save_other_sales, selected_date, item, amount).result()
             st.success(f"تم حفظ مبيعات {item}")
 
 # 4. Expenses
 elif menu == "المصروفات":
     st.header("💸 المصروفات")
     
-    existing_exp = db.get_data("expenses", selected_date)
+    existing_exp = db.get_row("expenses", selected_date)
     
     # Get flour bags for misc calculation
-    prod_df = db.get_data("production", selected_date)
-    bags = prod_df['flour_bags'].iloc[0] if not prod_df.empty else 0
+    prod = db.get_row("production", selected_date)
+    bags = prod['flour_bags'] if prod else 0
     misc_calc = bags * 1000
     
-    def_labor = float(existing_exp['labor'].iloc[0]) if not existing_exp.empty else 53000.0
-    def_wood = float(existing_exp['wood'].iloc[0]) if not existing_exp.empty else 20000.0
-    def_misc = float(existing_exp['misc'].iloc[0]) if not existing_exp.empty else float(misc_calc)
+    def_labor = float(existing_exp['labor']) if existing_exp else 53000.0
+    def_wood = float(existing_exp['wood']) if existing_exp else 20000.0
+    def_misc = float(existing_exp['misc']) if existing_exp else float(misc_calc)
     
     labor = st.number_input("أجور العمال", value=def_labor)
     wood = st.number_input("قيمة الحطب", value=def_wood)
@@ -182,8 +200,8 @@ elif menu == "المصروفات":
     
     st.warning(f"إجمالي المصروفات: {total_exp:,.0f} ريال يمني")
     
-    if st.button("حفظ المصروفات"):
-        db.save_expenses(selected_date, labor, wood, misc, total_exp)
+    if st.button("حفظ المصروفات", disabled=date_archived):
+        db.submit(db.save_expenses, selected_date, labor, wood, misc, total_exp).result()
         st.success("تم حفظ المصروفات بنجاح!")
 
 # 5. Debt Management (Dain & Madin)
@@ -193,41 +211,21 @@ elif menu == "إدارة الديون":
     tab1, tab2 = st.tabs(["📊 ملخص الحسابات", "➕ إضافة قيد يدوي"])
     
     with tab1:
-        # Combine Sales data and Ledger data
-        sales_df = db.get_data("sales")
-        ledger_df = db.get_data("ledger")
+        # Running totals per account, maintained by the database
+        balances = db.get_balances()
         
-        # Process Sales into Debit/Credit
-        if not sales_df.empty:
-            sales_ledger = sales_df.copy()
-            sales_ledger = sales_ledger.rename(columns={'distributor': 'name', 'total_amount': 'debit', 'cash_paid': 'credit'})
-            sales_ledger['description'] = "مبيعات يومية"
-            sales_ledger = sales_ledger[['date', 'name', 'description', 'debit', 'credit']]
-        else:
-            sales_ledger = pd.DataFrame(columns=['date', 'name', 'description', 'debit', 'credit'])
-            
-        # Combine with manual ledger entries
-        full_ledger = pd.concat([sales_ledger, ledger_df], ignore_index=True)
-        
-        if not full_ledger.empty:
-            names = full_ledger['name'].unique()
+        if not balances.empty:
+            names = balances['name']
             selected_name = st.selectbox("اختر الاسم لعرض كشف الحساب", ["الكل"] + list(names))
             
-            if selected_name != "الكل":
-                filtered_df = full_ledger[full_ledger['name'] == selected_name]
-            else:
-                filtered_df = full_ledger
-                
-            summary = filtered_df.groupby('name').agg({
-                'debit': 'sum',
-                'credit': 'sum'
-            }).reset_index()
-            summary['balance'] = summary['debit'] - summary['credit']
+            account = selected_name if selected_name != "الكل" else None
             
             # Display Summary Cards
-            total_debit = summary['debit'].sum()
-            total_credit = summary['credit'].sum()
-            total_balance = total_debit - total_credit
+            all_branches = len(branches) > 1 and st.checkbox("الإجماليات لكل الفروع")
+            totals = reports.consolidated_ledger_summary(account) if all_branches else reports.ledger_summary(account)
+            total_debit = totals['debit']
+            total_credit = totals['credit']
+            total_balance = totals['balance']
             
             sc1, sc2, sc3 = st.columns(3)
             sc1.metric("إجمالي عليه (مدين)", f"{total_debit:,.0f} ريال")
@@ -236,9 +234,25 @@ elif menu == "إدارة الديون":
             
             st.divider()
             st.subheader("تفاصيل العمليات")
+            search = st.text_input("🔎 بحث في البيان والأسماء", placeholder="مثلاً: دفعة، سلفة")
+            
+            if search.strip():
+                # Ranked matches from the search index, a page at a time
+                page_key = f"ledger_search_page_{selected_name}_{search}"
+                page = st.session_state.setdefault(page_key, 0)
+                page_df, total = db.search_ledger(search, name=account, page=page)
+                st.caption(f"عدد النتائج: {total:,}")
+                has_prev, has_next = page > 0, (page + 1) * db.SEARCH_PAGE_SIZE < total
+            else:
+                # Only the visible page is fetched; cursors of the pages visited
+                # so far are kept per selected name for the "previous" button.
+                cursors = st.session_state.setdefault(f"ledger_pages_{selected_name}", [None])
+                page_df, next_cursor = db.get_ledger_page(name=account, after=cursors[-1])
+                page = len(cursors) - 1
+                has_prev, has_next = len(cursors) > 1, next_cursor is not None
             
             # Formatting for display
-            display_df = filtered_df.sort_values('date', ascending=False).rename(columns={
+            display_df = page_df[['date', 'name', 'description', 'debit', 'credit']].rename(columns={
                 'date': 'التاريخ',
                 'name': 'الاسم',
                 'description': 'البيان',
@@ -249,6 +263,24 @@ elif menu == "إدارة الديون":
                 'عليه (مدين)': '{:,.0f}',
                 'له (دائن)': '{:,.0f}'
             }), use_container_width=True)
+            
+            pc1, pc2, pc3 = st.columns(3)
+            if pc1.button("الصفحة السابقة", disabled=not has_prev):
+                if search.strip():
+                    st.session_state[page_key] -= 1
+                else:
+                    cursors.pop()
+                st.rerun()
+            pc2.write(f"صفحة {page + 1}")
+            if pc3.button("الصفحة التالية", disabled=not has_next):
+                if search.strip():
+                    st.session_state[page_key] += 1
+                else:
+                    cursors.append(next_cursor)
+                st.rerun()
+
+            st.caption("تصدير كشف الحساب كاملاً")
+            export_buttons("export_ledger", f"statement_{selected_name}", exports.ledger_statement, account)
         else:
             st.info("لا توجد بيانات حسابات حالياً.")
 
@@ -256,7 +288,7 @@ elif menu == "إدارة الديون":
         st.subheader("إضافة قيد مالي جديد")
         with st.form("ledger_form"):
             l_date = st.date_input("تاريخ القيد", datetime.now()).strftime('%Y-%m-%d')
-            l_name = st.selectbox("الاسم", ["هيثم", "وجيه", "المفرش", "علي", "درهم", "كاش", "أخرى"])
+            l_name = st.selectbox("الاسم", db.get_distributors() + ["أخرى"])
             if l_name == "أخرى":
                 l_name = st.text_input("اكتب الاسم الجديد")
             
@@ -265,11 +297,13 @@ elif menu == "إدارة الديون":
             l_amount = st.number_input("المبلغ (ريال)", min_value=0.0)
             
             submit_l = st.form_submit_button("حفظ القيد")
-            if submit_l:
+            if submit_l and db.is_archived(l_date):
+                st.error("لا يمكن إضافة قيد في شهر مؤرشف.")
+            elif submit_l:
                 if l_type == "عليه (مدين - دين جديد)":
-                    db.add_ledger_entry(l_date, l_name, l_desc, debit=l_amount, credit=0)
+                    db.submit(db.add_ledger_entry, l_date, l_name, l_desc, debit=l_amount, credit=0).result()
                 else:
-                    db.add_ledger_entry(l_date, l_name, l_desc, debit=0, credit=l_amount)
+                    db.submit(db.add_ledger_entry, l_date, l_name, l_desc, debit=0, credit=l_amount).result()
                 st.success(f"تم حفظ القيد لـ {l_name} بنجاح!")
                 st.rerun()
 
@@ -278,28 +312,23 @@ elif menu == "التقارير":
     st.header("📊 التقارير والنتائج")
     
     report_type = st.radio("نوع التقرير", ["تقرير يومي", "تقرير شهري"], horizontal=True)
+    consolidated = len(branches) > 1 and st.checkbox("تقرير موحد لكل الفروع")
     
     if report_type == "تقرير يومي":
         st.subheader(f"تقرير يوم {selected_date}")
         
-        # Calculations
-        prod_df = db.get_data("production", selected_date)
-        sales_df = db.get_data("sales", selected_date)
-        other_df = db.get_data("other_sales", selected_date)
-        exp_df = db.get_data("expenses", selected_date)
-        
-        expected = prod_df['expected_production'].sum() if not prod_df.empty else 0
-        total_net_sales = sales_df['net_sales'].sum() if not sales_df.empty else 0
-        deficit = expected - total_net_sales
-        price_dist = db.get_setting('price_distributor', 16)
-        loss_value = deficit * price_dist
+        # Calculations (pre-aggregated per day by the database)
+        report = reports.consolidated_daily_report(selected_date) if consolidated else reports.daily_report(selected_date)
+        sales_df = report['sales']
         
-        rev_dist = sales_df['total_amount'].sum() if not sales_df.empty else 0
-        rev_other = other_df['amount'].sum() if not other_df.empty else 0
-        total_rev = rev_dist + rev_other
+        expected = report['expected']
+        total_net_sales = report['net_sales']
+        deficit = report['deficit']
+        loss_value = report['loss_value']
         
-        total_exp = exp_df['total_expenses'].sum() if not exp_df.empty else 0
-        net_profit = total_rev - total_exp - loss_value
+        total_rev = report['revenue']
+        total_exp = report['expenses']
+        net_profit = report['profit']
         
         # Dashboard
         c1, c2, c3 = st.columns(3)
@@ -327,7 +356,8 @@ elif menu == "التقارير":
             # Filter only rows with actual sales to keep it clean
             active_sales = sales_df[sales_df['net_sales'] > 0].copy()
             if not active_sales.empty:
-                display_sales = active_sales[['distributor', 'net_sales', 'total_amount', 'cash_paid']].rename(columns={
+                display_sales = active_sales[(['branch'] if consolidated else []) + ['distributor', 'net_sales', 'total_amount', 'cash_paid']].rename(columns={
+                    'branch': 'الفرع',
                     'distributor': 'الموزع',
                     'net_sales': 'الكمية المباعة',
                     'total_amount': 'المبلغ الإجمالي',
@@ -342,6 +372,9 @@ elif menu == "التقارير":
         else:
             st.info("يرجى إدخال بيانات المبيعات في قسم 'المبيعات والتوزيع' أولاً.")
 
+        if not consolidated:
+            export_buttons("export_daily", f"daily_report_{selected_date}", exports.daily_report, selected_date)
+
     else:
         st.subheader("التقرير الشهري")
         col_m, col_y = st.columns(2)
@@ -350,46 +383,50 @@ elif menu == "التقارير":
         with col_y:
             year = st.number_input("السنة", value=datetime.now().year)
         
-        start_date = f"{year}-{month:02d}-01"
-        end_date = f"{year}-{month:02d}-31"
-        
-        sales_month = db.get_data("sales", start_date=start_date, end_date=end_date)
-        exp_month = db.get_data("expenses", start_date=start_date, end_date=end_date)
-        other_month = db.get_data("other_sales", start_date=start_date, end_date=end_date)
+        report = reports.consolidated_monthly_report(year, month) if consolidated else reports.monthly_report(year, month)
+        sales_month = report['sales']
         
         if not sales_month.empty:
-            total_m_rev = sales_month['total_amount'].sum() + other_month['amount'].sum()
-            total_m_exp = exp_month['total_expenses'].sum()
+            total_m_rev = report['revenue']
+            total_m_exp = report['expenses']
             
             # Monthly Dashboard
             st.write(f"### 📅 ملخص شهر {month} / {year}")
             mc1, mc2, mc3 = st.columns(3)
             mc1.metric("إجمالي الإيرادات", f"{total_m_rev:,.0f} ريال")
             mc2.metric("إجمالي المصروفات", f"{total_m_exp:,.0f} ريال")
-            mc3.metric("صافي الربح", f"{(total_m_rev - total_m_exp):,.0f} ريال")
+            mc3.metric("صافي الربح", f"{report['profit']:,.0f} ريال")
             
             st.divider()
             
-            # Charts
+            # Charts (closed months are served pre-rendered once ready)
+            artifact = None if consolidated else report_cache.get_month(year, month, report)
             col_chart1, col_chart2 = st.columns(2)
             with col_chart1:
                 st.subheader("📈 منحنى المبيعات اليومي")
-                daily_sales = sales_month.groupby('date')['total_amount'].sum().reset_index()
-                st.line_chart(daily_sales.set_index('date'))
+                if artifact:
+                    st.image(artifact['charts']['daily'], use_container_width=True)
+                else:
+                    st.line_chart(report['daily_sales'].set_index('date'))
             
             with col_chart2:
                 st.subheader("📊 توزيع المبيعات حسب الموزع")
-                dist_sales = sales_month.groupby('distributor')['total_amount'].sum().reset_index()
-                st.bar_chart(dist_sales.set_index('distributor'))
+                if artifact:
+                    st.image(artifact['charts']['distributors'], use_container_width=True)
+                else:
+                    st.bar_chart(report['distributor_sales'].set_index('distributor'))
             
             st.divider()
             st.subheader("📑 تفاصيل الشهر")
-            st.dataframe(sales_month[['date', 'distributor', 'net_sales', 'total_amount']].rename(columns={
+            st.dataframe(sales_month[(['branch'] if consolidated else []) + ['date', 'distributor', 'net_sales', 'total_amount']].rename(columns={
+                'branch': 'الفرع',
                 'date': 'التاريخ',
                 'distributor': 'الموزع',
                 'net_sales': 'الكمية',
                 'total_amount': 'المبلغ'
-            }), use_container_width=True)
+            }), column_config={'التاريخ': st.column_config.DateColumn(format="YYYY-MM-DD")}, use_container_width=True)
+            if not consolidated:
+                export_buttons("export_monthly", f"sales_{year}_{month:02d}", exports.monthly_sales, year, month)
         else:
             st.info("لا توجد بيانات لهذا الشهر.")
 
@@ -397,56 +434,194 @@ elif menu == "التقارير":
 elif menu == "الإعدادات":
     st.header("⚙️ إعدادات النظام والأسعار")
     
-    tab_gen, tab_dist = st.tabs(["⚙️ إعدادات عامة", "🚚 أسعار الموزعين"])
+    tab_gen, tab_dist, tab_branches, tab_import, tab_diag = st.tabs(["⚙️ إعدادات عامة", "🚚 أسعار الموزعين", "🏪 الفروع", "📥 استيراد البيانات", "🩺 التشخيص"])
     
     with tab_gen:
         st.subheader("تعديل أسعار البيع العامة (ريال يمني)")
-        curr_cash = db.get_setting('price_cash', 20)
-        curr_factory = db.get_setting('price_factory', 15)
+        snapshot = db.get_price_snapshot()
+        curr_cash = snapshot.settings.get('price_cash', 20)
+        curr_factory = snapshot.settings.get('price_factory', 15)
         
         with st.form("gen_settings_form"):
             new_cash = st.number_input("سعر البيع المباشر (كاش)", value=float(curr_cash), step=1.0)
             new_factory = st.number_input("سعر المصانع / أخرى", value=float(curr_factory), step=1.0)
             
             if st.form_submit_button("حفظ الإعدادات العامة"):
-                db.update_setting('price_cash', new_cash)
-                db.update_setting('price_factory', new_factory)
+                def save_general_prices():
+                    db.update_setting('price_cash', new_cash)
+                    db.update_setting('price_factory', new_factory)
+                # One queued call, so both prices are saved together
+                db.submit(save_general_prices).result()
                 st.success("تم تحديث الأسعار العامة بنجاح!")
                 st.rerun()
 
     with tab_dist:
-        st.subheader("تعديل أسعار الموزعين (كل موزع على حدة)")
-        distributors_list = ["هيثم", "وجيه", "المفرش", "علي", "درهم"]
-        
+        st.subheader("الموزعون وأسعارهم")
+        # The cash customer is priced by the general cash price
+        registry = db.get_data("distributors")
+        registry = registry[registry['name'] != db.CASH_CUSTOMER]
+        # Names without a price of their own are billed the factory price
+        registry['price'] = db.resolve_prices(registry['name']).to_numpy()
+        registry['active'] = registry['active'].astype(bool)
         with st.form("dist_settings_form"):
-            new_prices = {}
-            cols = st.columns(2)
-            for i, d in enumerate(distributors_list):
-                with cols[i % 2]:
-                    curr_p = db.get_distributor_price(d, 16)
-                    new_prices[d] = st.number_input(f"سعر الموزع: {d}", value=float(curr_p), step=0.5, key=f"set_p_{d}")
-            
+            edited_registry = st.data_editor(
+                registry,
+                column_order=["name", "price", "active"],
+                column_config={
+                    "name": st.column_config.TextColumn("الموزع", disabled=True),
+                    "price": st.column_config.NumberColumn("السعر", min_value=0.0, step=0.5),
+                    "active": st.column_config.CheckboxColumn("نشط"),
+                },
+                hide_index=True,
+                use_container_width=True,
+            )
             if st.form_submit_button("حفظ أسعار الموزعين"):
-                for d, p in new_prices.items():
-                    db.update_distributor_price(d, p)
+                # Only the edited prices: the others may be the factory price
+                # shown for names that have no price of their own
+                changed = edited_registry[edited_registry['price'].ne(registry['price'])]
+                def save_distributors():
+                    db.update_prices_batch(dict(zip(changed['name'], changed['price'])))
+                    db.set_distributors_active(dict(zip(edited_registry['name'], edited_registry['active'])))
+                db.submit(save_distributors).result()
                 st.success("تم تحديث أسعار الموزعين بنجاح!")
                 st.rerun()
-            
+
+        with st.form("add_distributor_form"):
+            new_dist = st.text_input("اسم الموزع الجديد")
+            new_dist_price = st.number_input("سعره", value=16.0, step=0.5)
+            if st.form_submit_button("إضافة موزع") and new_dist.strip():
+                db.submit(db.add_distributor, new_dist.strip(), new_dist_price).result()
+                st.success(f"تمت إضافة {new_dist.strip()} بنجاح!")
+                st.rerun()
+
+    with tab_branches:
+        st.subheader("فروع المخبز")
+        st.write("لكل فرع قاعدة بيانات مستقلة. اختر الفرع من القائمة الجانبية.")
+        for name, path in db.list_branches().items():
+            st.write(f"- **{name}** ({os.path.basename(path)})")
+        with st.form("add_branch_form"):
+            new_branch = st.text_input("اسم الفرع الجديد")
+            if st.form_submit_button("إضافة فرع"):
+                try:
+                    db.add_branch(new_branch)
+                except ValueError:
+                    st.error("اسم الفرع فارغ أو مستخدم من قبل.")
+                else:
+                    st.success(f"تمت إضافة {new_branch} بنجاح!")
+                    st.rerun()
+
+    with tab_import:
+        st.subheader("استيراد سجلات سابقة من ملف CSV أو Excel")
+        import_tables = {"المبيعات": "sales", "الإنتاج": "production", "مبيعات أخرى": "other_sales",
+                         "المصروفات": "expenses", "القيود اليدوية": "ledger"}
+        import_label = st.selectbox("نوع البيانات", list(import_tables))
+        uploaded = st.file_uploader("اختر الملف", type=["csv", "xlsx"])
+        if uploaded is not None and st.button("بدء الاستيراد"):
+            import importer
+            bar = st.progress(0.0, text="جاري الاستيراد...")
+
+            def show_progress(stats):
+                bar.progress(stats['fraction'] or 0.0,
+                             text=f"تم حفظ {stats['rows']:,} سجل ({stats['rows_per_sec']:,.0f} سجل/ثانية)")
+            try:
+                stats = importer.import_file(uploaded, import_tables[import_label], file_name=uploaded.name,
+                                             progress=show_progress)
+            except ValueError as e:
+                st.error(f"تعذر الاستيراد: {e}")
+            else:
+                st.success(f"تم استيراد {stats['rows']:,} سجل في {stats['seconds']:.1f} ثانية "
+                           f"({stats['rows_per_sec']:,.0f} سجل/ثانية).")
+                if stats['rejected']:
+                    st.warning(f"تم تجاهل {stats['rejected']:,} سجل لبيانات غير صالحة أو لأشهر مؤرشفة.")
+
+    with tab_diag:
+        st.subheader("أداء قاعدة البيانات والصفحات")
+        enabled = st.toggle("تفعيل القياس", value=db.INSTRUMENTATION_ENABLED)
+        if enabled != db.INSTRUMENTATION_ENABLED:
+            db.set_instrumentation(enabled)
+        db.SLOW_QUERY_MS = st.number_input("حد الاستعلام البطيء (ملي ثانية)", value=float(db.SLOW_QUERY_MS), step=50.0)
+
+        stats = db.get_stats()
+        queries = [s for s in stats if not s["name"].startswith("page:")]
+        pages = [dict(s, name=s["name"][5:]) for s in stats if s["name"].startswith("page:")]
+        columns = {"name": "الاسم", "calls": "عدد الاستدعاءات", "total_ms": "الإجمالي (ms)",
+                   "p50_ms": "p50 (ms)", "p95_ms": "p95 (ms)", "rows": "الصفوف"}
+        st.write("**أكثر الاستعلامات استهلاكاً للوقت**")
+        if queries:
+            st.dataframe([{columns[k]: v for k, v in s.items()} for s in queries], use_container_width=True)
+        else:
+            st.info("لا توجد قياسات بعد. فعّل القياس ثم تنقل بين الصفحات.")
+        st.write("**زمن عرض الصفحات**")
+        if pages:
+            st.dataframe([{columns[k]: v for k, v in s.items() if k != "rows"} for s in pages],
+                         use_container_width=True)
+        for path, count in db.get_connection_counts().items():
+            st.caption(f"الاتصالات المفتوحة: {count} ({path})")
+        if st.button("تصفير القياسات"):
+            db.reset_stats()
+            st.rerun()
+
+        st.divider()
+        st.subheader("🧹 صيانة قاعدة البيانات")
+        db_stats = maintenance.database_stats()
+        dc1, dc2, dc3 = st.columns(3)
+        dc1.metric("حجم الملف", f"{db_stats['file_bytes'] / 1024 / 1024:,.1f} MB")
+        dc2.metric("سجل WAL", f"{db_stats['wal_bytes'] / 1024 / 1024:,.1f} MB")
+        dc3.metric("المساحة الفارغة (التجزئة)", f"{db_stats['fragmentation']:.0%}")
+        if db_stats['last_runs']:
+            st.dataframe([{"المهمة": task, "آخر تشغيل": started_at, "المدة (ث)": round(seconds, 3),
+                           "الحالة": status, "التفاصيل": detail}
+                          for task, started_at, seconds, status, detail in db_stats['last_runs']],
+                         use_container_width=True)
+        else:
+            st.info("لم تُشغَّل الصيانة بعد. تعمل تلقائياً عندما يكون النظام غير مستخدم.")
+        if st.button("تشغيل الصيانة الآن"):
+            with st.spinner("جاري الصيانة..."):
+                maintenance.run_due(force=True)
+            st.rerun()
+
     st.divider()
     st.subheader("💾 النسخ الاحتياطي للبيانات")
     st.write("يمكنك تحميل نسخة من قاعدة البيانات لحفظها في OneDrive أو أي مكان آمن.")
     
-    try:
-        with open("bakery.db", "rb") as f:
-            db_bytes = f.read()
-            st.download_button(
-                label="📥 تحميل نسخة احتياطية من قاعدة البيانات (bakery.db)",
-                data=db_bytes,
-                file_name=f"bakery_backup_{selected_date}.db",
-                mime="application/x-sqlite3"
-            )
-    except Exception as e:
-        st.error("فشل في الوصول إلى ملف قاعدة البيانات.")
+    # The backup is only built on request, as a consistent copy of the live database
+    compress_backup = st.checkbox("ضغط النسخة (gzip)", value=True)
+    if st.button("تجهيز نسخة احتياطية"):
+        bar = st.progress(0.0, text="جاري إنشاء النسخة الاحتياطية...")
+        try:
+            old_backup = st.session_state.pop("backup_path", None)
+            if old_backup and os.path.exists(old_backup):
+                os.remove(old_backup)
+            # Copies prepared by sessions that have since ended
+            for stale in glob.glob(os.path.join(tempfile.gettempdir(), "bakery_backup_*")):
+                if time.time() - os.path.getmtime(stale) > BACKUP_TEMP_MAX_AGE_S:
+                    os.remove(stale)
+            st.session_state["backup_path"] = db.create_backup(
+                compress=compress_backup, with_archive=True,
+                progress=lambda done, total: bar.progress(done / total if total else 1.0))
+        except Exception as e:
+            st.error("فشل في إنشاء النسخة الاحتياطية.")
+        bar.empty()
+    
+    backup_path = st.session_state.get("backup_path")
+    if backup_path and os.path.exists(backup_path):
+        compressed = backup_path.endswith(".gz")
+        bundled = ".tar" in os.path.basename(backup_path)
+        if bundled:
+            st.caption("تتضمن النسخة ملف قاعدة البيانات ومجلد الأشهر المؤرشفة، فالبيانات المؤرشفة محفوظة هناك فقط.")
+        def read_backup(path=backup_path):
+            # Read only when the button is clicked, not on every rerun
+            with open(path, "rb") as f:
+                return f.read()
+        st.download_button(
+            label="📥 تحميل نسخة احتياطية من قاعدة البيانات (bakery.db)",
+            data=read_backup,
+            file_name=f"bakery_backup_{selected_date}" + (".tar" if bundled else ".db") + (".gz" if compressed else ""),
+            mime="application/gzip" if compressed else "application/x-tar" if bundled else "application/x-sqlite3",
+            on_click="ignore"
+        )
 
     st.divider()
     st.info("ملاحظة: تغيير الأسعار سيؤثر على العمليات الجديدة التي يتم تسجيلها بعد التعديل.")
+
+db.record_page(menu, time.perf_counter() - page_started)
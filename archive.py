@@ -0,0 +1,92 @@
+"""Columnar storage for archived months.
+
+A partition is a directory holding one .npy file per column and a
+meta.json. Text columns (dates, names) are dictionary-encoded: the file
+holds int32 codes into the list of distinct values kept in meta.json,
+with -1 for NULL. The files are plain .npy, so they are memory-mapped
+on read and only the selected rows are copied.
+"""
+import json
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+
+META_FILE = "meta.json"
+
+
+def write_partition(directory, columns, rows):
+    """Write rows (tuples in `columns` order) as a partition, replacing any old one."""
+    tmp = directory + ".tmp"
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+    meta = {"rows": len(rows), "columns": {}}
+    for i, name in enumerate(columns):
+        values = [row[i] for row in rows]
+        if any(isinstance(v, str) for v in values):
+            dictionary = sorted({v for v in values if v is not None})
+            codes = {v: n for n, v in enumerate(dictionary)}
+            data = np.array([codes.get(v, -1) for v in values], dtype=np.int32)
+            meta["columns"][name] = {"kind": "text", "dictionary": dictionary}
+        elif all(isinstance(v, int) for v in values):
+            data = np.array(values, dtype=np.int64)
+            meta["columns"][name] = {"kind": "number"}
+        else:
+            data = np.array([np.nan if v is None else v for v in values], dtype=np.float64)
+            meta["columns"][name] = {"kind": "number"}
+        np.save(os.path.join(tmp, f"{name}.npy"), data)
+    with open(os.path.join(tmp, META_FILE), "w", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False)
+    # Swap in the finished directory, so readers never see half a partition
+    shutil.rmtree(directory, ignore_errors=True)
+    os.replace(tmp, directory)
+
+
+def _text_mask(info, codes, test):
+    # Evaluate the test once per distinct value, then look it up per row
+    matches = np.array([test(v) for v in info["dictionary"]] + [False], dtype=bool)
+    return matches[codes]
+
+
+def read_partition(directory, columns, equals=None, between=None):
+    """Read a partition as a DataFrame, or None if it doesn't exist.
+
+    equals maps column -> value; between is (column, low, high). Both are
+    applied before text columns are decoded.
+    """
+    try:
+        with open(os.path.join(directory, META_FILE), encoding="utf-8") as f:
+            meta = json.load(f)
+    except FileNotFoundError:
+        return None
+    arrays = {}
+
+    def column(name):
+        if name not in arrays:
+            arrays[name] = np.load(os.path.join(directory, f"{name}.npy"), mmap_mode="r")
+        return arrays[name]
+
+    mask = np.ones(meta["rows"], dtype=bool)
+    for name, value in (equals or {}).items():
+        if meta["columns"][name]["kind"] == "text":
+            mask &= _text_mask(meta["columns"][name], column(name), lambda v: v == value)
+        else:
+            mask &= column(name) == value
+    if between:
+        name, low, high = between
+        if meta["columns"][name]["kind"] == "text":
+            mask &= _text_mask(meta["columns"][name], column(name), lambda v: v is not None and low <= v <= high)
+        else:
+            mask &= (column(name) >= low) & (column(name) <= high)
+    rows = np.flatnonzero(mask)
+
+    data = {}
+    for name in columns:
+        values = np.asarray(column(name)[rows])
+        info = meta["columns"][name]
+        if info["kind"] == "text":
+            dictionary = np.array(info["dictionary"] + [None], dtype=object)
+            values = dictionary[values]
+        data[name] = values
+    return pd.DataFrame(data, columns=list(columns))
@@ -0,0 +1,8 @@
+"""Benchmarks for the database helpers and report computations.
+
+Generates a deterministic multi-year bakery history in a scratch
+database, times each scenario and prints the results as JSON:
+
+    python -m benchmarks --years 3 --distributors 100 --output after.json
+    python -m benchmarks --compare before.json after.json
+"""
@@ -0,0 +1,138 @@
+"""Run the benchmarks, or compare two result files.
+
+    python -m benchmarks [--years 3] [--distributors 100] [--iterations 30] [--output FILE]
+    python -m benchmarks --compare BEFORE.json AFTER.json
+"""
+import argparse
+import json
+import os
+import platform
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import date, datetime
+
+import database as db
+from benchmarks import generator
+from benchmarks.scenarios import SCENARIOS, Context
+
+
+def percentile(sorted_values, pct):
+    # Nearest-rank percentile
+    if not sorted_values:
+        return 0.0
+    rank = max(1, int(round(pct / 100 * len(sorted_values))))
+    return sorted_values[rank - 1]
+
+
+def time_scenario(func, ctx, iterations, warm):
+    func(ctx)  # warm-up: imports, first connection, page cache
+    timings, rows = [], 0
+    for _ in range(iterations):
+        if not warm:
+            db.clear_cache()
+        start = time.perf_counter()
+        rows += func(ctx)
+        timings.append(time.perf_counter() - start)
+    timings.sort()
+    total = sum(timings)
+    return {
+        "iterations": iterations,
+        "p50_ms": percentile(timings, 50) * 1000,
+        "p90_ms": percentile(timings, 90) * 1000,
+        "p95_ms": percentile(timings, 95) * 1000,
+        "p99_ms": percentile(timings, 99) * 1000,
+        "max_ms": timings[-1] * 1000,
+        "mean_ms": total / iterations * 1000,
+        "rows": rows,
+        "rows_per_sec": rows / total if total else 0.0,
+    }
+
+
+def run(args):
+    path = args.db or os.path.join(tempfile.mkdtemp(prefix="bakery_bench_"), "bench.db")
+    db.DB_NAME = path
+    start = date(2021, 1, 1)
+
+    began = time.perf_counter()
+    counts = generator.generate(years=args.years, distributors=args.distributors, seed=args.seed, start=start)
+    generate_s = time.perf_counter() - began
+
+    days = list(generator.iter_days(start, args.years))
+    middle = datetime.strptime(days[len(days) // 2], '%Y-%m-%d')
+    ctx = Context(names=generator.distributor_names(args.distributors), day=days[len(days) // 2],
+                  year=middle.year, month=middle.month, write_day=f"{start.year + args.years}-06-15")
+
+    results = {}
+    for name, func in SCENARIOS.items():
+        if args.only and not any(part in name for part in args.only):
+            continue
+        results[name] = time_scenario(func, ctx, args.iterations, args.warm)
+        print(f"{name:40s} p50 {results[name]['p50_ms']:9.3f} ms   p95 {results[name]['p95_ms']:9.3f} ms",
+              file=sys.stderr)
+
+    return {
+        "meta": {
+            "created": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "years": args.years,
+            "distributors": args.distributors,
+            "seed": args.seed,
+            "iterations": args.iterations,
+            "cache": "warm" if args.warm else "cold",
+            "rows": counts,
+            "generate_s": generate_s,
+            "db_bytes": os.path.getsize(path),
+        },
+        "scenarios": results,
+    }
+
+
+def compare(before_path, after_path, threshold):
+    with open(before_path) as f:
+        before = json.load(f)["scenarios"]
+    with open(after_path) as f:
+        after = json.load(f)["scenarios"]
+    regressions = 0
+    print(f"{'scenario':40s} {'before p50':>12s} {'after p50':>12s} {'ratio':>8s}")
+    for name in sorted(before.keys() & after.keys()):
+        b, a = before[name]["p50_ms"], after[name]["p50_ms"]
+        ratio = a / b if b else float("inf")
+        flag = "  REGRESSION" if ratio > threshold else ""
+        regressions += bool(flag)
+        print(f"{name:40s} {b:10.3f}ms {a:10.3f}ms {ratio:8.2f}{flag}")
+    return 1 if regressions else 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks", description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--years", type=int, default=3)
+    parser.add_argument("--distributors", type=int, default=100)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--iterations", type=int, default=30)
+    parser.add_argument("--warm", action="store_true", help="keep the read cache between iterations")
+    parser.add_argument("--only", nargs="*", help="run only scenarios whose name contains one of these")
+    parser.add_argument("--db", help="database file to generate into (default: a temp file)")
+    parser.add_argument("--output", help="write the JSON results here instead of stdout")
+    parser.add_argument("--compare", nargs=2, metavar=("BEFORE", "AFTER"), help="compare two result files")
+    parser.add_argument("--threshold", type=float, default=1.2, help="p50 ratio counted as a regression")
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        return compare(*args.compare, args.threshold)
+
+    results = run(args)
+    text = json.dumps(results, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
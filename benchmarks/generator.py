@@ -0,0 +1,69 @@
+"""Deterministic synthetic bakery history.
+
+The same seed, size and start date always produce the same rows, so
+results from different versions of the code are comparable.
+"""
+import random
+from datetime import date, timedelta
+
+import database as db
+
+OTHER_ITEMS = ["روتي طويل", "كيك", "خبز", "فحم"]
+LEDGER_DESCRIPTIONS = [("دفعة من الحساب", "credit"), ("سلفة", "debit"), ("تسديد مبلغ", "credit")]
+
+
+def distributor_names(count):
+    return [f"موزع {i:03d}" for i in range(1, count + 1)]
+
+
+def iter_days(start, years):
+    day = start
+    end = date(start.year + years, start.month, start.day)
+    while day < end:
+        yield day.strftime('%Y-%m-%d')
+        day += timedelta(days=1)
+
+
+def generate(years=3, distributors=100, seed=42, start=date(2021, 1, 1)):
+    """Fill the current database (db.DB_NAME) and return the row count per table."""
+    rng = random.Random(seed)
+    names = distributor_names(distributors)
+    prices = {name: rng.choice([15, 15.5, 16, 16.5, 17]) for name in names}
+    counts = dict.fromkeys(["production", "sales", "other_sales", "expenses", "ledger"], 0)
+
+    with db.transaction():
+        for name in names:
+            db.add_distributor(name)
+        db.update_prices_batch(prices)
+    for day in iter_days(start, years):
+        bags = rng.randint(10, 20) + rng.choice([0, 0.5])
+        expected = int(bags * 1600)
+        sales = []
+        for name in names:
+            delivered = max(0, int(rng.gauss(expected / distributors, 40)))
+            returned = rng.randint(0, delivered // 10) if delivered else 0
+            net = delivered - returned
+            total = net * prices[name]
+            sales.append(dict(distributor=name, delivered=delivered, returned=returned, net_sales=net,
+                              price=prices[name], total_amount=total,
+                              cash_paid=round(total * rng.uniform(0.5, 1.0), -1)))
+        with db.transaction():
+            db.save_production(day, bags, expected)
+            db.save_sales_batch(day, sales)
+            for item in OTHER_ITEMS:
+                db.save_other_sales(day, item, rng.randrange(0, 20000, 500))
+            misc = bags * 1000
+            db.save_expenses(day, 53000, 20000, misc, 73000 + misc)
+            # A few manual payments and advances each day
+            for name in rng.sample(names, k=max(1, distributors // 20)):
+                description, side = rng.choice(LEDGER_DESCRIPTIONS)
+                amount = rng.randrange(1000, 50000, 500)
+                db.add_ledger_entry(day, name, description,
+                                    debit=amount if side == "debit" else 0,
+                                    credit=amount if side == "credit" else 0)
+                counts["ledger"] += 1
+        counts["production"] += 1
+        counts["sales"] += len(sales)
+        counts["other_sales"] += len(OTHER_ITEMS)
+        counts["expenses"] += 1
+    return counts
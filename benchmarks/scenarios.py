@@ -0,0 +1,139 @@
+"""Timed scenarios.
+
+Each scenario takes the benchmark context and returns the number of rows
+it read or wrote, which is reported as rows/sec.
+"""
+from collections import namedtuple
+
+import database as db
+import reports
+
+Context = namedtuple("Context", ["names", "day", "year", "month", "write_day"])
+
+
+def month_range(ctx):
+    return reports.month_bounds(ctx.year, ctx.month)
+
+
+# Database helpers
+
+def get_data_sales_day(ctx):
+    return len(db.get_data("sales", ctx.day))
+
+
+def get_data_sales_month(ctx):
+    start_date, end_date = month_range(ctx)
+    return len(db.get_data("sales", start_date=start_date, end_date=end_date))
+
+
+def get_data_sales_month_typed(ctx):
+    start_date, end_date = month_range(ctx)
+    return len(db.get_data("sales", start_date=start_date, end_date=end_date,
+                           columns=reports.MONTHLY_SALES_COLUMNS, typed=True))
+
+
+def get_data_sales_all(ctx):
+    return len(db.get_data("sales"))
+
+
+def get_data_ledger_all(ctx):
+    return len(db.get_data("ledger"))
+
+
+def get_rows_production_day(ctx):
+    return len(db.get_rows("production", ctx.day))
+
+
+def get_price_snapshot(ctx):
+    return len(db.get_price_snapshot().distributors)
+
+
+def resolve_prices(ctx):
+    return len(db.resolve_prices(ctx.names))
+
+
+def get_sales_sheet(ctx):
+    return len(db.get_sales_sheet(ctx.day))
+
+
+def aggregate_sales_by_distributor(ctx):
+    return len(db.aggregate("sales", {"total_amount": "sum"}, ["distributor"], *month_range(ctx)))
+
+
+def save_sales(ctx):
+    db.save_sales(ctx.write_day, ctx.names[0], 100, 5, 95, 16, 95 * 16, 1000)
+    return 1
+
+
+def save_sales_batch(ctx):
+    rows = [dict(distributor=name, delivered=100, returned=5, net_sales=95, price=16,
+                 total_amount=95 * 16, cash_paid=1000) for name in ctx.names]
+    db.save_sales_batch(ctx.write_day, rows)
+    return len(rows)
+
+
+def save_expenses(ctx):
+    db.save_expenses(ctx.write_day, 53000, 20000, 15000, 88000)
+    return 1
+
+
+def add_ledger_entry(ctx):
+    db.add_ledger_entry(ctx.write_day, ctx.names[0], "دفعة من الحساب", credit=1000)
+    return 1
+
+
+# Page computations
+
+def ledger_balances(ctx):
+    return len(db.get_balances())
+
+
+def ledger_summary_all(ctx):
+    reports.ledger_summary()
+    return 1
+
+
+def ledger_summary_name(ctx):
+    reports.ledger_summary(ctx.names[0])
+    return 1
+
+
+def ledger_page_name(ctx):
+    return len(db.get_ledger_page(ctx.names[0])[0])
+
+
+def ledger_page_all(ctx):
+    return len(db.get_ledger_page()[0])
+
+
+def report_daily(ctx):
+    return len(reports.daily_report(ctx.day)["sales"])
+
+
+def report_monthly(ctx):
+    return len(reports.monthly_report(ctx.year, ctx.month)["sales"])
+
+
+SCENARIOS = {
+    "get_data.sales.day": get_data_sales_day,
+    "get_data.sales.month": get_data_sales_month,
+    "get_data.sales.month.typed": get_data_sales_month_typed,
+    "get_data.sales.all": get_data_sales_all,
+    "get_data.ledger.all": get_data_ledger_all,
+    "get_rows.production.day": get_rows_production_day,
+    "get_price_snapshot": get_price_snapshot,
+    "resolve_prices": resolve_prices,
+    "aggregate.sales.by_distributor": aggregate_sales_by_distributor,
+    "get_sales_sheet": get_sales_sheet,
+    "save_sales": save_sales,
+    "save_sales_batch": save_sales_batch,
+    "save_expenses": save_expenses,
+    "add_ledger_entry": add_ledger_entry,
+    "ledger.balances": ledger_balances,
+    "ledger.summary.all": ledger_summary_all,
+    "ledger.summary.name": ledger_summary_name,
+    "ledger.page.name": ledger_page_name,
+    "ledger.page.all": ledger_page_all,
+    "report.daily": report_daily,
+    "report.monthly": report_monthly,
+}
@@ -1,11 +1,448 @@
+import atexit
+import calendar
+import functools
+import glob
+import gzip
+import heapq
+import itertools
+import json
+import logging
+import os
+import queue
+import shutil
 import sqlite3
-import pandas as pd
-from datetime import datetime
+import tarfile
+import tempfile
+import threading
+import time
+import weakref
+from collections import OrderedDict, deque, namedtuple
+from concurrent.futures import Future
+from contextlib import contextmanager
+from types import MappingProxyType
+from datetime import datetime, timedelta
 
 DB_NAME = "/home/ubuntu/alwafaa_bakery/bakery.db"
 
+logger = logging.getLogger(__name__)
+
+# Connection tuning applied to every new connection.
+# WAL lets readers run alongside a writer, NORMAL sync is safe under WAL,
+# and the busy timeout makes writers wait for the lock instead of failing
+# with "database is locked".
+BUSY_TIMEOUT_MS = 5000
+PRAGMAS = (
+    "PRAGMA journal_mode = WAL",
+    "PRAGMA synchronous = NORMAL",
+    "PRAGMA cache_size = -20000",      # ~20 MB page cache
+    "PRAGMA mmap_size = 268435456",    # 256 MB memory-mapped I/O
+    "PRAGMA temp_store = MEMORY",
+    f"PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}",
+)
+
+# Each thread holds its own connections, but Streamlit runs every rerun on
+# a new thread: when a thread ends its connections go back to a small
+# per-database pool for the next thread instead of being reopened (and
+# re-running the pragmas) on every rerun.
+POOL_MAX_IDLE = 8  # idle connections kept per database
+
+_local = threading.local()
+_pool = {}  # path -> idle connections
+_pool_lock = threading.Lock()
+
+def _connect(path):
+    # isolation_level=None: we issue BEGIN/COMMIT ourselves (see transaction);
+    # check_same_thread=False: pooled connections move between threads
+    conn = sqlite3.connect(path, timeout=BUSY_TIMEOUT_MS / 1000, isolation_level=None,
+                           check_same_thread=False)
+    _connections_opened[path] = _connections_opened.get(path, 0) + 1
+    for pragma in PRAGMAS:
+        conn.execute(pragma)
+    conn.create_function("search_text", 1, search_text, deterministic=True)
+    return conn
+
+def _release(conns):
+    # Called when the thread holding conns ends
+    for path, conn in list(conns.items()):
+        try:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+        except sqlite3.Error:
+            conn.close()
+            continue
+        with _pool_lock:
+            idle = _pool.setdefault(path, [])
+            pooled = len(idle) < POOL_MAX_IDLE
+            if pooled:
+                idle.append(conn)
+        if not pooled:
+            conn.close()
+    conns.clear()
+
+class _Lease:
+    """Lives in a thread's local storage; its finalizer runs when the thread ends."""
+
+def _thread_conns():
+    conns = getattr(_local, "conns", None)
+    if conns is None:
+        conns = _local.conns = {}
+        _local.lease = _Lease()
+        weakref.finalize(_local.lease, _release, conns).atexit = False
+    return conns
+
+_last_used = 0.0  # time.monotonic() of the last get_connection(), for idle detection
+
+def get_connection():
+    """Return this thread's connection to its branch database, opening it on first use."""
+    global _last_used
+    if not getattr(_local, "background", False):
+        _last_used = time.monotonic()
+    conns = _thread_conns()
+    path = current_db()
+    conn = conns.get(path)
+    if conn is None:
+        with _pool_lock:
+            idle = _pool.get(path)
+            conn = idle.pop() if idle else None
+        if conn is None:
+            conn = _connect(path)
+        conns[path] = conn
+        if path not in _schema_ready:
+            _ensure_schema(conn, path)
+    return conn
+
+def idle_seconds():
+    """Seconds since any thread last used the database (background work aside)."""
+    return time.monotonic() - _last_used
+
+@contextmanager
+def background():
+    """Database use by this thread inside the block doesn't count as activity."""
+    previous = getattr(_local, "background", False)
+    _local.background = True
+    try:
+        yield
+    finally:
+        _local.background = previous
+
+def close_connection():
+    """Close this thread's connections and the idle pooled ones."""
+    conns = getattr(_local, "conns", {})
+    with _pool_lock:
+        idle = [conn for pooled in _pool.values() for conn in pooled]
+        _pool.clear()
+    for conn in list(conns.values()) + idle:
+        conn.close()
+    conns.clear()
+
+# Branches
+# Each branch has its own database file. The main branch is DB_NAME, the
+# others are listed in branches.json next to it ({name: file name}). The
+# branch is chosen per thread, so concurrent sessions and report workers
+# can each work on a different branch.
+MAIN_BRANCH = "الفرع الرئيسي"
+BRANCHES_FILE = "branches.json"
+
+def _branches_path():
+    return os.path.join(os.path.dirname(DB_NAME), BRANCHES_FILE)
+
+def list_branches():
+    """Branch names mapped to their database files, main branch first."""
+    branches = {MAIN_BRANCH: DB_NAME}
+    if os.path.exists(_branches_path()):
+        with open(_branches_path(), encoding="utf-8") as f:
+            for name, file_name in json.load(f).items():
+                branches[name] = os.path.join(os.path.dirname(DB_NAME), file_name)
+    return branches
+
+def add_branch(name):
+    """Register a new branch and return the path of its database file."""
+    name = name.strip()
+    branches = list_branches()
+    if not name or name in branches:
+        raise ValueError(f"invalid or duplicate branch name: {name!r}")
+    registry = {n: os.path.basename(p) for n, p in branches.items() if n != MAIN_BRANCH}
+    number = len(branches)
+    while f"branch_{number}.db" in registry.values() or os.path.exists(
+            os.path.join(os.path.dirname(DB_NAME), f"branch_{number}.db")):
+        number += 1
+    registry[name] = f"branch_{number}.db"
+    # Write then rename, so a crash never leaves a truncated registry
+    tmp = _branches_path() + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(registry, f, ensure_ascii=False, indent=2)
+    os.replace(tmp, _branches_path())
+    return os.path.join(os.path.dirname(DB_NAME), registry[name])
+
+def current_db():
+    """The database file this thread works on: its branch's, or DB_NAME."""
+    return getattr(_local, "db_path", None) or DB_NAME
+
+def set_branch(name):
+    """Point this thread's helpers at a branch database."""
+    if name == MAIN_BRANCH:
+        _local.db_path = None  # follow DB_NAME
+        return
+    branches = list_branches()
+    if name not in branches:
+        raise ValueError(f"unknown branch: {name!r}")
+    _local.db_path = branches[name]
+
+@contextmanager
+def use_branch(name):
+    previous = getattr(_local, "db_path", None)
+    set_branch(name)
+    try:
+        yield
+    finally:
+        _local.db_path = previous
+
+@contextmanager
+def transaction():
+    """Group writes into a single commit.
+
+    Nested calls (e.g. a save_* helper used inside a batch) join the
+    outer transaction instead of committing on their own.
+    """
+    conn = get_connection()
+    if conn.in_transaction:
+        yield conn
+        return
+    # BEGIN IMMEDIATE takes the write lock up front, so the busy timeout
+    # applies instead of failing later when a read lock is upgraded.
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        yield conn
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    conn.execute("COMMIT")
+
+# Instrumentation
+# Off by default; when off, an instrumented helper costs one flag check.
+# When on, each call's duration and row count are recorded per helper (and
+# per page via record_page), passed to registered hooks, and calls slower
+# than SLOW_QUERY_MS are logged as warnings.
+INSTRUMENTATION_ENABLED = os.environ.get("BAKERY_INSTRUMENTATION") == "1"
+SLOW_QUERY_MS = 250
+TIMINGS_KEPT = 1000  # recent durations kept per name, for percentiles
+
+_stats = {}  # name -> {"calls", "total", "rows", "recent"}
+_stats_lock = threading.Lock()
+_hooks = []
+_connections_opened = {}  # path -> count
+
+def set_instrumentation(enabled):
+    global INSTRUMENTATION_ENABLED
+    INSTRUMENTATION_ENABLED = bool(enabled)
+
+def add_hook(hook):
+    """Call hook(name, seconds, rows) after every instrumented call."""
+    _hooks.append(hook)
+
+def remove_hook(hook):
+    _hooks.remove(hook)
+
+def _row_count(result):
+    if isinstance(result, tuple) and result and hasattr(result[0], "__len__"):
+        result = result[0]  # (page, cursor)
+    if result is None or isinstance(result, (str, bytes, dict)) or not hasattr(result, "__len__"):
+        return 0
+    return len(result)
+
+def _record(name, seconds, rows):
+    with _stats_lock:
+        entry = _stats.get(name)
+        if entry is None:
+            entry = _stats[name] = {"calls": 0, "total": 0.0, "rows": 0, "recent": deque(maxlen=TIMINGS_KEPT)}
+        entry["calls"] += 1
+        entry["total"] += seconds
+        entry["rows"] += rows
+        entry["recent"].append(seconds)
+    if seconds * 1000 >= SLOW_QUERY_MS:
+        logger.warning("slow call %s: %.1f ms, %d rows", name, seconds * 1000, rows)
+    for hook in _hooks:
+        hook(name, seconds, rows)
+
+def instrumented(func):
+    name = func.__name__
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if not INSTRUMENTATION_ENABLED:
+            return func(*args, **kwargs)
+        start = time.perf_counter()
+        result = func(*args, **kwargs)
+        _record(name, time.perf_counter() - start, _row_count(result))
+        return result
+    return wrapper
+
+def record_page(page, seconds):
+    """Record the render time of an app page."""
+    if INSTRUMENTATION_ENABLED:
+        _record(f"page:{page}", seconds, 0)
+
+def _percentile(sorted_values, pct):
+    return sorted_values[max(0, int(round(pct / 100 * len(sorted_values))) - 1)]
+
+def get_stats():
+    """Recorded calls, hottest (most total time) first, as a list of dicts."""
+    with _stats_lock:
+        items = [(name, dict(entry, recent=sorted(entry["recent"]))) for name, entry in _stats.items()]
+    stats = []
+    for name, entry in items:
+        stats.append({
+            "name": name,
+            "calls": entry["calls"],
+            "total_ms": entry["total"] * 1000,
+            "p50_ms": _percentile(entry["recent"], 50) * 1000,
+            "p95_ms": _percentile(entry["recent"], 95) * 1000,
+            "rows": entry["rows"],
+        })
+    return sorted(stats, key=lambda s: s["total_ms"], reverse=True)
+
+def get_connection_counts():
+    return dict(_connections_opened)
+
+def reset_stats():
+    with _stats_lock:
+        _stats.clear()
+
+# Write queue
+# Sessions can hand their writes to one writer thread per database instead
+# of each taking the write lock: submit() queues a call to a write helper
+# and returns a Future. The writer runs everything queued (up to
+# WRITER_BATCH_SIZE calls) in one transaction, each call in a savepoint so
+# a failing call only undoes itself, and resolves the futures once the
+# batch is committed. Under load, calls that queue up during one commit
+# go out together in the next.
+WRITER_BATCH_SIZE = 100
+
+_writers = {}  # path -> (queue, thread)
+_writers_lock = threading.Lock()
+
+def submit(func, *args, **kwargs):
+    """Run func(*args, **kwargs) on the writer thread of this thread's database.
+
+    Returns a Future; .result() waits for the commit and raises any error.
+    """
+    future = Future()
+    path = current_db()
+    if getattr(_local, "writer_path", None) == path:
+        # Already on the writer (a queued call submitting more): run inline
+        try:
+            future.set_result(func(*args, **kwargs))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+    with _writers_lock:
+        writer = _writers.get(path)
+        if writer is None:
+            jobs = queue.Queue()
+            thread = threading.Thread(target=_run_writer, args=(path, jobs), daemon=True,
+                                      name=f"writer-{os.path.basename(path)}")
+            thread.start()
+            writer = _writers[path] = (jobs, thread)
+    writer[0].put((func, args, kwargs, future))
+    return future
+
+def _run_writer(path, jobs):
+    _local.db_path = _local.writer_path = path
+    while True:
+        batch = [jobs.get()]
+        while len(batch) < WRITER_BATCH_SIZE:
+            try:
+                batch.append(jobs.get_nowait())
+            except queue.Empty:
+                break
+        stop = None in batch  # queued by stop_writers, after the last job
+        batch = [job for job in batch if job is not None]
+        try:
+            _write_batch(batch)
+        except Exception as e:
+            # Keep the writer alive for later submits
+            logger.exception("writer batch failed")
+            _fail_pending(batch, e)
+        if stop:
+            close_connection()
+            return
+
+def _fail_pending(batch, error):
+    for _, _, _, future in batch:
+        if not future.done():
+            future.set_exception(error)
+
+def _write_batch(batch):
+    if not batch:
+        return
+    start = time.perf_counter()
+    outcomes = []
+    try:
+        with transaction() as conn:
+            for func, args, kwargs, future in batch:
+                if not future.set_running_or_notify_cancel():
+                    continue
+                conn.execute("SAVEPOINT queued_write")
+                try:
+                    outcomes.append((future, func(*args, **kwargs), None))
+                except Exception as e:
+                    conn.execute("ROLLBACK TO queued_write")
+                    outcomes.append((future, None, e))
+                conn.execute("RELEASE queued_write")
+    except Exception as e:
+        # BEGIN or the commit failed, so nothing in the batch was written
+        _fail_pending(batch, e)
+        return
+    for future, result, error in outcomes:
+        if error is None:
+            future.set_result(result)
+        else:
+            future.set_exception(error)
+    if INSTRUMENTATION_ENABLED:
+        _record("writer_batch", time.perf_counter() - start, len(batch))
+
+def stop_writers():
+    """Finish the queued writes and stop the writer threads."""
+    with _writers_lock:
+        writers = list(_writers.values())
+        _writers.clear()
+    for jobs, _ in writers:
+        jobs.put(None)
+    for _, thread in writers:
+        thread.join()
+
+atexit.register(stop_writers)
+
+# The schema is checked once per process and database file, when the first
+# connection to it is opened. An up-to-date file costs one PRAGMA read.
+_schema_ready = set()
+_schema_lock = threading.Lock()
+
+def _ensure_schema(conn, path):
+    with _schema_lock:
+        if path in _schema_ready:
+            return
+        if schema_version(conn) < len(MIGRATIONS):
+            _init_schema(conn)
+        _schema_ready.add(path)
+
+def _init_schema(conn):
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        # Re-check under the write lock: another process may have migrated
+        if schema_version(conn) < len(MIGRATIONS):
+            _create_schema(conn)
+            _migrate(conn)
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    conn.execute("COMMIT")
+
 def init_db():
-    conn = sqlite3.connect(DB_NAME)
+    """Create or upgrade the schema of the current database if it is not current."""
+    _init_schema(get_connection())
+
+def _create_schema(conn):
     c = conn.cursor()
     
     # Production table
@@ -78,114 +515,1417 @@ def init_db():
     dists = ["هيثم", "وجيه", "المفرش", "علي", "درهم"]
     for d in dists:
         c.execute("INSERT OR IGNORE INTO distributor_prices (distributor, price) VALUES (?, 16)", (d,))
-    
-    conn.commit()
-    conn.close()
 
+# Schema migrations
+# Each migration runs once, in order; PRAGMA user_version holds the number
+# of the last one applied. Append new migrations, never edit applied ones.
+
+def _migration_1(conn):
+    # Older databases may hold duplicates from the old SELECT-then-INSERT
+    # saves; keep one row per key so the unique indexes can be built.
+    # Production and expenses duplicates were updated together (WHERE date = ?),
+    # so any of them will do. Sales and other sales updates (and the pages)
+    # only ever touched the lowest id, so that row is the one users corrected.
+    conn.execute("DELETE FROM production WHERE id NOT IN (SELECT MAX(id) FROM production GROUP BY date)")
+    conn.execute("DELETE FROM sales WHERE id NOT IN (SELECT MIN(id) FROM sales GROUP BY date, distributor)")
+    conn.execute("DELETE FROM other_sales WHERE id NOT IN (SELECT MIN(id) FROM other_sales GROUP BY date, item_name)")
+    conn.execute("DELETE FROM expenses WHERE id NOT IN (SELECT MAX(id) FROM expenses GROUP BY date)")
+
+    conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS ux_production_date ON production (date)")
+    conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS ux_sales_date_distributor ON sales (date, distributor)")
+    conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS ux_other_sales_date_item ON other_sales (date, item_name)")
+    conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS ux_expenses_date ON expenses (date)")
+    conn.execute("CREATE INDEX IF NOT EXISTS ix_sales_distributor_date ON sales (distributor, date)")
+    conn.execute("CREATE INDEX IF NOT EXISTS ix_ledger_date ON ledger (date)")
+    conn.execute("CREATE INDEX IF NOT EXISTS ix_ledger_name_date ON ledger (name, date)")
+
+# Tables created by _create_schema whose reads go through the cache; each
+# has a row in table_versions. Later migrations version their own tables.
+VERSIONED_TABLES = ("production", "sales", "other_sales", "expenses", "ledger",
+                    "settings", "distributor_prices")
+
+def _migration_2(conn):
+    # Per-table change counters bumped by triggers, so any write (from this
+    # process or another) invalidates cached reads of that table.
+    conn.execute('''CREATE TABLE IF NOT EXISTS table_versions (
+                        name TEXT PRIMARY KEY,
+                        version INTEGER NOT NULL DEFAULT 0
+                    )''')
+    for table in VERSIONED_TABLES:
+        _add_version_triggers(conn, table)
+
+def _add_version_triggers(conn, table):
+    conn.execute("INSERT OR IGNORE INTO table_versions (name) VALUES (?)", (table,))
+    for event in ("INSERT", "UPDATE", "DELETE"):
+        conn.execute(f'''CREATE TRIGGER IF NOT EXISTS trg_{table}_{event.lower()}_version
+                         AFTER {event} ON {table}
+                         BEGIN
+                             UPDATE table_versions SET version = version + 1 WHERE name = '{table}';
+                         END''')
+
+# Account balances
+# balances holds the running debit/credit per name. Daily sales count as
+# debit (total_amount) and credit (cash_paid) for the distributor, manual
+# ledger entries as entered. Triggers apply each row change as a delta in
+# the same transaction, so every write path keeps it current.
+BALANCE_SOURCES = (
+    # table, name column, debit column, credit column
+    ("sales", "distributor", "total_amount", "cash_paid"),
+    ("ledger", "name", "debit", "credit"),
+)
+
+SQL_BALANCES_FROM_HISTORY = """
+    SELECT name, SUM(debit) AS debit, SUM(credit) AS credit, MAX(date) AS last_date
+    FROM (SELECT distributor AS name, COALESCE(total_amount, 0) AS debit,
+                 COALESCE(cash_paid, 0) AS credit, date FROM sales
+          UNION ALL
+          SELECT name, COALESCE(debit, 0), COALESCE(credit, 0), date FROM ledger)
+    WHERE name IS NOT NULL
+    GROUP BY name"""
+
+def _balance_triggers(table, name_col, debit_col, credit_col):
+    add = f'''INSERT INTO balances (name, debit, credit, last_date)
+              SELECT NEW.{name_col}, COALESCE(NEW.{debit_col}, 0), COALESCE(NEW.{credit_col}, 0), NEW.date
+              WHERE NEW.{name_col} IS NOT NULL
+              ON CONFLICT (name) DO UPDATE SET
+                  debit = debit + excluded.debit,
+                  credit = credit + excluded.credit,
+                  last_date = MAX(COALESCE(last_date, ''), COALESCE(excluded.last_date, ''));'''
+    # last_date can move backwards when a row is removed, so recompute it
+    # from the (indexed) history of that name only.
+    remove = f'''UPDATE balances SET
+                     debit = debit - COALESCE(OLD.{debit_col}, 0),
+                     credit = credit - COALESCE(OLD.{credit_col}, 0),
+                     last_date = (SELECT MAX(date) FROM (
+                         SELECT date FROM sales WHERE distributor = OLD.{name_col}
+                         UNION ALL SELECT date FROM ledger WHERE name = OLD.{name_col}))
+                 WHERE name = OLD.{name_col};'''
+    return {
+        "insert": add,
+        "update": remove + "\n" + add,
+        "delete": remove,
+    }
+
+def _migration_3(conn):
+    conn.execute('''CREATE TABLE IF NOT EXISTS balances (
+                        name TEXT PRIMARY KEY,
+                        debit REAL NOT NULL DEFAULT 0,
+                        credit REAL NOT NULL DEFAULT 0,
+                        last_date TEXT
+                    )''')
+    for source in BALANCE_SOURCES:
+        table = source[0]
+        for event, body in _balance_triggers(*source).items():
+            conn.execute(f'''CREATE TRIGGER IF NOT EXISTS trg_{table}_{event}_balance
+                             AFTER {event.upper()} ON {table}
+                             BEGIN
+                                 {body}
+                             END''')
+    _add_version_triggers(conn, "balances")
+    _rebuild_balances(conn)
+
+# Daily rollup
+# daily_summary keeps one pre-aggregated row per date for the reports.
+# Any change to production, sales, other_sales or expenses adds or takes
+# away that row's share of its date, like the balances triggers; a change
+# of price_distributor re-prices the production deficit of every day.
+DAILY_SUMMARY_SOURCES = ("production", "sales", "other_sales", "expenses")
+
+def _sql_refresh_daily_summary(dates_sql):
+    # dates_sql is a query yielding a `date` column: the days to refresh
+    return f'''
+        INSERT INTO daily_summary (date, expected_production, net_sales, distributor_revenue,
+                                   other_revenue, expenses, deficit, loss_value, profit)
+        SELECT date, expected, net, rev_dist, rev_other, exp,
+               expected - net, (expected - net) * price,
+               rev_dist + rev_other - exp - (expected - net) * price
+        FROM (SELECT d.date,
+                     (SELECT COALESCE(SUM(expected_production), 0) FROM production p WHERE p.date = d.date) AS expected,
+                     (SELECT COALESCE(SUM(net_sales), 0) FROM sales s WHERE s.date = d.date) AS net,
+                     (SELECT COALESCE(SUM(total_amount), 0) FROM sales s WHERE s.date = d.date) AS rev_dist,
+                     (SELECT COALESCE(SUM(amount), 0) FROM other_sales o WHERE o.date = d.date) AS rev_other,
+                     (SELECT COALESCE(SUM(total_expenses), 0) FROM expenses e WHERE e.date = d.date) AS exp,
+                     COALESCE((SELECT value FROM settings WHERE key = 'price_distributor'), 16) AS price
+              FROM ({dates_sql}) d
+              WHERE d.date IS NOT NULL)
+        WHERE true
+        ON CONFLICT (date) DO UPDATE SET
+            expected_production = excluded.expected_production,
+            net_sales = excluded.net_sales,
+            distributor_revenue = excluded.distributor_revenue,
+            other_revenue = excluded.other_revenue,
+            expenses = excluded.expenses,
+            deficit = excluded.deficit,
+            loss_value = excluded.loss_value,
+            profit = excluded.profit'''
+
+# What each source row adds to its day's rollup: {rollup column: source column}
+DAILY_SUMMARY_DELTAS = {
+    "production": {"expected_production": "expected_production"},
+    "sales": {"net_sales": "net_sales", "distributor_revenue": "total_amount"},
+    "other_sales": {"other_revenue": "amount"},
+    "expenses": {"expenses": "total_expenses"},
+}
+
+def _sql_daily_summary_delta(table, row, sign):
+    # Adds (sign "+") or takes away (sign "-") one row's share of its day
+    delta = {column: "0" for column in ("expected_production", "net_sales", "distributor_revenue",
+                                        "other_revenue", "expenses")}
+    delta.update({column: f"{sign}COALESCE({row}.{source}, 0)" for column, source in DAILY_SUMMARY_DELTAS[table].items()})
+    return f'''
+        INSERT INTO daily_summary (date, expected_production, net_sales, distributor_revenue,
+                                   other_revenue, expenses, deficit, loss_value, profit)
+        SELECT date, expected, net, rev_dist, rev_other, exp,
+               expected - net, (expected - net) * price,
+               rev_dist + rev_other - exp - (expected - net) * price
+        FROM (SELECT {row}.date AS date, {delta["expected_production"]} AS expected, {delta["net_sales"]} AS net,
+                     {delta["distributor_revenue"]} AS rev_dist, {delta["other_revenue"]} AS rev_other,
+                     {delta["expenses"]} AS exp,
+                     COALESCE((SELECT value FROM settings WHERE key = 'price_distributor'), 16) AS price)
+        WHERE date IS NOT NULL
+        ON CONFLICT (date) DO UPDATE SET
+            expected_production = expected_production + excluded.expected_production,
+            net_sales = net_sales + excluded.net_sales,
+            distributor_revenue = distributor_revenue + excluded.distributor_revenue,
+            other_revenue = other_revenue + excluded.other_revenue,
+            expenses = expenses + excluded.expenses,
+            deficit = deficit + excluded.deficit,
+            loss_value = loss_value + excluded.loss_value,
+            profit = profit + excluded.profit'''
+
+def _daily_summary_triggers(table):
+    add, remove = _sql_daily_summary_delta(table, "NEW", "+"), _sql_daily_summary_delta(table, "OLD", "-")
+    return {"insert": f"{add};", "update": f"{remove};\n{add};", "delete": f"{remove};"}
+
+SQL_REPRICE_DAILY_SUMMARY = '''
+    UPDATE daily_summary SET
+        loss_value = deficit * NEW.value,
+        profit = distributor_revenue + other_revenue - expenses - deficit * NEW.value'''
+
+def _migration_4(conn):
+    conn.execute('''CREATE TABLE IF NOT EXISTS daily_summary (
+                        date TEXT PRIMARY KEY,
+                        expected_production INTEGER NOT NULL DEFAULT 0,
+                        net_sales INTEGER NOT NULL DEFAULT 0,
+                        distributor_revenue REAL NOT NULL DEFAULT 0,
+                        other_revenue REAL NOT NULL DEFAULT 0,
+                        expenses REAL NOT NULL DEFAULT 0,
+                        deficit INTEGER NOT NULL DEFAULT 0,
+                        loss_value REAL NOT NULL DEFAULT 0,
+                        profit REAL NOT NULL DEFAULT 0
+                    )''')
+    for table in DAILY_SUMMARY_SOURCES:
+        for event, body in _daily_summary_triggers(table).items():
+            conn.execute(f'''CREATE TRIGGER IF NOT EXISTS trg_{table}_{event}_daily_summary
+                             AFTER {event.upper()} ON {table}
+                             BEGIN
+                                 {body}
+                             END''')
+    for event in ("insert", "update"):
+        conn.execute(f'''CREATE TRIGGER IF NOT EXISTS trg_settings_{event}_daily_summary
+                         AFTER {event.upper()} ON settings
+                         WHEN NEW.key = 'price_distributor'
+                         BEGIN
+                             {SQL_REPRICE_DAILY_SUMMARY};
+                         END''')
+    _add_version_triggers(conn, "daily_summary")
+    _backfill_daily_summary(conn)
+
+# Account statement
+# ledger_entries presents daily sales (as debit/credit of the distributor)
+# and manual ledger entries as one list. Sales and ledger ids overlap, so
+# rows are ordered and paged by (date, source, id).
+SALES_DESCRIPTION = "مبيعات يومية"
+
+def _migration_5(conn):
+    conn.execute(f'''CREATE VIEW IF NOT EXISTS ledger_entries AS
+                     SELECT 'sales' AS source, id, date, distributor AS name,
+                            '{SALES_DESCRIPTION}' AS description,
+                            total_amount AS debit, cash_paid AS credit
+                     FROM sales
+                     UNION ALL
+                     SELECT 'ledger', id, date, name, description, debit, credit
+                     FROM ledger''')
+
+# Archive
+# Closed months of ARCHIVED_TABLES can be moved out of SQLite into
+# columnar partitions (see archive.py). archived_months lists them; every
+# month up to the last one listed is read-only, including its production.
+# Rows leave for the archive without touching balances or daily_summary:
+# the delete triggers skip archived months, and archived_balances keeps
+# the archived totals so balances can still be rebuilt from history.
+ARCHIVED_TABLES = ("sales", "other_sales", "expenses", "ledger")
+SQL_ARCHIVED_THROUGH = "COALESCE((SELECT MAX(month) FROM archived_months), '')"
+
+def _migration_6(conn):
+    conn.execute('''CREATE TABLE IF NOT EXISTS archived_months (
+                        month TEXT PRIMARY KEY,
+                        rows INTEGER NOT NULL DEFAULT 0,
+                        archived_at TEXT
+                    )''')
+    conn.execute('''CREATE TABLE IF NOT EXISTS archived_balances (
+                        name TEXT PRIMARY KEY,
+                        debit REAL NOT NULL DEFAULT 0,
+                        credit REAL NOT NULL DEFAULT 0,
+                        last_date TEXT
+                    )''')
+    _add_version_triggers(conn, "archived_months")
+    read_only = {table: ("INSERT", "UPDATE") for table in ARCHIVED_TABLES}
+    read_only["production"] = ("INSERT", "UPDATE", "DELETE")
+    for table, events in read_only.items():
+        for event in events:
+            row = "OLD" if event == "DELETE" else "NEW"
+            conn.execute(f'''CREATE TRIGGER IF NOT EXISTS trg_{table}_{event.lower()}_archived
+                             BEFORE {event} ON {table}
+                             WHEN substr({row}.date, 1, 7) <= {SQL_ARCHIVED_THROUGH}
+                             BEGIN
+                                 SELECT RAISE(ABORT, 'month is archived');
+                             END''')
+    live_row = f"WHEN substr(OLD.date, 1, 7) > {SQL_ARCHIVED_THROUGH}"
+    for source in BALANCE_SOURCES:
+        table = source[0]
+        conn.execute(f"DROP TRIGGER IF EXISTS trg_{table}_delete_balance")
+        conn.execute(f'''CREATE TRIGGER trg_{table}_delete_balance
+                         AFTER DELETE ON {table} {live_row}
+                         BEGIN
+                             {_balance_triggers(*source)["delete"]}
+                         END''')
+    for table in DAILY_SUMMARY_SOURCES:
+        conn.execute(f"DROP TRIGGER IF EXISTS trg_{table}_delete_daily_summary")
+        conn.execute(f'''CREATE TRIGGER trg_{table}_delete_daily_summary
+                         AFTER DELETE ON {table} {live_row}
+                         BEGIN
+                             {_daily_summary_triggers(table)["delete"]}
+                         END''')
+
+# Distributors
+# The registry behind the sales grid, the ledger form and the price list.
+# Inactive distributors keep their history but are no longer offered.
+def _migration_7(conn):
+    conn.execute('''CREATE TABLE IF NOT EXISTS distributors (
+                        name TEXT PRIMARY KEY,
+                        active INTEGER NOT NULL DEFAULT 1,
+                        position INTEGER NOT NULL DEFAULT 0
+                    )''')
+    # Start from the priced distributors, in the order they were added,
+    # followed by the cash customer, as on the old sales page.
+    conn.execute("""INSERT OR IGNORE INTO distributors (name, position)
+                    SELECT distributor, rowid FROM distributor_prices ORDER BY rowid""")
+    conn.execute("""INSERT OR IGNORE INTO distributors (name, position)
+                    SELECT ?, COALESCE(MAX(position), 0) + 1 FROM distributors""", (CASH_CUSTOMER,))
+    # Anyone else with sales history is kept, but no longer offered
+    conn.execute("""INSERT OR IGNORE INTO distributors (name, active, position)
+                    SELECT distributor, 0, (SELECT MAX(position) FROM distributors) + ROW_NUMBER() OVER (ORDER BY MIN(id))
+                    FROM sales WHERE distributor IS NOT NULL GROUP BY distributor""")
+    _add_version_triggers(conn, "distributors")
+
+def _migration_8(conn):
+    # What the maintenance scheduler ran (see maintenance.py)
+    conn.execute('''CREATE TABLE IF NOT EXISTS maintenance_log (
+                        id INTEGER PRIMARY KEY AUTOINCREMENT,
+                        task TEXT NOT NULL,
+                        started_at TEXT NOT NULL,
+                        seconds REAL NOT NULL,
+                        status TEXT NOT NULL,
+                        detail TEXT
+                    )''')
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_maintenance_log_task ON maintenance_log (task, started_at)")
+
+# Ledger search
+# ledger_search is an FTS5 index of ledger names and descriptions. Text is
+# folded before it is indexed (and queries the same way), so hamza forms,
+# alef maqsura, taa marbuta, tatweel, harakat and Arabic digits don't get
+# in the way. The entry itself is stored next to the index, so entries of
+# archived months stay searchable after their rows leave the ledger table.
+# Plain SQL triggers note changed ledger ids in ledger_search_pending and
+# the index catches up before a search, so any SQLite client can still
+# write to ledger (the folding is Python).
+ARABIC_FOLDING = {
+    "أ": "ا", "إ": "ا", "آ": "ا", "ٱ": "ا", "ى": "ي", "ئ": "ي", "ؤ": "و", "ة": "ه", "ـ": "",
+    **{chr(c): "" for c in range(0x064B, 0x0653)},  # harakat
+    "\u0670": "",  # superscript alef
+    **{chr(0x0660 + d): str(d) for d in range(10)},
+}
+_FOLD_TABLE = str.maketrans(ARABIC_FOLDING)
+SEARCH_PAGE_SIZE = 50
+SEARCH_RANKED_MAX = 2000  # broader searches are listed newest first, ranking them is slow
+
+ARTICLES = ("وال", "بال", "فال", "كال", "لل", "ال")
+PREFIXES = ("و", "ف", "ب", "ل")
+
+def fold_arabic(text):
+    return (text or "").translate(_FOLD_TABLE)
+
+def search_text(text):
+    """Folded text plus its words without a leading article or preposition.
+
+    "لإصلاح السيارة" is indexed as "لاصلاح السياره اصلاح سياره", so a
+    search for "اصلاح" or "سيارة" finds it. Also registered as an SQL
+    function on every connection made here (see _connect).
+    """
+    words = fold_arabic(text).split()
+    stems = []
+    for word in words:
+        for prefix in ARTICLES + PREFIXES:
+            # Keep at least three letters, so short words aren't cut up
+            if word.startswith(prefix) and len(word) - len(prefix) >= 3:
+                stems.append(word[len(prefix):])
+                break
+    return " ".join(words + stems)
+
+def _rebuild_search_index(conn):
+    conn.execute("DELETE FROM ledger_search")
+    conn.execute("""INSERT INTO ledger_search (rowid, name, description, date, shown_name, shown_description, debit, credit)
+                    SELECT id, search_text(name), search_text(description), date, name, description, debit, credit
+                    FROM ledger""")
+    archived = _read_archive(conn, "ledger")
+    if archived is not None:
+        conn.executemany("""INSERT INTO ledger_search (rowid, name, description, date, shown_name, shown_description,
+                                                       debit, credit) VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
+                         [(int(i), search_text(n), search_text(d), date, n, d, debit, credit)
+                          for i, date, n, d, debit, credit in archived[list(TABLE_COLUMNS["ledger"])]
+                          .itertuples(index=False, name=None)])
+    conn.execute("DELETE FROM ledger_search_pending")
+
+def _sync_search_index(conn):
+    # Re-index the ledger rows changed since the last sync; entries of
+    # archived months stay as they are (their rows are gone from ledger)
+    conn.execute(f"""DELETE FROM ledger_search WHERE rowid IN (SELECT id FROM ledger_search_pending)
+                     AND substr(date, 1, 7) > {SQL_ARCHIVED_THROUGH}""")
+    rows = conn.execute("""SELECT l.id, l.date, l.name, l.description, l.debit, l.credit
+                           FROM ledger l JOIN ledger_search_pending p ON p.id = l.id""").fetchall()
+    conn.executemany("""INSERT INTO ledger_search (rowid, name, description, date, shown_name, shown_description,
+                                                   debit, credit) VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
+                     [(i, search_text(n), search_text(d), date, n, d, debit, credit)
+                      for i, date, n, d, debit, credit in rows])
+    conn.execute("DELETE FROM ledger_search_pending")
+
+def _migration_9(conn):
+    # prefix: indexes for 2 and 3 letter prefixes, for search-as-you-type
+    conn.execute("""CREATE VIRTUAL TABLE IF NOT EXISTS ledger_search USING fts5(
+                        name, description,
+                        date UNINDEXED, shown_name UNINDEXED, shown_description UNINDEXED,
+                        debit UNINDEXED, credit UNINDEXED,
+                        tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')""")
+    # The triggers only note the changed ids, so other clients (the sqlite3
+    # shell, DB Browser) without search_text() can still write the ledger;
+    # the index catches up in _sync_search_index.
+    conn.execute("CREATE TABLE IF NOT EXISTS ledger_search_pending (id INTEGER PRIMARY KEY)")
+    conn.execute("""CREATE TRIGGER IF NOT EXISTS trg_ledger_insert_search AFTER INSERT ON ledger
+                    BEGIN
+                        INSERT OR IGNORE INTO ledger_search_pending (id) VALUES (NEW.id);
+                    END""")
+    conn.execute("""CREATE TRIGGER IF NOT EXISTS trg_ledger_update_search AFTER UPDATE ON ledger
+                    BEGIN
+                        INSERT OR IGNORE INTO ledger_search_pending (id) VALUES (OLD.id);
+                        INSERT OR IGNORE INTO ledger_search_pending (id) VALUES (NEW.id);
+                    END""")
+    # Archiving deletes rows of archived months; their entries stay indexed
+    conn.execute(f"""CREATE TRIGGER IF NOT EXISTS trg_ledger_delete_search AFTER DELETE ON ledger
+                     WHEN substr(OLD.date, 1, 7) > {SQL_ARCHIVED_THROUGH}
+                     BEGIN
+                         INSERT OR IGNORE INTO ledger_search_pending (id) VALUES (OLD.id);
+                     END""")
+    _rebuild_search_index(conn)
+
+# Day keys
+# Every dated table gets `day`, the date as an integer YYYYMMDD, as a
+# virtual generated column with its own index: SQLite computes it from
+# `date`, so no write path has to fill it in. Range queries compare these
+# small integer keys instead of text.
+DATED_TABLES = ("production", "sales", "other_sales", "expenses", "ledger", "daily_summary")
+SQL_DAY_KEY = "CAST(replace(date, '-', '') AS INTEGER)"
+
+def _migration_10(conn):
+    for table in DATED_TABLES:
+        conn.execute(f"ALTER TABLE {table} ADD COLUMN day INTEGER GENERATED ALWAYS AS ({SQL_DAY_KEY}) VIRTUAL")
+        conn.execute(f"CREATE INDEX IF NOT EXISTS ix_{table}_day ON {table} (day)")
+
+def _migration_11(conn):
+    # Newest-first statement pages of all accounts walk sales by (date, id)
+    conn.execute("CREATE INDEX IF NOT EXISTS ix_sales_date ON sales (date)")
+
+MIGRATIONS = [
+    _migration_1,
+    _migration_2,
+    _migration_3,
+    _migration_4,
+    _migration_5,
+    _migration_6,
+    _migration_7,
+    _migration_8,
+    _migration_9,
+    _migration_10,
+    _migration_11,
+]
+
+def schema_version(conn=None):
+    conn = conn or get_connection()
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+def _migrate(conn):
+    current = schema_version(conn)
+    for version, migration in enumerate(MIGRATIONS, start=1):
+        if version > current:
+            migration(conn)
+            conn.execute(f"PRAGMA user_version = {version}")
+
+# Read cache
+# Shared by every session in the process. Entries remember the versions of
+# the tables they were read from and are dropped once those move on;
+# eviction is LRU, bounded by entry count and by DataFrame memory.
+CACHE_MAX_ENTRIES = 256
+CACHE_MAX_BYTES = 64 * 1024 * 1024
+
+_cache = OrderedDict()  # key -> (versions, value, nbytes)
+_cache_lock = threading.Lock()
+_cache_bytes = 0
+
+def _table_versions(conn, tables):
+    rows = dict(conn.execute("SELECT name, version FROM table_versions"))
+    return tuple(rows.get(t) for t in tables)
+
+def _cached(key, tables, load):
+    global _cache_bytes
+    conn = get_connection()
+    if conn.in_transaction:
+        # Uncommitted writes bump versions a rollback would hand out again
+        return load(conn)
+    key = (current_db(),) + key
+    # Read the versions before the data: a write committed in between can
+    # only make the entry look stale, never hide a change.
+    versions = _table_versions(conn, tables)
+    with _cache_lock:
+        hit = _cache.get(key)
+        if hit is not None and hit[0] == versions:
+            _cache.move_to_end(key)
+            return hit[1]
+    value = load(conn)
+    # DataFrames are weighed by their memory use, everything else is small
+    nbytes = int(value.memory_usage(deep=True).sum()) if hasattr(value, "memory_usage") else 0
+    with _cache_lock:
+        old = _cache.pop(key, None)
+        if old is not None:
+            _cache_bytes -= old[2]
+        if nbytes <= CACHE_MAX_BYTES:
+            _cache[key] = (versions, value, nbytes)
+            _cache_bytes += nbytes
+        while _cache and (len(_cache) > CACHE_MAX_ENTRIES or _cache_bytes > CACHE_MAX_BYTES):
+            _, (_, _, evicted) = _cache.popitem(last=False)
+            _cache_bytes -= evicted
+    return value
+
+def clear_cache():
+    global _cache_bytes
+    with _cache_lock:
+        _cache.clear()
+        _cache_bytes = 0
+
+def _read_frame(conn, query, params=()):
+    # pandas is only imported by the helpers that return DataFrames
+    import pandas as pd
+    return pd.read_sql_query(query, conn, params=params)
+
+def _read_rows(conn, query, params=()):
+    cursor = conn.execute(query, params)
+    columns = tuple(d[0] for d in cursor.description)
+    return columns, tuple(cursor.fetchall())
+
+# Single-statement upserts, backed by the unique indexes from migration 1
+SQL_UPSERT_PRODUCTION = """
+    INSERT INTO production (date, flour_bags, expected_production) VALUES (?, ?, ?)
+    ON CONFLICT (date) DO UPDATE SET
+        flour_bags = excluded.flour_bags,
+        expected_production = excluded.expected_production"""
+
+SQL_UPSERT_SALES = """
+    INSERT INTO sales (date, distributor, delivered, returned, net_sales, price_per_unit, total_amount, cash_paid)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT (date, distributor) DO UPDATE SET
+        delivered = excluded.delivered,
+        returned = excluded.returned,
+        net_sales = excluded.net_sales,
+        price_per_unit = excluded.price_per_unit,
+        total_amount = excluded.total_amount,
+        cash_paid = excluded.cash_paid"""
+
+SQL_UPSERT_OTHER_SALES = """
+    INSERT INTO other_sales (date, item_name, amount) VALUES (?, ?, ?)
+    ON CONFLICT (date, item_name) DO UPDATE SET amount = excluded.amount"""
+
+SQL_UPSERT_EXPENSES = """
+    INSERT INTO expenses (date, labor, wood, misc, total_expenses) VALUES (?, ?, ?, ?, ?)
+    ON CONFLICT (date) DO UPDATE SET
+        labor = excluded.labor,
+        wood = excluded.wood,
+        misc = excluded.misc,
+        total_expenses = excluded.total_expenses"""
+
+# Price snapshot
+# settings and distributor_prices are read together in one query into
+# read-only mappings. The snapshot is cached like any other read, so it is
+# only reloaded after update_setting / update_distributor_price write.
+CASH_CUSTOMER = "كاش"
+PRICE_TABLES = ("settings", "distributor_prices")
+
+PriceSnapshot = namedtuple("PriceSnapshot", ["version", "settings", "distributors"])
+
+def _load_price_snapshot(conn):
+    rows = conn.execute("""SELECT 'setting', key, value FROM settings
+                           UNION ALL SELECT 'distributor', distributor, price FROM distributor_prices
+                           UNION ALL SELECT 'version', name, version FROM table_versions
+                                     WHERE name IN ('settings', 'distributor_prices')""").fetchall()
+    settings, distributors, versions = {}, {}, {}
+    target = {"setting": settings, "distributor": distributors, "version": versions}
+    for kind, key, value in rows:
+        target[kind][key] = value
+    return PriceSnapshot(tuple(versions.get(t) for t in PRICE_TABLES),
+                         MappingProxyType(settings), MappingProxyType(distributors))
+
+@instrumented
+def get_price_snapshot():
+    return _cached(("prices",), PRICE_TABLES, _load_price_snapshot)
+
+@instrumented
+def resolve_prices(names, snapshot=None):
+    """Unit price for each name, as a Series indexed by name.
+
+    The cash customer pays price_cash, known distributors their own price
+    and anyone else the factory price.
+    """
+    import pandas as pd
+    snapshot = snapshot or get_price_snapshot()
+    names = pd.Index(names)
+    prices = pd.Series(names.map(lambda n: snapshot.distributors.get(n)), index=names, dtype="float64")
+    prices[names == CASH_CUSTOMER] = snapshot.settings.get("price_cash", 20)
+    return prices.fillna(snapshot.settings.get("price_factory", 15))
+
+@instrumented
 def get_distributor_price(name, default=16):
-    conn = sqlite3.connect(DB_NAME)
-    c = conn.cursor()
-    c.execute("SELECT price FROM distributor_prices WHERE distributor = ?", (name,))
-    row = c.fetchone()
-    conn.close()
-    return row[0] if row else default
+    return get_price_snapshot().distributors.get(name, default)
 
+@instrumented
 def update_distributor_price(name, price):
-    conn = sqlite3.connect(DB_NAME)
-    c = conn.cursor()
-    c.execute("INSERT OR REPLACE INTO distributor_prices (distributor, price) VALUES (?, ?)", (name, price))
-    conn.commit()
-    conn.close()
+    with transaction() as conn:
+        conn.execute("""INSERT INTO distributor_prices (distributor, price) VALUES (?, ?)
+                        ON CONFLICT (distributor) DO UPDATE SET price = excluded.price""", (name, price))
+
+@instrumented
+def update_prices_batch(prices):
+    """Save {distributor: price} in one transaction."""
+    with transaction() as conn:
+        conn.executemany("""INSERT INTO distributor_prices (distributor, price) VALUES (?, ?)
+                            ON CONFLICT (distributor) DO UPDATE SET price = excluded.price""",
+                         list(prices.items()))
 
+@instrumented
 def get_setting(key, default=0):
-    conn = sqlite3.connect(DB_NAME)
-    c = conn.cursor()
-    c.execute("SELECT value FROM settings WHERE key = ?", (key,))
-    row = c.fetchone()
-    conn.close()
-    return row[0] if row else default
+    return get_price_snapshot().settings.get(key, default)
 
+@instrumented
 def update_setting(key, value):
-    conn = sqlite3.connect(DB_NAME)
-    c = conn.cursor()
-    c.execute("INSERT OR REPLACE INTO settings (key, value) VALUES (?, ?)", (key, value))
-    conn.commit()
-    conn.close()
+    with transaction() as conn:
+        conn.execute("""INSERT INTO settings (key, value) VALUES (?, ?)
+                        ON CONFLICT (key) DO UPDATE SET value = excluded.value""", (key, value))
+
+@instrumented
+def get_distributors(active_only=True):
+    """Distributor names in display order."""
+    where = " WHERE active" if active_only else ""
+    columns, rows = _cached(("distributors", active_only), ("distributors",),
+                            lambda conn: _read_rows(conn, f"SELECT name FROM distributors{where} ORDER BY position, name"))
+    return [name for (name,) in rows]
+
+@instrumented
+def add_distributor(name, price=None):
+    """Register a distributor (or reactivate it), optionally with its price."""
+    with transaction() as conn:
+        conn.execute("""INSERT INTO distributors (name, position)
+                        SELECT ?, COALESCE(MAX(position), 0) + 1 FROM distributors
+                        WHERE true
+                        ON CONFLICT (name) DO UPDATE SET active = 1""", (name,))
+        if price is not None:
+            update_distributor_price(name, price)
 
+@instrumented
+def set_distributors_active(active):
+    """Save {name: bool} active flags in one transaction."""
+    with transaction() as conn:
+        conn.executemany("UPDATE distributors SET active = ? WHERE name = ?",
+                         [(int(bool(flag)), name) for name, flag in active.items()])
+
+SQL_INSERT_LEDGER = "INSERT INTO ledger (date, name, description, debit, credit) VALUES (?, ?, ?, ?, ?)"
+
+@instrumented
 def add_ledger_entry(date, name, description, debit=0, credit=0):
-    conn = sqlite3.connect(DB_NAME)
-    c = conn.cursor()
-    c.execute("INSERT INTO ledger (date, name, description, debit, credit) VALUES (?, ?, ?, ?, ?)",
-              (date, name, description, debit, credit))
-    conn.commit()
-    conn.close()
+    with transaction() as conn:
+        conn.execute(SQL_INSERT_LEDGER, (date, name, description, debit, credit))
 
+@instrumented
 def save_production(date, flour_bags, expected_production):
-    conn = sqlite3.connect(DB_NAME)
-    c = conn.cursor()
-    # Check if exists for the date to update or insert
-    c.execute("SELECT id FROM production WHERE date = ?", (date,))
-    row = c.fetchone()
-    if row:
-        c.execute("UPDATE production SET flour_bags = ?, expected_production = ? WHERE date = ?", (flour_bags, expected_production, date))
-    else:
-        c.execute("INSERT INTO production (date, flour_bags, expected_production) VALUES (?, ?, ?)",
-                  (date, flour_bags, expected_production))
-    conn.commit()
-    conn.close()
+    with transaction() as conn:
+        conn.execute(SQL_UPSERT_PRODUCTION, (date, flour_bags, expected_production))
 
+@instrumented
 def save_sales(date, distributor, delivered, returned, net_sales, price, total_amount, cash_paid):
-    conn = sqlite3.connect(DB_NAME)
-    c = conn.cursor()
-    c.execute("SELECT id FROM sales WHERE date = ? AND distributor = ?", (date, distributor))
-    row = c.fetchone()
-    if row:
-        c.execute("UPDATE sales SET delivered = ?, returned = ?, net_sales = ?, price_per_unit = ?, total_amount = ?, cash_paid = ? WHERE id = ?", 
-                  (delivered, returned, net_sales, price, total_amount, cash_paid, row[0]))
-    else:
-        c.execute("INSERT INTO sales (date, distributor, delivered, returned, net_sales, price_per_unit, total_amount, cash_paid) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
-                  (date, distributor, delivered, returned, net_sales, price, total_amount, cash_paid))
-    conn.commit()
-    conn.close()
+    with transaction() as conn:
+        conn.execute(SQL_UPSERT_SALES, (date, distributor, delivered, returned, net_sales, price, total_amount, cash_paid))
+
+@instrumented
+def save_sales_batch(date, rows):
+    """Save a whole day's distribution in one transaction.
 
+    rows are dicts with the keys used by the sales page: distributor,
+    delivered, returned, net_sales, price, total_amount, cash_paid.
+    """
+    params = [(date, r['distributor'], r['delivered'], r['returned'], r['net_sales'],
+               r['price'], r['total_amount'], r['cash_paid']) for r in rows]
+    with transaction() as conn:
+        conn.executemany(SQL_UPSERT_SALES, params)
+
+@instrumented
 def save_other_sales(date, item_name, amount):
-    conn = sqlite3.connect(DB_NAME)
-    c = conn.cursor()
-    c.execute("SELECT id FROM other_sales WHERE date = ? AND item_name = ?", (date, item_name))
-    row = c.fetchone()
-    if row:
-        c.execute("UPDATE other_sales SET amount = ? WHERE id = ?", (amount, row[0]))
-    else:
-        c.execute("INSERT INTO other_sales (date, item_name, amount) VALUES (?, ?, ?)",
-                  (date, item_name, amount))
-    conn.commit()
-    conn.close()
+    with transaction() as conn:
+        conn.execute(SQL_UPSERT_OTHER_SALES, (date, item_name, amount))
 
+@instrumented
 def save_expenses(date, labor, wood, misc, total):
-    conn = sqlite3.connect(DB_NAME)
-    c = conn.cursor()
-    c.execute("SELECT id FROM expenses WHERE date = ?", (date,))
-    row = c.fetchone()
-    if row:
-        c.execute("UPDATE expenses SET labor = ?, wood = ?, misc = ?, total_expenses = ? WHERE date = ?", (labor, wood, misc, total, date))
-    else:
-        c.execute("INSERT INTO expenses (date, labor, wood, misc, total_expenses) VALUES (?, ?, ?, ?, ?)",
-                  (date, labor, wood, misc, total))
-    conn.commit()
-    conn.close()
-
-def get_data(table_name, date=None, start_date=None, end_date=None):
-    conn = sqlite3.connect(DB_NAME)
-    query = f"SELECT * FROM {table_name}"
-    params = []
+    with transaction() as conn:
+        conn.execute(SQL_UPSERT_EXPENSES, (date, labor, wood, misc, total))
+
+# Bulk writes: the statement the save_* helper of each table uses, and the
+# columns of its parameters in order. Ledger entries have no natural key,
+# so they are appended like add_ledger_entry does.
+BULK_STATEMENTS = {
+    "production": (SQL_UPSERT_PRODUCTION, ("date", "flour_bags", "expected_production")),
+    "sales": (SQL_UPSERT_SALES, ("date", "distributor", "delivered", "returned", "net_sales",
+                                 "price_per_unit", "total_amount", "cash_paid")),
+    "other_sales": (SQL_UPSERT_OTHER_SALES, ("date", "item_name", "amount")),
+    "expenses": (SQL_UPSERT_EXPENSES, ("date", "labor", "wood", "misc", "total_expenses")),
+    "ledger": (SQL_INSERT_LEDGER, ("date", "name", "description", "debit", "credit")),
+}
+
+@instrumented
+def save_rows(table_name, rows):
+    """Save many rows of a table in one transaction; rows are tuples in BULK_STATEMENTS order."""
+    if table_name not in BULK_STATEMENTS:
+        raise ValueError(f"Unknown table: {table_name!r}")
+    with transaction() as conn:
+        conn.executemany(BULK_STATEMENTS[table_name][0], rows)
+    return len(rows)
+
+# Readable tables and their columns. Table and column names can't be bound
+# as SQL parameters, so anything interpolated into a query must be listed here.
+TABLE_COLUMNS = {
+    "production": ("id", "date", "flour_bags", "expected_production"),
+    "sales": ("id", "date", "distributor", "delivered", "returned", "net_sales",
+              "price_per_unit", "total_amount", "cash_paid"),
+    "other_sales": ("id", "date", "item_name", "amount"),
+    "expenses": ("id", "date", "labor", "wood", "misc", "total_expenses"),
+    "ledger": ("id", "date", "name", "description", "debit", "credit"),
+    "balances": ("name", "debit", "credit", "last_date"),
+    "distributors": ("name", "active", "position"),
+    "daily_summary": ("date", "expected_production", "net_sales", "distributor_revenue",
+                      "other_revenue", "expenses", "deficit", "loss_value", "profit"),
+}
+
+AGGREGATES = ("sum", "count", "min", "max", "avg")
+
+def _check_table(table_name):
+    if table_name not in TABLE_COLUMNS:
+        raise ValueError(f"Unknown table: {table_name!r}")
+    return table_name
+
+def _check_columns(table_name, columns):
+    unknown = [c for c in columns if c not in TABLE_COLUMNS[table_name]]
+    if unknown:
+        raise ValueError(f"Unknown column(s) for {table_name}: {', '.join(unknown)}")
+    return list(columns)
+
+# Calendar ranges
+# Inclusive (start, end) bounds as 'YYYY-MM-DD' text that end on the real
+# last day of the month or week. Dates may be given as text, date or datetime.
+WEEK_START = calendar.SATURDAY  # the bakery's week runs Saturday to Friday
+
+def _parse_date(value):
+    if isinstance(value, str):
+        return datetime.strptime(value, '%Y-%m-%d').date()
+    return value.date() if isinstance(value, datetime) else value
+
+def day_key(date):
+    """The integer day key (YYYYMMDD) of a date, as stored in the `day` columns."""
+    if isinstance(date, str):
+        # The same arithmetic as SQL_DAY_KEY
+        return int(date.replace('-', ''))
+    return date.year * 10000 + date.month * 100 + date.day
+
+def month_range(year, month):
+    """The first and last day of a month."""
+    return f"{year}-{month:02d}-01", f"{year}-{month:02d}-{calendar.monthrange(year, month)[1]:02d}"
+
+def week_range(date, first_weekday=WEEK_START):
+    """The first and last day of the week (starting on first_weekday) that holds date."""
+    day = _parse_date(date)
+    start = day - timedelta(days=(day.weekday() - first_weekday) % 7)
+    return start.isoformat(), (start + timedelta(days=6)).isoformat()
+
+def date_range(start_date, end_date):
+    """The bounds of an arbitrary range, checked: ValueError for a bad date or a backwards range."""
+    start, end = _parse_date(start_date), _parse_date(end_date)
+    if start > end:
+        raise ValueError(f"Range ends before it starts: {start} > {end}")
+    return start.isoformat(), end.isoformat()
+
+def _where(table_name, date=None, start_date=None, end_date=None, filters=None):
+    clauses, params = [], []
     if date:
-        query += " WHERE date = ?"
+        clauses.append("date = ?")
         params.append(date)
+    elif start_date and end_date and table_name in DATED_TABLES:
+        clauses.append("day BETWEEN ? AND ?")
+        params.extend([day_key(start_date), day_key(end_date)])
     elif start_date and end_date:
-        query += " WHERE date BETWEEN ? AND ?"
+        clauses.append("date BETWEEN ? AND ?")
         params.extend([start_date, end_date])
-    df = pd.read_sql_query(query, conn, params=params)
-    conn.close()
+    for column, value in (filters or {}).items():
+        _check_columns(table_name, [column])
+        clauses.append(f"{column} = ?")
+        params.append(value)
+    return (" WHERE " + " AND ".join(clauses) if clauses else ""), params
+
+def _archive_dir():
+    return os.path.splitext(current_db())[0] + "_archive"
+
+def _archived_months(conn, date=None, start_date=None, end_date=None):
+    months = [month for (month,) in conn.execute("SELECT month FROM archived_months ORDER BY month")]
+    if date:
+        return [m for m in months if m == date[:7]]
+    if start_date and end_date:
+        return [m for m in months if start_date[:7] <= m <= end_date[:7]]
+    return months
+
+def _read_archive(conn, table_name, date=None, start_date=None, end_date=None, filters=None, month=None,
+                  columns=None):
+    """Archived rows of table_name matching the same arguments as _where, or None.
+
+    With month, only that month's partition is read; columns limits the
+    columns read (default: all).
+    """
+    if table_name not in ARCHIVED_TABLES:
+        return None
+    months = [month] if month else _archived_months(conn, date, start_date, end_date)
+    between = None
+    if date:
+        between = ("date", date, date)
+    elif start_date and end_date:
+        between = ("date", start_date, end_date)
+    if not months:
+        return None
+    import archive
+    frames = []
+    for month in months:
+        frame = archive.read_partition(os.path.join(_archive_dir(), table_name, month),
+                                       columns or TABLE_COLUMNS[table_name], filters, between)
+        if frame is not None and not frame.empty:
+            frames.append(frame)
+    if not frames:
+        return None
+    import pandas as pd
+    return pd.concat(frames, ignore_index=True) if len(frames) > 1 else frames[0]
+
+def _with_archive(conn, live, table_name, date=None, start_date=None, end_date=None, columns=None):
+    archived = _read_archive(conn, table_name, date, start_date, end_date, columns=columns)
+    if archived is None:
+        return live
+    if live.empty:
+        return archived
+    import pandas as pd
+    return pd.concat([archived, live], ignore_index=True)
+
+def _sources(table_name):
+    # Tables a read depends on, for the cache
+    return (table_name, "archived_months") if table_name in ARCHIVED_TABLES else (table_name,)
+
+# Typed reads
+# get_data(..., typed=True) returns compact dtypes: dates parsed once into
+# datetime64, names as categoricals and quantities as int32. float32=True
+# also narrows amounts, which is fine for charts and per-row figures but
+# loses precision in large sums.
+DATE_COLUMNS = ("date", "last_date")
+CATEGORY_COLUMNS = ("distributor", "name", "item_name", "description")
+QUANTITY_COLUMNS = ("id", "delivered", "returned", "net_sales", "expected_production", "deficit",
+                    "active", "position")
+
+def _typed(df, float32=False):
+    import pandas as pd
+    for column in df.columns:
+        values = df[column]
+        if column in DATE_COLUMNS:
+            df[column] = pd.to_datetime(values, format="%Y-%m-%d", errors="coerce")
+        elif column in CATEGORY_COLUMNS:
+            df[column] = values.astype("category")
+        elif column in QUANTITY_COLUMNS:
+            # Nullable Int32 only where there are NULLs
+            df[column] = pd.to_numeric(values).astype("Int32" if values.isna().any() else "int32")
+        elif float32 and pd.api.types.is_float_dtype(values):
+            df[column] = values.astype("float32")
     return df
 
-init_db()
+@instrumented
+def get_data(table_name, date=None, start_date=None, end_date=None, columns=None, typed=False, float32=False):
+    """Rows of a table as a DataFrame; archived months are included.
+
+    columns selects (and orders) the columns to load; typed=True returns
+    compact dtypes (see _typed).
+    """
+    _check_table(table_name)
+    if columns is not None:
+        columns = tuple(_check_columns(table_name, columns))
+    where, params = _where(table_name, date, start_date, end_date)
+    query = f"SELECT {', '.join(columns or TABLE_COLUMNS[table_name])} FROM {table_name}{where}"
+
+    def load(conn):
+        df = _with_archive(conn, _read_frame(conn, query, params), table_name, date, start_date, end_date, columns)
+        return _typed(df, float32) if typed else df
+    df = _cached(("data", table_name, date, start_date, end_date, columns, typed, float32),
+                 _sources(table_name), load)
+    # Callers get their own copy so they cannot modify the cached frame
+    return df.copy()
+
+@instrumented
+def get_rows(table_name, date=None, start_date=None, end_date=None):
+    """Like get_data, but as a list of plain dicts (no pandas needed)."""
+    where, params = _where(_check_table(table_name), date, start_date, end_date)
+    query = f"SELECT {', '.join(TABLE_COLUMNS[table_name])} FROM {table_name}{where}"
+    def load(conn):
+        columns, rows = _read_rows(conn, query, params)
+        archived = _read_archive(conn, table_name, date, start_date, end_date)
+        if archived is not None:
+            rows = tuple(archived.itertuples(index=False, name=None)) + rows
+        return columns, rows
+    columns, rows = _cached(("rows", table_name, date, start_date, end_date), _sources(table_name), load)
+    return [dict(zip(columns, row)) for row in rows]
+
+def get_row(table_name, date):
+    """The row of a one-row-per-day table (production, expenses, daily_summary) as a dict, or None."""
+    rows = get_rows(table_name, date)
+    return rows[0] if rows else None
+
+# One row per active distributor (plus anyone with a sale that day), with
+# the day's saved figures and the current price, for the sales grid.
+SQL_SALES_SHEET = """
+    SELECT d.name AS distributor,
+           COALESCE(s.delivered, 0) AS delivered,
+           COALESCE(s.returned, 0) AS returned,
+           COALESCE(s.cash_paid, 0) AS cash_paid,
+           CASE WHEN d.name = :cash THEN COALESCE((SELECT value FROM settings WHERE key = 'price_cash'), 20)
+                ELSE COALESCE(p.price, (SELECT value FROM settings WHERE key = 'price_factory'), 15)
+           END AS price,
+           s.id IS NOT NULL AS saved
+    FROM (SELECT name, active, position FROM distributors
+          UNION ALL
+          -- Sold to that day but not registered (e.g. imported): listed last
+          SELECT distributor, 0, (SELECT COALESCE(MAX(position), 0) + 1 FROM distributors) FROM sales
+          WHERE date = :date AND distributor NOT IN (SELECT name FROM distributors)) d
+    LEFT JOIN sales s ON s.distributor = d.name AND s.date = :date
+    LEFT JOIN distributor_prices p ON p.distributor = d.name
+    WHERE d.active OR s.id IS NOT NULL
+    ORDER BY d.position, d.name"""
+
+@instrumented
+def get_sales_sheet(date):
+    """The sales grid of a day: distributor, delivered, returned, cash_paid, price, saved."""
+    def load(conn):
+        df = _read_frame(conn, SQL_SALES_SHEET, {"cash": CASH_CUSTOMER, "date": date})
+        archived = _read_archive(conn, "sales", date)
+        if archived is not None:
+            # Archived days show their saved figures (the day is read-only)
+            saved = archived.set_index('distributor')[['delivered', 'returned', 'cash_paid', 'price_per_unit']]
+            dtypes = df.dtypes
+            df = df.set_index('distributor')
+            # Unregistered names only show up in the archived rows
+            df = df.reindex(df.index.append(saved.index.difference(df.index)))
+            df.update(saved.drop(columns='price_per_unit'))
+            df['price'] = df['price'].fillna(saved['price_per_unit'])
+            df.loc[df.index.isin(saved.index), 'saved'] = 1
+            df = df.reset_index(names='distributor').astype(dtypes)
+        return df
+    tables = ("sales", "distributors", "distributor_prices", "settings", "archived_months")
+    return _cached(("sales_sheet", date), tables, load).copy()
+
+def _aggregate_query(table_name, select, group_by, where):
+    query = f"SELECT {', '.join(select)} FROM {table_name}{where}"
+    if group_by:
+        query += f" GROUP BY {', '.join(group_by)} ORDER BY {', '.join(group_by)}"
+    return query
+
+@instrumented
+def aggregate(table_name, metrics, group_by=(), start_date=None, end_date=None, filters=None):
+    """Aggregate in SQLite and return only the grouped rows.
+
+    metrics maps column -> function, e.g. {"total_amount": "sum"}; each
+    result column is named after its source column. group_by lists the
+    grouping columns, filters maps column -> value for equality tests.
+
+        aggregate("sales", {"total_amount": "sum"}, ["distributor"], start, end)
+    """
+    _check_table(table_name)
+    group_by = _check_columns(table_name, group_by)
+    _check_columns(table_name, metrics)
+    select = list(group_by)
+    for column, func in metrics.items():
+        if func not in AGGREGATES:
+            raise ValueError(f"Unknown aggregate: {func!r}")
+        select.append(f"{func.upper()}({column}) AS {column}")
+    where, params = _where(table_name, start_date=start_date, end_date=end_date, filters=filters)
+
+    def load(conn):
+        archived = _read_archive(conn, table_name, start_date=start_date, end_date=end_date, filters=filters)
+        if archived is None:
+            return _read_frame(conn, _aggregate_query(table_name, select, group_by, where), params)
+        # Merge partial aggregates of the archive and of the live rows;
+        # avg travels as a sum and a count.
+        import pandas as pd
+        partial = list(group_by)
+        named = {}
+        for column, func in metrics.items():
+            if func == "avg":
+                partial.append(f"SUM({column}) AS {column}, COUNT({column}) AS {column}__n")
+                named[column], named[f"{column}__n"] = (column, "sum"), (column, "count")
+            else:
+                partial.append(f"{func.upper()}({column}) AS {column}")
+                named[column] = (column, func)
+        live = _read_frame(conn, _aggregate_query(table_name, partial, group_by, where), params)
+        if group_by:
+            archived = archived.groupby(group_by, as_index=False).agg(**named)
+        else:
+            archived = pd.DataFrame([{name: getattr(archived[col], func)() for name, (col, func) in named.items()}])
+        merge = {name: "sum" if func in ("sum", "count") else func for name, (_, func) in named.items()}
+        both = pd.concat([archived, live], ignore_index=True) if len(live) else archived
+        if group_by:
+            merged = both.groupby(group_by, as_index=False).agg(merge)
+        else:
+            merged = pd.DataFrame([{name: getattr(both[name], func)() for name, func in merge.items()}])
+        for column, func in metrics.items():
+            if func == "avg":
+                merged[column] = merged[column] / merged.pop(f"{column}__n")
+        return merged[list(group_by) + list(metrics)]
+
+    key = ("aggregate", table_name, tuple(metrics.items()), tuple(group_by),
+           start_date, end_date, tuple(sorted((filters or {}).items())))
+    df = _cached(key, _sources(table_name), load)
+    return df.copy()
+
+LEDGER_PAGE_SIZE = 50
+
+def _read_archived_entries(conn, name, start_date, end_date, month=None):
+    # Archived sales and ledger rows shaped like ledger_entries
+    import pandas as pd
+    frames = []
+    sales = _read_archive(conn, "sales", start_date=start_date, end_date=end_date,
+                          filters={"distributor": name} if name is not None else None, month=month)
+    if sales is not None:
+        frames.append(pd.DataFrame({"source": "sales", "id": sales['id'], "date": sales['date'],
+                                    "name": sales['distributor'], "description": SALES_DESCRIPTION,
+                                    "debit": sales['total_amount'], "credit": sales['cash_paid']}))
+    ledger = _read_archive(conn, "ledger", start_date=start_date, end_date=end_date,
+                           filters={"name": name} if name is not None else None, month=month)
+    if ledger is not None:
+        frames.append(ledger.assign(source="ledger")[["source", "id", "date", "name", "description", "debit", "credit"]])
+    if not frames:
+        return None
+    return pd.concat(frames, ignore_index=True) if len(frames) > 1 else frames[0]
+
+# ledger_entries arms: (source, name column, select). A page queries each
+# arm on its own, so the (date, id) ordered indexes serve ORDER BY ... LIMIT
+# and a page reads two short lists instead of sorting the whole history.
+LEDGER_ENTRY_ARMS = (
+    ("sales", "distributor", f"""SELECT 'sales' AS source, id, date, distributor AS name,
+                                        '{SALES_DESCRIPTION}' AS description,
+                                        total_amount AS debit, cash_paid AS credit
+                                 FROM sales"""),
+    ("ledger", "name", "SELECT 'ledger' AS source, id, date, name, description, debit, credit FROM ledger"),
+)
+
+def _ledger_arm_query(source, name_col, select, name, start_date, end_date, after, limit):
+    clauses, params = [], []
+    if name is not None:
+        clauses.append(f"{name_col} = ?")
+        params.append(name)
+    if start_date and end_date:
+        clauses.append("date BETWEEN ? AND ?")
+        params.extend([start_date, end_date])
+    if after is not None:
+        date, after_source, id_ = after
+        if after_source == source:
+            clauses.append("(date, id) < (?, ?)")
+            params.extend([date, id_])
+        else:
+            # Within a date, every sales row sorts after ('sales' > 'ledger') every ledger row
+            clauses.append("date < ?" if source > after_source else "date <= ?")
+            params.append(date)
+    query = select
+    if clauses:
+        query += " WHERE " + " AND ".join(clauses)
+    return query + " ORDER BY date DESC, id DESC LIMIT ?", params + [limit]
+
+@instrumented
+def get_ledger_page(name=None, start_date=None, end_date=None, after=None, limit=LEDGER_PAGE_SIZE):
+    """One page of the account statement, newest first.
+
+    after is the cursor returned with the previous page. Returns
+    (page DataFrame, cursor for the next page or None on the last page).
+    """
+    # One extra row tells us whether another page follows
+    queries = [_ledger_arm_query(*arm, name, start_date, end_date, after, limit + 1) for arm in LEDGER_ENTRY_ARMS]
+
+    def load(conn):
+        import pandas as pd
+        # Both lists are newest first; merge them on (date, source, id)
+        arms = [_read_rows(conn, query, params) for query, params in queries]
+        rows = heapq.merge(*(rows for _, rows in arms), key=lambda row: (row[2], row[0], row[1]), reverse=True)
+        df = pd.DataFrame(list(itertools.islice(rows, limit + 1)), columns=list(arms[0][0]))
+        if len(df) > limit:
+            return df
+        # Archived months are older than every live row, so they continue the list
+        archived = _read_archived_entries(conn, name, start_date, end_date)
+        if archived is None:
+            return df
+        if after is not None:
+            date, source, id_ = after
+            archived = archived[(archived['date'] < date) |
+                                ((archived['date'] == date) & ((archived['source'] < source) |
+                                                               ((archived['source'] == source) & (archived['id'] < id_))))]
+        archived = archived.sort_values(['date', 'source', 'id'], ascending=False).head(limit + 1 - len(df))
+        if df.empty:
+            return archived.reset_index(drop=True)
+        return pd.concat([df, archived], ignore_index=True)
+
+    key = ("ledger_page", name, start_date, end_date, tuple(after or ()), limit)
+    df = _cached(key, ("sales", "ledger", "archived_months"), load)
+    if len(df) <= limit:
+        return df.copy(), None
+    df = df.iloc[:limit].copy()
+    last = df.iloc[-1]
+    return df, (last['date'], last['source'], int(last['id']))
+
+def _search_query(text):
+    # Every word has to match, as a prefix: "دفع سلف" finds "دفعة عن سلفة"
+    return " ".join('"' + word.replace('"', '""') + '"*' for word in fold_arabic(text).split())
+
+@instrumented
+def search_ledger(text, name=None, page=0, page_size=SEARCH_PAGE_SIZE):
+    """Ledger entries matching the words of text, best matches first.
+
+    Returns (page of entries as a DataFrame, total number of matches).
+    Names weigh more than descriptions. Searches matching more than
+    SEARCH_RANKED_MAX entries are listed newest first instead. Archived
+    entries are included.
+    """
+    import pandas as pd
+    columns = ["id", "date", "name", "description", "debit", "credit"]
+    query = _search_query(text)
+    if not query:
+        return pd.DataFrame(columns=columns), 0
+    where, params = "ledger_search MATCH ?", [query]
+    if name is not None:
+        where += " AND shown_name = ?"
+        params.append(name)
+    conn = get_connection()
+    if conn.execute("SELECT 1 FROM ledger_search_pending LIMIT 1").fetchone():
+        with transaction() as write:
+            _sync_search_index(write)
+    total = conn.execute(f"SELECT COUNT(*) FROM ledger_search WHERE {where}", params).fetchone()[0]
+    order = "bm25(ledger_search, 2.0, 1.0), date DESC" if total <= SEARCH_RANKED_MAX else "rowid DESC"
+    rows = conn.execute(f"""SELECT rowid, date, shown_name, shown_description, debit, credit FROM ledger_search
+                            WHERE {where} ORDER BY {order}
+                            LIMIT ? OFFSET ?""", params + [page_size, page * page_size]).fetchall()
+    return pd.DataFrame(rows, columns=columns), total
+
+@instrumented
+def rebuild_search_index():
+    """Re-index every ledger entry, archive included."""
+    with transaction() as conn:
+        _rebuild_search_index(conn)
+
+SQL_ADD_ARCHIVED_BALANCES = """
+    INSERT INTO balances (name, debit, credit, last_date)
+    SELECT name, debit, credit, last_date FROM archived_balances WHERE true
+    ON CONFLICT (name) DO UPDATE SET
+        debit = debit + excluded.debit,
+        credit = credit + excluded.credit,
+        last_date = MAX(COALESCE(last_date, ''), COALESCE(excluded.last_date, ''))"""
+
+def _table_exists(conn, name):
+    return conn.execute("SELECT 1 FROM sqlite_master WHERE name = ?", (name,)).fetchone() is not None
+
+def _rebuild_balances(conn):
+    conn.execute("DELETE FROM balances")
+    conn.execute(f"INSERT INTO balances (name, debit, credit, last_date) {SQL_BALANCES_FROM_HISTORY}")
+    if _table_exists(conn, "archived_balances"):
+        conn.execute(SQL_ADD_ARCHIVED_BALANCES)
+
+@instrumented
+def rebuild_balances():
+    """Recompute balances from the full sales and ledger history, archive included."""
+    with transaction() as conn:
+        _rebuild_balances(conn)
+
+@instrumented
+def verify_balances(tolerance=0.01):
+    """Compare balances with the history; returns the mismatching names.
+
+    Each mismatch is (name, stored (debit, credit), actual (debit, credit)).
+    """
+    conn = get_connection()
+    stored = {name: (debit, credit) for name, debit, credit in
+              conn.execute("SELECT name, debit, credit FROM balances")}
+    actual = {name: (debit, credit) for name, debit, credit, _ in
+              conn.execute(SQL_BALANCES_FROM_HISTORY)}
+    for name, debit, credit in conn.execute("SELECT name, debit, credit FROM archived_balances"):
+        live = actual.get(name, (0, 0))
+        actual[name] = (live[0] + debit, live[1] + credit)
+    mismatches = []
+    for name in sorted(stored.keys() | actual.keys()):
+        s = stored.get(name, (0, 0))
+        a = actual.get(name, (0, 0))
+        if abs(s[0] - a[0]) > tolerance or abs(s[1] - a[1]) > tolerance:
+            mismatches.append((name, s, a))
+    return mismatches
+
+@instrumented
+def get_balances(name=None):
+    """Per-name debit, credit, balance and last activity date."""
+    def load(conn):
+        df = _read_frame(conn, "SELECT name, debit, credit, last_date FROM balances ORDER BY name")
+        df['balance'] = df['debit'] - df['credit']
+        return df
+    df = _cached(("balances",), ("balances",), load)
+    if name is not None:
+        df = df[df['name'] == name]
+    return df.copy()
+
+def _backfill_daily_summary(conn):
+    # Days of archived months keep their rollup; their rows are gone
+    live = "true"
+    if _table_exists(conn, "archived_months"):
+        live = f"substr(date, 1, 7) > {SQL_ARCHIVED_THROUGH}"
+    conn.execute(f"DELETE FROM daily_summary WHERE {live}")
+    dates = " UNION ".join(f"SELECT date FROM {table}" for table in DAILY_SUMMARY_SOURCES)
+    conn.execute(_sql_refresh_daily_summary(f"SELECT date FROM ({dates}) WHERE {live}"))
+
+@instrumented
+def backfill_daily_summary():
+    """Rebuild daily_summary from all production, sales and expense history."""
+    with transaction() as conn:
+        _backfill_daily_summary(conn)
+
+def get_daily_summary(date):
+    """The rollup row for one date as a dict (all zeros if nothing recorded)."""
+    row = get_row("daily_summary", date)
+    if row is None:
+        row = {col: 0 for col in TABLE_COLUMNS["daily_summary"]}
+        row["date"] = date
+    return row
+
+@instrumented
+def get_daily_summaries(start_date, end_date):
+    where, params = _where("daily_summary", start_date=start_date, end_date=end_date)
+    query = f"SELECT {', '.join(TABLE_COLUMNS['daily_summary'])} FROM daily_summary{where} ORDER BY day"
+    df = _cached(("daily_summary", start_date, end_date), ("daily_summary",),
+                 lambda conn: _read_frame(conn, query, params))
+    return df.copy()
+
+@instrumented
+def get_months():
+    """The months ("YYYY-MM") that have a daily rollup, oldest first."""
+    columns, rows = _cached(("months",), ("daily_summary",),
+                            lambda conn: _read_rows(conn, "SELECT DISTINCT substr(date, 1, 7) FROM daily_summary ORDER BY 1"))
+    return [month for (month,) in rows]
+
+
+# Streaming reads
+# For exports: rows come chunk by chunk, oldest first, straight from a
+# cursor (and from one archived month at a time), without building a
+# DataFrame of the whole range or going through the cache.
+STREAM_CHUNK_ROWS = 1000
+
+def _stream(cursor, chunk_rows):
+    while True:
+        rows = cursor.fetchmany(chunk_rows)
+        if not rows:
+            return
+        yield rows
+
+def _stream_frames(frames, chunk_rows):
+    for frame in frames:
+        if frame is None:
+            continue
+        rows = list(frame.itertuples(index=False, name=None))
+        for start in range(0, len(rows), chunk_rows):
+            yield rows[start:start + chunk_rows]
+
+def iter_rows(table_name, date=None, start_date=None, end_date=None, chunk_rows=STREAM_CHUNK_ROWS):
+    """Yield the rows of a table as lists of tuples (TABLE_COLUMNS order), archive first."""
+    conn = get_connection()
+    columns = TABLE_COLUMNS[_check_table(table_name)]
+    if table_name in ARCHIVED_TABLES:
+        months = _archived_months(conn, date, start_date, end_date)
+        yield from _stream_frames((_read_archive(conn, table_name, date, start_date, end_date, month=month)
+                                   for month in months), chunk_rows)
+    where, params = _where(table_name, date, start_date, end_date)
+    order = " ORDER BY date, id" if "id" in columns else " ORDER BY date"
+    yield from _stream(conn.execute(f"SELECT {', '.join(columns)} FROM {table_name}{where}{order}", params),
+                       chunk_rows)
+
+def iter_ledger_entries(name=None, start_date=None, end_date=None, chunk_rows=STREAM_CHUNK_ROWS):
+    """Yield account statement rows (as in get_ledger_page), oldest first."""
+    conn = get_connection()
+    order = ['date', 'source', 'id']
+    yield from _stream_frames((_sorted(_read_archived_entries(conn, name, start_date, end_date, month), order)
+                               for month in _archived_months(conn, start_date=start_date, end_date=end_date)),
+                              chunk_rows)
+    clauses, params = [], []
+    if name is not None:
+        clauses.append("name = ?")
+        params.append(name)
+    if start_date and end_date:
+        clauses.append("date BETWEEN ? AND ?")
+        params.extend([start_date, end_date])
+    query = "SELECT source, id, date, name, description, debit, credit FROM ledger_entries"
+    if clauses:
+        query += " WHERE " + " AND ".join(clauses)
+    yield from _stream(conn.execute(query + " ORDER BY date, source, id", params), chunk_rows)
+
+def _sorted(frame, columns):
+    return None if frame is None else frame.sort_values(columns)
+
+
+# Archive job
+ARCHIVE_KEEP_MONTHS = 2
+
+SQL_ARCHIVE_BALANCES = """
+    INSERT INTO archived_balances (name, debit, credit, last_date)
+    SELECT name, SUM(debit), SUM(credit), MAX(date)
+    FROM (SELECT distributor AS name, COALESCE(total_amount, 0) AS debit,
+                 COALESCE(cash_paid, 0) AS credit, date FROM sales WHERE day <= :through
+          UNION ALL
+          SELECT name, COALESCE(debit, 0), COALESCE(credit, 0), date FROM ledger WHERE day <= :through)
+    WHERE name IS NOT NULL
+    GROUP BY name
+    ON CONFLICT (name) DO UPDATE SET
+        debit = debit + excluded.debit,
+        credit = credit + excluded.credit,
+        last_date = MAX(COALESCE(last_date, ''), COALESCE(excluded.last_date, ''))"""
+
+def archived_through():
+    """The last archived month ('YYYY-MM'), or None."""
+    return get_connection().execute("SELECT MAX(month) FROM archived_months").fetchone()[0]
+
+def is_archived(date):
+    through = archived_through()
+    return through is not None and date[:7] <= through
+
+@instrumented
+def archive_months(keep_months=ARCHIVE_KEEP_MONTHS, today=None):
+    """Move every month before the last `keep_months` into the archive.
+
+    The current month is always kept. Returns the months archived.
+    """
+    import archive
+    today = today or datetime.now()
+    index = today.year * 12 + today.month - 1 - max(keep_months, 1)
+    through = day_key(month_range(index // 12, index % 12 + 1)[1])
+    columns = {table: TABLE_COLUMNS[table] for table in ARCHIVED_TABLES}
+    with transaction() as conn:
+        # Index pending ledger rows while they are still in the table
+        _sync_search_index(conn)
+        months = sorted({month for table in ARCHIVED_TABLES for (month,) in conn.execute(
+            f"SELECT DISTINCT substr(date, 1, 7) FROM {table} WHERE day <= ?", (through,)) if month})
+        for month in months:
+            count = 0
+            start, end = map(day_key, month_range(*map(int, month.split("-"))))
+            for table in ARCHIVED_TABLES:
+                rows = conn.execute(f"SELECT {', '.join(columns[table])} FROM {table} WHERE day BETWEEN ? AND ?",
+                                    (start, end)).fetchall()
+                if rows:
+                    archive.write_partition(os.path.join(_archive_dir(), table, month), columns[table], rows)
+                    count += len(rows)
+            conn.execute("INSERT INTO archived_months (month, rows, archived_at) VALUES (?, ?, ?)",
+                         (month, count, datetime.now().isoformat(timespec="seconds")))
+        if months:
+            through = day_key(month_range(*map(int, months[-1].split("-")))[1])
+            conn.execute(SQL_ARCHIVE_BALANCES, {"through": through})
+            for table in ARCHIVED_TABLES:
+                conn.execute(f"DELETE FROM {table} WHERE day <= ?", (through,))
+    return months
+
+
+# Backups
+# Copies are taken with the SQLite online backup API from a live
+# connection, so they are consistent even while other sessions write.
+BACKUP_PAGES_PER_STEP = 256
+BACKUP_CHUNK_SIZE = 1024 * 1024
+
+@instrumented
+def create_backup(target=None, compress=False, progress=None, pages=BACKUP_PAGES_PER_STEP, with_archive=False):
+    """Back up the current database to target and return its path.
+
+    Without a target a temp file is created. The copy is made `pages`
+    pages at a time and progress(copied, total) is called after each
+    step. With compress=True the file is gzip'ed. With with_archive=True
+    and archived months on disk, the backup is a tar file holding the
+    database and its archive directory, since archived rows live only there.
+    """
+    bundle = with_archive and os.path.isdir(_archive_dir())
+    if target is None:
+        suffix = ".tar" if bundle else ".db"
+        fd, target = tempfile.mkstemp(prefix="bakery_backup_", suffix=suffix + (".gz" if compress else ""))
+        os.close(fd)
+    fd, copy_path = tempfile.mkstemp(suffix=".db", dir=os.path.dirname(os.path.abspath(target)))
+    os.close(fd)
+    try:
+        dest = sqlite3.connect(copy_path)
+        try:
+            def step(status, remaining, total):
+                if progress:
+                    progress(total - remaining, total)
+            get_connection().backup(dest, pages=pages, progress=step)
+            # A standalone copy shouldn't depend on a -wal side file
+            dest.execute("PRAGMA journal_mode = DELETE")
+        finally:
+            dest.close()
+        if bundle:
+            with tarfile.open(target, "w:gz" if compress else "w") as tar:
+                tar.add(copy_path, arcname=os.path.basename(current_db()))
+                tar.add(_archive_dir(), arcname=os.path.basename(_archive_dir()))
+        elif compress:
+            with open(copy_path, "rb") as src_file, gzip.open(target, "wb") as gz_file:
+                shutil.copyfileobj(src_file, gz_file, BACKUP_CHUNK_SIZE)
+        else:
+            os.replace(copy_path, target)
+    finally:
+        if os.path.exists(copy_path):
+            os.remove(copy_path)
+    return target
+
+def rotate_backups(directory, keep=7, compress=True, progress=None):
+    """Write a timestamped backup into directory and keep only the newest `keep`."""
+    os.makedirs(directory, exist_ok=True)
+    # Two backups in the same second mustn't overwrite each other
+    stamp = f"bakery_{datetime.now():%Y%m%d_%H%M%S_%f}"
+    suffix = ".db" + (".gz" if compress else "")
+    name, n = stamp + suffix, 0
+    while os.path.exists(os.path.join(directory, name)):
+        n += 1
+        name = f"{stamp}_{n}{suffix}"
+    path = create_backup(os.path.join(directory, name), compress=compress, progress=progress)
+    # Timestamped names sort chronologically
+    backups = sorted(glob.glob(os.path.join(directory, "bakery_*.db")) +
+                     glob.glob(os.path.join(directory, "bakery_*.db.gz")))
+    for old in backups[:-keep] if keep > 0 else []:
+        os.remove(old)
+    # Archived partitions never change once written, so one mirrored copy is enough
+    if os.path.isdir(_archive_dir()):
+        shutil.copytree(_archive_dir(), os.path.join(directory, os.path.basename(_archive_dir())), dirs_exist_ok=True)
+    return path
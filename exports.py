@@ -0,0 +1,102 @@
+"""CSV and Excel exports of the account statement and the reports.
+
+An export is a list of sections, each (headers, chunks of rows). Rows are
+streamed from the database chunk by chunk into the writer, which spools
+to a temporary file, so memory doesn't grow with the date range.
+"""
+import codecs
+import csv
+import importlib.util
+import tempfile
+
+import database as db
+import reports
+
+SPOOL_MAX_BYTES = 8 * 1024 * 1024  # larger exports are spooled to disk
+XLSX_AVAILABLE = importlib.util.find_spec("openpyxl") is not None
+
+MIME_TYPES = {
+    "csv": "text/csv",
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+}
+
+LEDGER_HEADERS = ["التاريخ", "الاسم", "البيان", "مدين", "دائن", "الرصيد"]
+SALES_HEADERS = ["التاريخ", "الموزع", "المستلم", "المرتجع", "الكمية المباعة", "السعر", "المبلغ الإجمالي", "المدفوع نقداً"]
+
+
+def ledger_statement(name=None, start_date=None, end_date=None):
+    """The account statement of one name (or everyone), oldest first with a running balance."""
+    def rows():
+        balance = 0
+        for chunk in db.iter_ledger_entries(name, start_date, end_date):
+            out = []
+            for _, _, date, entry_name, description, debit, credit in chunk:
+                balance += (debit or 0) - (credit or 0)
+                out.append((date, entry_name, description, debit, credit, balance))
+            yield out
+    return [(LEDGER_HEADERS, rows())]
+
+
+def _sales_rows(**where):
+    # Drop the id column
+    return ([row[1:] for row in chunk] for chunk in db.iter_rows("sales", **where))
+
+
+def monthly_sales(year, month):
+    """Every sales row of a month."""
+    start_date, end_date = reports.month_bounds(year, month)
+    return [(SALES_HEADERS, _sales_rows(start_date=start_date, end_date=end_date))]
+
+
+def daily_report(date):
+    """The day's figures, then its sales rows."""
+    day = db.get_daily_summary(date)
+    summary = [
+        ("التاريخ", date),
+        ("الإنتاج المتوقع", day['expected_production']),
+        ("المبيعات الفعلية", day['net_sales']),
+        ("العجز في الإنتاج", day['deficit']),
+        ("قيمة الخسارة من العجز", day['loss_value']),
+        ("إجمالي الإيرادات", day['distributor_revenue'] + day['other_revenue']),
+        ("إجمالي المصروفات", day['expenses']),
+        ("صافي الربح", day['profit']),
+    ]
+    return [(["البند", "القيمة"], iter([summary])), (SALES_HEADERS, _sales_rows(date=date))]
+
+
+def write_csv(sections, f):
+    # utf-8-sig: Excel needs the BOM to read Arabic CSV correctly
+    text = codecs.getwriter("utf-8-sig")(f)
+    writer = csv.writer(text)
+    for i, (headers, chunks) in enumerate(sections):
+        if i:
+            writer.writerow([])
+        writer.writerow(headers)
+        for chunk in chunks:
+            writer.writerows(chunk)
+
+
+def write_xlsx(sections, f):
+    import openpyxl
+    # Write-only workbooks stream rows out instead of keeping every cell
+    workbook = openpyxl.Workbook(write_only=True)
+    sheet = workbook.create_sheet()
+    sheet.sheet_view.rightToLeft = True
+    for i, (headers, chunks) in enumerate(sections):
+        if i:
+            sheet.append([])
+        sheet.append(headers)
+        for chunk in chunks:
+            for row in chunk:
+                sheet.append(row)
+    workbook.save(f)
+
+
+def export(sections, fmt="csv"):
+    """Write sections as fmt ("csv" or "xlsx") and return the file, rewound."""
+    if fmt == "xlsx" and not XLSX_AVAILABLE:
+        raise ValueError("Excel export needs openpyxl: pip install openpyxl")
+    f = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_BYTES)
+    (write_xlsx if fmt == "xlsx" else write_csv)(sections, f)
+    f.seek(0)
+    return f
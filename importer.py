@@ -0,0 +1,181 @@
+"""Bulk import of historical records from CSV or Excel files.
+
+Files are read in chunks; each chunk is cleaned with vectorized pandas
+(header aliases, dates, names, numbers), then saved with one executemany
+per chunk through the write queue, with the same upserts as the save_*
+helpers. Rows that can't be cleaned, or that fall in archived months,
+are counted as rejected and skipped.
+"""
+import os
+import time
+
+import pandas as pd
+
+import database as db
+
+IMPORT_CHUNK_ROWS = 5000
+
+# Spreadsheet headers mapped to column names
+HEADER_ALIASES = {
+    "التاريخ": "date",
+    "الموزع": "distributor",
+    "الاسم": "name",
+    "البيان": "description",
+    "مدين": "debit",
+    "عليه": "debit",
+    "دائن": "credit",
+    "له": "credit",
+    "المستلم": "delivered",
+    "المرتجع": "returned",
+    "الكمية": "net_sales",
+    "السعر": "price_per_unit",
+    "price": "price_per_unit",
+    "المبلغ": "total_amount",
+    "المدفوع نقداً": "cash_paid",
+    "الصنف": "item_name",
+    "أكياس الدقيق": "flour_bags",
+    "العمال": "labor",
+    "الحطب": "wood",
+    "متفرقات": "misc",
+}
+
+REQUIRED_COLUMNS = {
+    "production": ("date", "flour_bags"),
+    "sales": ("date", "distributor", "delivered", "price_per_unit"),
+    "other_sales": ("date", "item_name", "amount"),
+    "expenses": ("date", "labor", "wood", "misc"),
+    "ledger": ("date", "name"),
+}
+TEXT_COLUMNS = ("distributor", "name", "item_name", "description")
+ARABIC_DIGITS = str.maketrans("٠١٢٣٤٥٦٧٨٩٫٬", "0123456789.,")
+
+
+def _dates(values):
+    # ISO dates first; anything else is read day-first (05/01/2024 is 5 January)
+    text = values.astype("string").str.strip().str.translate(ARABIC_DIGITS)
+    parsed = pd.to_datetime(text, format="ISO8601", errors="coerce")
+    rest = parsed.isna() & text.notna()
+    if rest.any():
+        parsed[rest] = pd.to_datetime(text[rest], format="mixed", dayfirst=True, errors="coerce")
+    return parsed.dt.strftime("%Y-%m-%d")
+
+
+def _names(values):
+    # Drop tatweel and collapse runs of whitespace, so "هيثم " and "هيـثم" match "هيثم"
+    return (values.astype("string").str.replace("ـ", "", regex=False)
+            .str.replace(r"\s+", " ", regex=True).str.strip())
+
+
+def _numbers(values):
+    text = values.astype("string").str.strip().str.translate(ARABIC_DIGITS).str.replace(",", "", regex=False)
+    numbers = pd.to_numeric(text, errors="coerce")
+    bad = numbers.isna() & text.notna() & (text != "")
+    return numbers.fillna(0), bad
+
+
+def clean_chunk(chunk, table_name, archived_through=""):
+    """Return (frame in BULK_STATEMENTS column order, number of rejected rows)."""
+    columns = db.BULK_STATEMENTS[table_name][1]
+    chunk = chunk.rename(columns=lambda c: HEADER_ALIASES.get(str(c).strip(), str(c).strip().lower()))
+    missing = [c for c in REQUIRED_COLUMNS[table_name] if c not in chunk.columns]
+    if missing:
+        raise ValueError(f"Missing column(s) for {table_name}: {', '.join(missing)}")
+
+    out = pd.DataFrame(index=chunk.index)
+    rejected = pd.Series(False, index=chunk.index)
+    for column in columns:
+        if column == "date":
+            out[column] = _dates(chunk[column])
+            rejected |= out[column].isna() | (out[column].str[:7] <= archived_through)
+        elif column in TEXT_COLUMNS:
+            out[column] = _names(chunk[column]) if column in chunk else ""
+            if column != "description":
+                rejected |= out[column].isna() | (out[column] == "")
+        elif column in chunk:
+            out[column], bad = _numbers(chunk[column])
+            rejected |= bad
+
+    # Columns the save helpers would have computed
+    if table_name == "production" and "expected_production" not in chunk:
+        out["expected_production"] = (out["flour_bags"] * 1600).astype(int)
+    if table_name == "sales":
+        if "returned" not in chunk:
+            out["returned"] = 0
+        if "net_sales" not in chunk:
+            out["net_sales"] = out["delivered"] - out["returned"]
+        if "total_amount" not in chunk:
+            out["total_amount"] = out["net_sales"] * out["price_per_unit"]
+        if "cash_paid" not in chunk:
+            out["cash_paid"] = 0
+    if table_name == "expenses" and "total_expenses" not in chunk:
+        out["total_expenses"] = out["labor"] + out["wood"] + out["misc"]
+    if table_name == "ledger":
+        for column in ("debit", "credit"):
+            if column not in chunk:
+                out[column] = 0
+        out["description"] = out["description"].fillna("")
+
+    out = out.loc[~rejected, list(columns)]
+    # Plain Python values for sqlite3
+    return out.astype(object).where(out.notna(), None), int(rejected.sum())
+
+
+def _size(f):
+    position = f.tell()
+    f.seek(0, os.SEEK_END)
+    size = f.tell()
+    f.seek(position)
+    return size
+
+
+def read_chunks(source, file_name=None, chunk_rows=IMPORT_CHUNK_ROWS):
+    """Yield (DataFrame chunk, fraction of the file read) from a path or binary file.
+
+    CSV is streamed. Excel can't be streamed by pandas, so it is read whole
+    (this needs openpyxl) and then handed out in chunks.
+    """
+    name = (file_name or (source if isinstance(source, str) else getattr(source, "name", ""))).lower()
+    if name.endswith((".xlsx", ".xlsm", ".xls")):
+        try:
+            frame = pd.read_excel(source, dtype=object)
+        except ImportError as e:
+            raise ValueError("Excel import needs openpyxl: pip install openpyxl") from e
+        for start in range(0, len(frame), chunk_rows):
+            yield frame.iloc[start:start + chunk_rows], min(1.0, (start + chunk_rows) / len(frame))
+        return
+
+    f = open(source, "rb") if isinstance(source, str) else source
+    try:
+        total = _size(f)
+        # utf-8-sig also reads the BOM Excel writes into CSV exports
+        for chunk in pd.read_csv(f, chunksize=chunk_rows, dtype=str, encoding="utf-8-sig", skipinitialspace=True):
+            yield chunk, min(1.0, f.tell() / total) if total else None
+    finally:
+        if f is not source:
+            f.close()
+
+
+def import_file(source, table_name, file_name=None, chunk_rows=IMPORT_CHUNK_ROWS, progress=None):
+    """Import a CSV or Excel file into table_name and return the totals.
+
+    progress(stats) is called after every chunk with the running totals:
+    rows, rejected, seconds, rows_per_sec and fraction (None if unknown).
+    """
+    if table_name not in db.BULK_STATEMENTS:
+        raise ValueError(f"Unknown table: {table_name!r}")
+    archived_through = db.archived_through() or ""
+    stats = {"rows": 0, "rejected": 0, "seconds": 0.0, "rows_per_sec": 0.0, "fraction": 0.0}
+    start = time.perf_counter()
+    for chunk, fraction in read_chunks(source, file_name, chunk_rows):
+        frame, rejected = clean_chunk(chunk, table_name, archived_through)
+        rows = list(frame.itertuples(index=False, name=None))
+        if rows:
+            db.submit(db.save_rows, table_name, rows).result()
+        stats["rows"] += len(rows)
+        stats["rejected"] += rejected
+        stats["seconds"] = time.perf_counter() - start
+        stats["rows_per_sec"] = stats["rows"] / stats["seconds"] if stats["seconds"] else 0.0
+        stats["fraction"] = fraction
+        if progress:
+            progress(dict(stats))
+    return stats
@@ -0,0 +1,228 @@
+"""Routine SQLite maintenance: statistics, WAL checkpoints and vacuuming.
+
+Each task has a period and a time budget. The scheduler thread started
+by start() wakes up every CHECK_INTERVAL_S and, once the app has been idle
+for IDLE_AFTER_S, runs the tasks that are due on each branch database.
+A task that runs over its budget, or is still running when the app is
+used again, is interrupted (SQLite rolls its work back) and tried again
+in a later idle window. Every run is recorded in
+maintenance_log.
+
+The first vacuum rebuilds the file with auto_vacuum=INCREMENTAL; after
+that free pages (e.g. left behind by archiving) are released a step at a
+time, so no single run has to rewrite the whole database.
+"""
+import logging
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime, timedelta
+
+import database as db
+
+CHECK_INTERVAL_S = 60
+IDLE_AFTER_S = 120
+RETRY_AFTER = timedelta(hours=1)  # after an interrupted or failed run
+LOG_KEPT = 500  # maintenance_log rows kept per database
+CHECKPOINT_WAL_BYTES = 64 * 1024 * 1024
+VACUUM_FREE_FRACTION = 0.1  # vacuum once this share of the pages is free
+VACUUM_STEP_PAGES = 1000
+
+logger = logging.getLogger(__name__)
+
+_scheduler = None
+_lock = threading.Lock()
+
+
+def _pages(conn):
+    page_count = conn.execute("PRAGMA page_count").fetchone()[0]
+    free = conn.execute("PRAGMA freelist_count").fetchone()[0]
+    return page_count, free
+
+
+def _wal_bytes(path):
+    try:
+        return os.path.getsize(path + "-wal")
+    except OSError:
+        return 0
+
+
+# Tasks
+# Each takes a connection of its own and the deadline, and returns a
+# detail string for the log.
+
+def _checkpoint(conn, deadline):
+    busy, log, done = conn.execute("PRAGMA wal_checkpoint(TRUNCATE)").fetchone()
+    if busy:
+        # Readers still need part of the WAL; what could be copied was
+        raise sqlite3.OperationalError(f"checkpoint busy: {done}/{log} pages copied")
+    return f"{log} pages"
+
+
+def _optimize(conn, deadline):
+    # analysis_limit keeps the sampling cheap on big tables
+    conn.execute("PRAGMA analysis_limit = 400")
+    conn.execute("PRAGMA optimize")
+    return ""
+
+
+def _analyze(conn, deadline):
+    conn.execute("PRAGMA analysis_limit = 0")
+    conn.execute("ANALYZE")
+    return ""
+
+
+def _vacuum(conn, deadline):
+    if conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+        conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        conn.execute("VACUUM")
+        return "rebuilt with auto_vacuum=incremental"
+    freed = 0
+    while time.monotonic() < deadline:
+        free = _pages(conn)[1]
+        if not free:
+            break
+        conn.execute(f"PRAGMA incremental_vacuum({VACUUM_STEP_PAGES})").fetchall()
+        freed += min(free, VACUUM_STEP_PAGES)
+    return f"{freed} pages freed"
+
+
+# When each task is due, given how long ago it last succeeded (None: never)
+
+def _every(period):
+    return lambda conn, age: age is None or age >= period
+
+
+def _checkpoint_due(conn, age):
+    # Hourly, or sooner once the WAL has grown
+    return _every(timedelta(hours=1))(conn, age) or _wal_bytes(db.current_db()) > CHECKPOINT_WAL_BYTES
+
+
+def _vacuum_due(conn, age):
+    # At most daily, and only with enough free pages to be worth it
+    page_count, free = _pages(conn)
+    return _every(timedelta(days=1))(conn, age) and bool(page_count) and free / page_count >= VACUUM_FREE_FRACTION
+
+
+# name -> (budget in seconds, task, due)
+TASKS = {
+    "checkpoint": (10, _checkpoint, _checkpoint_due),
+    "optimize": (10, _optimize, _every(timedelta(hours=6))),
+    "analyze": (60, _analyze, _every(timedelta(days=7))),
+    "vacuum": (120, _vacuum, _vacuum_due),
+}
+
+
+def _due(conn, task, now):
+    last_attempt, last_ok = conn.execute("""SELECT MAX(started_at), MAX(CASE WHEN status = 'ok' THEN started_at END)
+                                            FROM maintenance_log WHERE task = ?""", (task,)).fetchone()
+    if last_attempt and last_attempt != last_ok and now - datetime.fromisoformat(last_attempt) < RETRY_AFTER:
+        return False  # failed or ran out of time recently
+    age = now - datetime.fromisoformat(last_ok) if last_ok else None
+    return TASKS[task][2](conn, age)
+
+
+def run_task(task, budget_s=None, yield_to_app=False):
+    """Run one task on this thread's database now; return (status, seconds, detail).
+
+    status is "ok", "over budget", "interrupted" (with yield_to_app, the
+    app was used again: the task gives way so saves don't wait out the
+    busy timeout), "busy" or "error".
+    """
+    budget, func, _ = TASKS[task]
+    deadline = time.monotonic() + (budget_s or budget)
+    db.get_connection()  # brings the schema up to date
+    # A connection of its own: VACUUM can't run next to open statements
+    conn = sqlite3.connect(db.current_db(), timeout=db.BUSY_TIMEOUT_MS / 1000, isolation_level=None)
+    in_use = []
+
+    def stop():
+        if yield_to_app and db.idle_seconds() < IDLE_AFTER_S:
+            in_use.append(True)
+            return True
+        return time.monotonic() > deadline
+    conn.set_progress_handler(stop, 10000)
+    started = datetime.now()
+    start = time.perf_counter()
+    try:
+        status, detail = "ok", func(conn, deadline)
+    except sqlite3.OperationalError as e:
+        message = str(e)
+        if "interrupted" in message:
+            status = "interrupted" if in_use else "over budget"
+        elif "locked" in message or "busy" in message:
+            status = "busy"
+        else:
+            status = "error"
+        detail = message
+    finally:
+        conn.close()
+    seconds = time.perf_counter() - start
+    with db.transaction() as log:
+        log.execute("""INSERT INTO maintenance_log (task, started_at, seconds, status, detail)
+                       VALUES (?, ?, ?, ?, ?)""", (task, started.isoformat(timespec="seconds"), seconds, status, detail))
+        log.execute("DELETE FROM maintenance_log WHERE id <= (SELECT MAX(id) FROM maintenance_log) - ?", (LOG_KEPT,))
+    if status != "ok":
+        logger.info("maintenance %s on %s: %s (%s)", task, db.current_db(), status, detail)
+    return status, seconds, detail
+
+
+def run_due(tasks=None, force=False, idle_only=False):
+    """Run the due tasks (or all of `tasks` with force) on this thread's database.
+
+    With idle_only, stops as soon as the app is in use again. Returns
+    {task: (status, seconds, detail)} for the tasks that ran.
+    """
+    results = {}
+    conn = db.get_connection()
+    for task in tasks or TASKS:
+        if idle_only and db.idle_seconds() < IDLE_AFTER_S:
+            break
+        if force or _due(conn, task, datetime.now()):
+            results[task] = run_task(task, yield_to_app=idle_only)
+    return results
+
+
+def _run(check_interval_s):
+    with db.background():
+        while True:
+            time.sleep(check_interval_s)
+            try:
+                for branch in db.list_branches():
+                    if db.idle_seconds() < IDLE_AFTER_S:
+                        break
+                    with db.use_branch(branch):
+                        run_due(idle_only=True)
+            except Exception:
+                logger.exception("maintenance failed")
+
+
+def start(check_interval_s=CHECK_INTERVAL_S):
+    """Start the scheduler thread, once per process."""
+    global _scheduler
+    with _lock:
+        if _scheduler is None:
+            _scheduler = threading.Thread(target=_run, args=(check_interval_s,), daemon=True, name="maintenance")
+            _scheduler.start()
+
+
+def database_stats():
+    """Size, free space and last maintenance runs of this thread's database."""
+    conn = db.get_connection()
+    path = db.current_db()
+    page_count, free = _pages(conn)
+    last_runs = conn.execute("""SELECT task, started_at, seconds, status, detail FROM maintenance_log
+                                WHERE id IN (SELECT MAX(id) FROM maintenance_log GROUP BY task)
+                                ORDER BY task""").fetchall()
+    return {
+        "path": path,
+        "file_bytes": os.path.getsize(path),
+        "wal_bytes": _wal_bytes(path),
+        "page_size": conn.execute("PRAGMA page_size").fetchone()[0],
+        "pages": page_count,
+        "free_pages": free,
+        "fragmentation": free / page_count if page_count else 0.0,
+        "auto_vacuum": {0: "none", 1: "full", 2: "incremental"}[conn.execute("PRAGMA auto_vacuum").fetchone()[0]],
+        "last_runs": last_runs,
+    }
@@ -0,0 +1,161 @@
+"""Command line maintenance for the bakery database.
+
+Usage:
+    python manage.py rebuild-balances
+    python manage.py verify-balances
+    python manage.py backfill-summary
+    python manage.py rebuild-search
+    python manage.py backup --dir BACKUP_DIR [--keep 7] [--no-gzip]
+    python manage.py archive [--keep-months 2]
+    python manage.py import FILE --table sales [--chunk-rows 5000]
+    python manage.py render-reports
+    python manage.py maintain [--force] [--task analyze ...]
+    python manage.py test [-v]
+"""
+import argparse
+import os
+import sys
+import unittest
+
+import database as db
+import maintenance
+
+
+def cmd_rebuild_balances(args):
+    db.rebuild_balances()
+    print("Balances rebuilt from sales and ledger history.")
+    return 0
+
+
+def cmd_verify_balances(args):
+    mismatches = db.verify_balances()
+    for name, stored, actual in mismatches:
+        print(f"{name}: stored debit/credit {stored[0]:,.2f}/{stored[1]:,.2f}, "
+              f"actual {actual[0]:,.2f}/{actual[1]:,.2f}")
+    if mismatches:
+        print(f"{len(mismatches)} mismatching account(s); run rebuild-balances to fix.")
+        return 1
+    print("Balances match the sales and ledger history.")
+    return 0
+
+
+def cmd_backfill_summary(args):
+    db.backfill_daily_summary()
+    print("Daily summary rebuilt from production, sales, other sales and expenses.")
+    return 0
+
+
+def cmd_rebuild_search(args):
+    db.rebuild_search_index()
+    print("Ledger search index rebuilt, archived entries included.")
+    return 0
+
+
+def cmd_backup(args):
+    def progress(done, total):
+        print(f"\r{done}/{total} pages", end="", flush=True)
+    path = db.rotate_backups(args.dir, keep=args.keep, compress=not args.no_gzip, progress=progress)
+    print(f"\nBackup written to {path}")
+    return 0
+
+
+def cmd_archive(args):
+    months = db.archive_months(keep_months=args.keep_months)
+    if months:
+        print(f"Archived {len(months)} month(s): {', '.join(months)}")
+    else:
+        print("No closed months to archive.")
+    return 0
+
+
+def cmd_import(args):
+    import importer
+
+    def progress(stats):
+        print(f"\r{stats['rows']:,} rows saved, {stats['rejected']:,} rejected, "
+              f"{stats['rows_per_sec']:,.0f} rows/s", end="", flush=True)
+    stats = importer.import_file(args.file, args.table, chunk_rows=args.chunk_rows, progress=progress)
+    print(f"\nImported {stats['rows']:,} rows into {args.table} in {stats['seconds']:.1f}s "
+          f"({stats['rejected']:,} rejected).")
+    return 0
+
+
+def cmd_render_reports(args):
+    import report_cache
+    count = report_cache.prerender(wait_for_all=True)
+    print(f"Rendered {count} month(s)." if count else "All closed months are up to date.")
+    return 0
+
+
+def cmd_maintain(args):
+    results = maintenance.run_due(tasks=args.task, force=args.force)
+    for task, (status, seconds, detail) in results.items():
+        print(f"{task}: {status} in {seconds:.2f}s" + (f" ({detail})" if detail else ""))
+    if not results:
+        print("No maintenance is due.")
+    return 0 if all(status == "ok" for status, _, _ in results.values()) else 1
+
+
+def cmd_test(args):
+    here = os.path.dirname(os.path.abspath(__file__))
+    suite = unittest.defaultTestLoader.discover(os.path.join(here, "tests"), top_level_dir=here)
+    result = unittest.TextTestRunner(verbosity=2 if args.verbose else 1).run(suite)
+    return 0 if result.wasSuccessful() else 1
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Bakery database maintenance")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("rebuild-balances", help="recompute account balances from history")
+    p.set_defaults(func=cmd_rebuild_balances)
+
+    p = sub.add_parser("verify-balances", help="check account balances against history")
+    p.set_defaults(func=cmd_verify_balances)
+
+    p = sub.add_parser("backfill-summary", help="rebuild the daily report rollup from history")
+    p.set_defaults(func=cmd_backfill_summary)
+
+    p = sub.add_parser("rebuild-search", help="rebuild the ledger search index")
+    p.set_defaults(func=cmd_rebuild_search)
+
+    p = sub.add_parser("backup", help="write a rotating backup of the database")
+    p.add_argument("--dir", required=True, help="directory holding the backups")
+    p.add_argument("--keep", type=int, default=7, help="number of backups to keep (default 7)")
+    p.add_argument("--no-gzip", action="store_true", help="store uncompressed .db files")
+    p.set_defaults(func=cmd_backup)
+
+    p = sub.add_parser("archive", help="move closed months into the columnar archive")
+    p.add_argument("--keep-months", type=int, default=db.ARCHIVE_KEEP_MONTHS,
+                   help=f"recent months to keep in the database (default {db.ARCHIVE_KEEP_MONTHS})")
+    p.set_defaults(func=cmd_archive)
+
+    p = sub.add_parser("import", help="bulk load history from a CSV or Excel file")
+    p.add_argument("file", help="CSV or Excel (.xlsx) file")
+    p.add_argument("--table", required=True, choices=sorted(db.BULK_STATEMENTS), help="table to load into")
+    p.add_argument("--chunk-rows", type=int, default=5000, help="rows read and saved per transaction (default 5000)")
+    p.set_defaults(func=cmd_import)
+
+    p = sub.add_parser("render-reports", help="pre-render the charts of closed months")
+    p.set_defaults(func=cmd_render_reports)
+
+    p = sub.add_parser("maintain", help="run the due ANALYZE / optimize / checkpoint / vacuum tasks")
+    p.add_argument("--task", nargs="*", choices=list(maintenance.TASKS),
+                   help="only these tasks")
+    p.add_argument("--force", action="store_true", help="run them even if not due")
+    p.set_defaults(func=cmd_maintain)
+
+    p = sub.add_parser("test", help="run the test suite")
+    p.add_argument("-v", "--verbose", action="store_true", help="list every test")
+    p.set_defaults(func=cmd_test)
+
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
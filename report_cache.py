@@ -0,0 +1,201 @@
+"""Pre-rendered monthly reports.
+
+A closed month's figures and its two charts (daily revenue and revenue
+per distributor) are rendered once into summary.json and PNG images under
+<database>_reports/YYYY-MM/<key>/. The key is a content hash of what they
+are drawn from, the month's daily rollup and per-distributor totals, so
+a back-dated edit to a month changes its key and only that month is
+rendered again.
+
+Rendering runs in a process pool, so a page never waits for matplotlib:
+until a month's artifact is ready the page draws its charts live.
+"""
+import hashlib
+import json
+import logging
+import multiprocessing
+import os
+import shutil
+import threading
+from concurrent.futures import ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime
+
+import database as db
+import reports
+
+RENDER_WORKERS = 2
+RENDER_VERSION = 1  # bump when the charts change, so every month is rendered again
+SUMMARY_FILE = "summary.json"
+CHARTS = ("daily", "distributors")
+
+logger = logging.getLogger(__name__)
+
+_pool = None
+_pending = {}  # artifact directory -> Future
+_started = set()  # databases prerender() has been started for
+_lock = threading.Lock()
+
+
+def _month_dir(year, month):
+    return os.path.join(os.path.splitext(db.current_db())[0] + "_reports", f"{year}-{month:02d}")
+
+
+def _closed(year, month):
+    return f"{year}-{month:02d}" < datetime.now().strftime('%Y-%m')
+
+
+def _payload(summary):
+    # Plain values in a stable order, for the hash and the worker process
+    return {
+        "revenue": float(summary["revenue"]),
+        "expenses": float(summary["expenses"]),
+        "profit": float(summary["profit"]),
+        "daily_sales": [[date, float(value)] for date, value in summary["daily_sales"].itertuples(index=False)],
+        "distributor_sales": sorted([name, float(value)]
+                                    for name, value in summary["distributor_sales"].itertuples(index=False)),
+    }
+
+
+def content_key(payload):
+    text = json.dumps([RENDER_VERSION, payload], ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:16]
+
+
+def render(directory, key, payload):
+    """Write one month's artifact into directory/key (runs in a worker process)."""
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+    from matplotlib.ticker import StrMethodFormatter
+
+    target = os.path.join(directory, key)
+    if os.path.exists(os.path.join(target, SUMMARY_FILE)):
+        return target
+    tmp = f"{target}.{os.getpid()}.tmp"
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+
+    fig, ax = plt.subplots(figsize=(6, 3.5))
+    days = [datetime.strptime(date, '%Y-%m-%d') for date, _ in payload["daily_sales"]]
+    ax.plot(days, [value for _, value in payload["daily_sales"]], marker="o", markersize=3)
+    ax.yaxis.set_major_formatter(StrMethodFormatter("{x:,.0f}"))
+    ax.grid(alpha=0.3)
+    fig.autofmt_xdate()
+    fig.tight_layout()
+    fig.savefig(os.path.join(tmp, "daily.png"), dpi=120)
+    plt.close(fig)
+
+    names = [name for name, _ in payload["distributor_sales"]]
+    fig, ax = plt.subplots(figsize=(max(6, 0.25 * len(names)), 3.5))
+    ax.bar(names, [value for _, value in payload["distributor_sales"]])
+    ax.yaxis.set_major_formatter(StrMethodFormatter("{x:,.0f}"))
+    ax.grid(axis="y", alpha=0.3)
+    ax.tick_params(axis="x", labelrotation=90 if len(names) > 8 else 0)
+    fig.tight_layout()
+    fig.savefig(os.path.join(tmp, "distributors.png"), dpi=120)
+    plt.close(fig)
+
+    with open(os.path.join(tmp, SUMMARY_FILE), "w", encoding="utf-8") as f:
+        json.dump(payload, f, ensure_ascii=False)
+    try:
+        os.replace(tmp, target)
+    except OSError:
+        # Another process rendered the same key first
+        shutil.rmtree(tmp, ignore_errors=True)
+    # Older keys of this month are out of date
+    for name in os.listdir(directory):
+        if name != key and not name.endswith(".tmp"):
+            shutil.rmtree(os.path.join(directory, name), ignore_errors=True)
+    return target
+
+
+def _schedule(directory, key, payload):
+    global _pool
+    target = os.path.join(directory, key)
+    with _lock:
+        future = _pending.get(target)
+        if future is not None:
+            return future
+        for _ in range(2):
+            if _pool is None:
+                # spawn: forking a process that runs threads (Streamlit, the writers) isn't safe
+                _pool = ProcessPoolExecutor(max_workers=RENDER_WORKERS,
+                                            mp_context=multiprocessing.get_context("spawn"))
+            try:
+                future = _pending[target] = _pool.submit(render, directory, key, payload)
+                break
+            except BrokenProcessPool:
+                _pool = None  # a worker died; start a new pool
+
+    def done(f):
+        with _lock:
+            _pending.pop(target, None)
+        if f.exception() is not None:
+            logger.warning("rendering %s failed: %s", target, f.exception())
+    future.add_done_callback(done)
+    return future
+
+
+def _artifact(year, month, summary):
+    """(artifact dict or None, payload, directory, key) for a month."""
+    payload = _payload(summary)
+    key = content_key(payload)
+    directory = _month_dir(year, month)
+    target = os.path.join(directory, key)
+    if not os.path.exists(os.path.join(target, SUMMARY_FILE)):
+        return None, payload, directory, key
+    charts = {name: os.path.join(target, f"{name}.png") for name in CHARTS}
+    return dict(payload, key=key, charts=charts), payload, directory, key
+
+
+def get_month(year, month, summary=None):
+    """The rendered report of a closed month, or None.
+
+    The result holds the month's figures and the paths of its chart
+    images. A missing or outdated artifact is queued for rendering and
+    None is returned, so the caller draws the month live meanwhile.
+    summary is reports.monthly_summary(year, month), if already at hand.
+    """
+    if not _closed(year, month):
+        return None
+    artifact, payload, directory, key = _artifact(year, month, summary or reports.monthly_summary(year, month))
+    if artifact is None:
+        _schedule(directory, key, payload)
+    return artifact
+
+
+def prerender(wait_for_all=False):
+    """Queue every closed month of this thread's database whose artifact is missing or outdated.
+
+    Returns the number of months queued; with wait_for_all, waits until they are rendered.
+    """
+    futures = []
+    for value in db.get_months():
+        year, month = map(int, value.split("-"))
+        if not _closed(year, month):
+            continue
+        artifact, payload, directory, key = _artifact(year, month, reports.monthly_summary(year, month))
+        if artifact is None:
+            futures.append(_schedule(directory, key, payload))
+    if wait_for_all:
+        wait(futures)
+    return len(futures)
+
+
+def start_prerender(branch=db.MAIN_BRANCH):
+    """Run prerender() for a branch on a background thread, once per process."""
+    with db.use_branch(branch):
+        path = db.current_db()
+    with _lock:
+        if path in _started:
+            return
+        _started.add(path)
+
+    def run():
+        try:
+            with db.background(), db.use_branch(branch):
+                prerender()
+        except Exception:
+            logger.exception("prerendering reports for %s failed", path)
+    threading.Thread(target=run, daemon=True, name="report-prerender").start()
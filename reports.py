@@ -0,0 +1,128 @@
+"""Figures behind the report and account pages.
+
+These are kept free of Streamlit so the same code serves app.py, the
+benchmarks and any other entry point.
+"""
+from concurrent.futures import ThreadPoolExecutor
+
+import database as db
+
+BRANCH_WORKERS = 8
+_branch_pool = None
+
+# Only the columns the report pages show are loaded
+DAILY_SALES_COLUMNS = ("distributor", "net_sales", "total_amount", "cash_paid")
+MONTHLY_SALES_COLUMNS = ("date", "distributor", "net_sales", "total_amount")
+
+
+def _num(value):
+    # SUM() over no rows comes back as None/NaN
+    return 0 if value is None or value != value else value
+
+
+def daily_report(date):
+    """Production, sales and profit for one day, plus that day's sales rows."""
+    day = db.get_daily_summary(date)
+    return {
+        "date": date,
+        "expected": day['expected_production'],
+        "net_sales": day['net_sales'],
+        "deficit": day['deficit'],
+        "loss_value": day['loss_value'],
+        "revenue": day['distributor_revenue'] + day['other_revenue'],
+        "expenses": day['expenses'],
+        "profit": day['profit'],
+        "sales": db.get_data("sales", date, columns=DAILY_SALES_COLUMNS, typed=True),
+    }
+
+
+def month_bounds(year, month):
+    return db.month_range(year, month)
+
+
+def monthly_summary(year, month):
+    """Month totals, the daily revenue curve and revenue per distributor."""
+    start_date, end_date = month_bounds(year, month)
+    days = db.get_daily_summaries(start_date, end_date)
+    revenue = days['distributor_revenue'].sum() + days['other_revenue'].sum()
+    expenses = days['expenses'].sum()
+    return {
+        "start_date": start_date,
+        "end_date": end_date,
+        "revenue": revenue,
+        "expenses": expenses,
+        "profit": revenue - expenses,
+        "daily_sales": days[['date', 'distributor_revenue']].rename(columns={'distributor_revenue': 'total_amount'}),
+        "distributor_sales": db.aggregate("sales", {'total_amount': 'sum'}, ['distributor'], start_date, end_date),
+    }
+
+
+def monthly_report(year, month):
+    """The month's summary plus its sales rows."""
+    report = monthly_summary(year, month)
+    report["sales"] = db.get_data("sales", start_date=report["start_date"], end_date=report["end_date"],
+                                  columns=MONTHLY_SALES_COLUMNS, typed=True)
+    return report
+
+
+def ledger_summary(name=None):
+    """Total debit, credit and balance of one account, or of all accounts."""
+    totals = db.aggregate("balances", {'debit': 'sum', 'credit': 'sum'},
+                          filters={'name': name} if name else None).iloc[0]
+    debit, credit = _num(totals['debit']), _num(totals['credit'])
+    return {"debit": debit, "credit": credit, "balance": debit - credit}
+
+
+# Consolidated reports
+# Each branch is queried on its own worker thread (with its own
+# connection) and the partial figures are merged, so a consolidated
+# report takes about as long as the slowest branch.
+
+def for_each_branch(func, *args):
+    """Run func(*args) on every branch database concurrently; return {branch: result}."""
+    global _branch_pool
+    if _branch_pool is None:
+        # Long-lived workers keep their per-thread connections open
+        _branch_pool = ThreadPoolExecutor(max_workers=BRANCH_WORKERS, thread_name_prefix="branch")
+
+    def run(name):
+        with db.use_branch(name):
+            return func(*args)
+    names = list(db.list_branches())
+    return dict(zip(names, _branch_pool.map(run, names)))
+
+
+def _concat(frames):
+    import pandas as pd
+    return pd.concat([frame.assign(branch=name) for name, frame in frames.items()], ignore_index=True)
+
+
+def _sum_parts(parts, keys):
+    return {key: sum(part[key] for part in parts.values()) for key in keys}
+
+
+def consolidated_daily_report(date):
+    """daily_report summed over all branches; sales rows get a branch column."""
+    parts = for_each_branch(daily_report, date)
+    report = _sum_parts(parts, ["expected", "net_sales", "deficit", "loss_value", "revenue", "expenses", "profit"])
+    report["date"] = date
+    report["sales"] = _concat({name: part["sales"] for name, part in parts.items()})
+    return report
+
+
+def consolidated_monthly_report(year, month):
+    """monthly_report summed over all branches."""
+    parts = for_each_branch(monthly_report, year, month)
+    report = _sum_parts(parts, ["revenue", "expenses", "profit"])
+    report["start_date"], report["end_date"] = month_bounds(year, month)
+    daily = _concat({name: part["daily_sales"] for name, part in parts.items()})
+    report["daily_sales"] = daily.groupby('date', as_index=False)['total_amount'].sum()
+    by_distributor = _concat({name: part["distributor_sales"] for name, part in parts.items()})
+    report["distributor_sales"] = by_distributor.groupby('distributor', as_index=False)['total_amount'].sum()
+    report["sales"] = _concat({name: part["sales"] for name, part in parts.items()})
+    return report
+
+
+def consolidated_ledger_summary(name=None):
+    """ledger_summary summed over all branches."""
+    return _sum_parts(for_each_branch(ledger_summary, name), ["debit", "credit", "balance"])
@@ -0,0 +1,23 @@
+"""Shared setup for the tests: each test gets a fresh database file."""
+import os
+import shutil
+import tempfile
+import unittest
+
+import database as db
+
+
+class DatabaseTestCase(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp(prefix="bakery_test_")
+        self.addCleanup(shutil.rmtree, self.dir, ignore_errors=True)
+        self.addCleanup(setattr, db, "DB_NAME", db.DB_NAME)
+        db.DB_NAME = os.path.join(self.dir, "bakery.db")
+
+    def tearDown(self):
+        db.stop_writers()
+        db.close_connection()
+        db.clear_cache()
+
+    def sql(self, query, params=()):
+        return db.get_connection().execute(query, params).fetchall()
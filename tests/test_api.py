@@ -0,0 +1,66 @@
+import json
+import os
+import unittest
+from unittest import mock
+
+import api
+import database as db
+from tests.base import DatabaseTestCase
+
+
+class ApiTest(DatabaseTestCase):
+    def setUp(self):
+        super().setUp()
+        db.add_distributor("هيثم", 18)
+
+    def post(self, handler, **params):
+        future, payload = handler(params)
+        future.result(timeout=10)
+        return payload
+
+    def assertRejected(self, handler, message, **params):
+        with self.assertRaises(api.HTTPError) as caught:
+            handler(params)
+        self.assertEqual(caught.exception.status, 400)
+        self.assertIn(message, str(caught.exception))
+
+    def test_sales_are_priced_by_the_server(self):
+        payload = self.post(api.post_sales, date="2024-05-01", distributor="هيثم", delivered=100,
+                            returned=4, cash_paid=500, price=1)
+        self.assertEqual((payload["net_sales"], payload["price"], payload["total_amount"]), (96, 18, 1728))
+        balance = api.get_balance({"name": "هيثم"})
+        self.assertEqual((balance["debit"], balance["credit"]), (1728, 500))
+        self.assertEqual(api.get_daily_report({"date": "2024-05-01"})["net_sales"], 96)
+
+    def test_bad_fields_are_rejected(self):
+        sale = {"date": "2024-05-01", "distributor": "هيثم", "delivered": 10}
+        self.assertRejected(api.post_sales, "unknown distributor", **dict(sale, distributor="هيتم"))
+        self.assertRejected(api.post_sales, "date", **dict(sale, date="2024-13-01"))
+        self.assertRejected(api.post_sales, "negative", **dict(sale, delivered=-1))
+        self.assertRejected(api.post_sales, "returned", **dict(sale, returned=11))
+        self.assertRejected(api.post_sales, "cash_paid", **dict(sale, cash_paid=float("nan")))
+        self.assertRejected(api.post_sales, "delivered", **dict(sale, delivered=float("inf")))
+        self.assertRejected(api.post_ledger, "credit", date="2024-05-01", name="هيثم", credit="inf")
+        self.assertRejected(api.post_ledger, "debit or credit", date="2024-05-01", name="هيثم")
+        self.assertEqual(db.get_data("sales").empty, True)
+
+    def test_responses_are_strict_json(self):
+        head, _, body = api._response(200, {"value": 1.5}, False).partition(b"\r\n\r\n")
+        self.assertTrue(head.startswith(b"HTTP/1.1 200"))
+        self.assertEqual(json.loads(body), {"value": 1.5})
+        with self.assertLogs("api", "ERROR"):
+            head, _, body = api._response(200, {"value": float("nan")}, False).partition(b"\r\n\r\n")
+        self.assertTrue(head.startswith(b"HTTP/1.1 500"))
+        self.assertEqual(json.loads(body), {"error": "internal error"})
+
+    def test_public_hosts_need_a_token(self):
+        self.assertTrue(api._is_loopback("127.0.0.1"))
+        self.assertTrue(api._is_loopback("localhost"))
+        self.assertFalse(api._is_loopback("0.0.0.0"))
+        with mock.patch.dict(os.environ, {"BAKERY_API_TOKEN": ""}), mock.patch("sys.stderr"):
+            with self.assertRaises(SystemExit):
+                api.main(["--host", "0.0.0.0"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,42 @@
+import sqlite3
+import unittest
+from datetime import datetime
+
+import database as db
+from tests.base import DatabaseTestCase
+
+
+class ArchiveTest(DatabaseTestCase):
+    def setUp(self):
+        super().setUp()
+        for month in (1, 2, 3, 4):
+            date = f"2024-{month:02d}-10"
+            for name, delivered in (("علي", 10 * month), ("درهم", 5)):
+                db.save_sales(date, name, delivered, 0, delivered, 16, delivered * 16, month)
+            db.add_ledger_entry(date, "علي", f"قسط {month}", debit=month)
+
+    def test_reads_merge_archived_and_live_rows(self):
+        metrics = {"total_amount": "sum", "cash_paid": "avg", "net_sales": "max", "delivered": "count"}
+        data = db.get_data("sales", start_date="2024-02-01", end_date="2024-04-30")
+        by_name = db.aggregate("sales", metrics, ["distributor"])
+        totals = db.aggregate("sales", metrics, start_date="2024-01-01", end_date="2024-03-31")
+
+        self.assertEqual(db.archive_months(keep_months=1, today=datetime(2024, 4, 15)), ["2024-01", "2024-02", "2024-03"])
+        self.assertEqual(self.sql("SELECT COUNT(*) FROM sales"), [(2,)])
+        archived_data = db.get_data("sales", start_date="2024-02-01", end_date="2024-04-30")
+        self.assertEqual(sorted(archived_data["id"]), sorted(data["id"]))
+        self.assertTrue(db.aggregate("sales", metrics, ["distributor"]).equals(by_name))
+        self.assertTrue(db.aggregate("sales", metrics, start_date="2024-01-01", end_date="2024-03-31").equals(totals))
+        self.assertEqual(db.verify_balances(), [])
+        self.assertEqual(db.search_ledger("قسط")[1], 4)
+
+    def test_archived_months_are_read_only(self):
+        db.archive_months(keep_months=1, today=datetime(2024, 4, 15))
+        self.assertTrue(db.is_archived("2024-02-10"))
+        with self.assertRaises(sqlite3.IntegrityError):
+            db.save_sales("2024-02-10", "علي", 1, 0, 1, 16, 16, 0)
+        db.save_sales("2024-04-11", "علي", 1, 0, 1, 16, 16, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
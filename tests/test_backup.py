@@ -0,0 +1,61 @@
+import gzip
+import os
+import sqlite3
+import tarfile
+import unittest
+from datetime import datetime
+
+import database as db
+from tests.base import DatabaseTestCase
+
+
+class BackupTest(DatabaseTestCase):
+    def setUp(self):
+        super().setUp()
+        for month in (1, 2, 3):
+            db.save_sales(f"2024-{month:02d}-10", "علي", 10, 0, 10, 16, 160, 0)
+
+    def count_sales(self, path):
+        conn = sqlite3.connect(path)
+        try:
+            return conn.execute("SELECT COUNT(*) FROM sales").fetchone()[0]
+        finally:
+            conn.close()
+
+    def test_copy_restores_the_rows(self):
+        steps = []
+        path = db.create_backup(os.path.join(self.dir, "copy.db"), progress=lambda done, total: steps.append(done))
+        self.assertEqual(self.count_sales(path), 3)
+        self.assertTrue(steps)
+
+        path = db.create_backup(os.path.join(self.dir, "copy.db.gz"), compress=True)
+        restored = os.path.join(self.dir, "restored.db")
+        with gzip.open(path) as src, open(restored, "wb") as dest:
+            dest.write(src.read())
+        self.assertEqual(self.count_sales(restored), 3)
+
+    def test_archive_is_bundled(self):
+        db.archive_months(keep_months=1, today=datetime(2024, 3, 15))
+        path = db.create_backup(os.path.join(self.dir, "copy.tar.gz"), compress=True, with_archive=True)
+        with tarfile.open(path) as tar:
+            names = tar.getnames()
+            tar.extractall(os.path.join(self.dir, "restored"), filter="data")
+        archive = os.path.basename(db._archive_dir())
+        self.assertIn("bakery.db", names)
+        self.assertTrue(any(name.startswith(archive + "/") for name in names))
+
+        db.stop_writers()
+        db.close_connection()
+        db.clear_cache()
+        db.DB_NAME = os.path.join(self.dir, "restored", "bakery.db")
+        self.assertEqual(len(db.get_data("sales")), 3)
+
+    def test_rotation_keeps_backups_of_the_same_second(self):
+        directory = os.path.join(self.dir, "backups")
+        paths = [db.rotate_backups(directory, keep=3) for _ in range(5)]
+        self.assertEqual(len(set(paths)), 5)
+        self.assertEqual(sorted(os.listdir(directory)), [os.path.basename(p) for p in paths[-3:]])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,30 @@
+import unittest
+
+import database as db
+from tests.base import DatabaseTestCase
+
+
+class BalancesTest(DatabaseTestCase):
+    def test_balances_follow_inserts_updates_and_deletes(self):
+        db.save_sales("2024-02-01", "علي", 10, 0, 10, 16, 160, 100)
+        db.add_ledger_entry("2024-02-02", "علي", "سلفة", debit=50)
+        row = db.get_balances("علي").iloc[0]
+        self.assertEqual((row["debit"], row["credit"], row["last_date"]), (210, 100, "2024-02-02"))
+
+        db.save_sales("2024-02-01", "علي", 20, 0, 20, 16, 320, 0)  # upsert: an update
+        with db.transaction() as conn:
+            conn.execute("DELETE FROM ledger WHERE name = 'علي'")
+        row = db.get_balances("علي").iloc[0]
+        self.assertEqual((row["debit"], row["credit"], row["last_date"]), (320, 0, "2024-02-01"))
+        self.assertEqual(db.verify_balances(), [])
+
+    def test_rebuild_matches_triggers(self):
+        for day in range(1, 6):
+            db.save_sales(f"2024-03-{day:02d}", "درهم", day, 0, day, 16, day * 16, day)
+        before = db.get_balances().values.tolist()
+        db.rebuild_balances()
+        self.assertEqual(db.get_balances().values.tolist(), before)
+
+
+if __name__ == "__main__":
+    unittest.main()
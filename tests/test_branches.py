@@ -0,0 +1,43 @@
+import os
+import unittest
+
+import database as db
+import reports
+from tests.base import DatabaseTestCase
+
+
+class BranchTest(DatabaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.path = db.add_branch("فرع المدينة")
+        db.save_sales("2024-02-01", "علي", 100, 0, 100, 16, 1600, 600)
+        with db.use_branch("فرع المدينة"):
+            db.save_sales("2024-02-01", "علي", 50, 0, 50, 16, 800, 300)
+
+    def test_branches_have_their_own_database(self):
+        self.assertEqual(list(db.list_branches()), [db.MAIN_BRANCH, "فرع المدينة"])
+        self.assertEqual(os.path.dirname(self.path), self.dir)
+        self.assertTrue(os.path.exists(self.path))
+        with self.assertRaises(ValueError):
+            db.add_branch("فرع المدينة")
+        with self.assertRaises(ValueError):
+            db.set_branch("فرع غير موجود")
+
+        self.assertEqual(db.get_data("sales")["net_sales"].tolist(), [100])
+        with db.use_branch("فرع المدينة"):
+            self.assertEqual(db.current_db(), self.path)
+            self.assertEqual(db.get_data("sales")["net_sales"].tolist(), [50])
+        self.assertEqual(db.current_db(), db.DB_NAME)
+
+    def test_consolidated_reports_sum_the_branches(self):
+        report = reports.consolidated_daily_report("2024-02-01")
+        self.assertEqual((report["net_sales"], report["revenue"]), (150, 2400))
+        self.assertEqual(sorted(report["sales"]["branch"]), sorted([db.MAIN_BRANCH, "فرع المدينة"]))
+        self.assertEqual(reports.consolidated_ledger_summary("علي"),
+                         {"debit": 2400, "credit": 900, "balance": 1500})
+        month = reports.consolidated_monthly_report(2024, 2)
+        self.assertEqual(month["distributor_sales"]["total_amount"].tolist(), [2400])
+
+
+if __name__ == "__main__":
+    unittest.main()
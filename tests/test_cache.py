@@ -0,0 +1,35 @@
+import unittest
+
+import database as db
+from tests.base import DatabaseTestCase
+
+
+class Rollback(Exception):
+    pass
+
+
+class CacheTest(DatabaseTestCase):
+    def totals(self):
+        return db.get_data("expenses")["total_expenses"].tolist()
+
+    def test_writes_invalidate_reads(self):
+        db.save_expenses("2024-01-01", 10, 0, 0, 10)
+        self.assertEqual(self.totals(), [10.0])
+        db.save_expenses("2024-01-01", 20, 0, 0, 20)
+        self.assertEqual(self.totals(), [20.0])
+        db.save_expenses("2024-01-02", 5, 0, 0, 5)
+        self.assertEqual(self.totals(), [20.0, 5.0])
+
+    def test_rolled_back_reads_are_not_served(self):
+        db.save_expenses("2024-01-01", 10, 0, 0, 10)
+        with self.assertRaises(Rollback):
+            with db.transaction():
+                db.save_expenses("2024-01-01", 999, 0, 0, 999)
+                self.assertEqual(self.totals(), [999.0])
+                raise Rollback
+        db.save_expenses("2024-01-01", 20, 0, 0, 20)
+        self.assertEqual(self.totals(), [20.0])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,17 @@
+import unittest
+
+import database as db
+
+
+class CalendarTest(unittest.TestCase):
+    def test_ranges(self):
+        self.assertEqual(db.month_range(2024, 2), ("2024-02-01", "2024-02-29"))
+        self.assertEqual(db.month_range(2023, 2), ("2023-02-01", "2023-02-28"))
+        self.assertEqual(db.week_range("2026-10-18"), ("2026-10-17", "2026-10-23"))
+        self.assertEqual(db.day_key("2024-04-30"), 20240430)
+        with self.assertRaises(ValueError):
+            db.date_range("2024-03-01", "2024-02-01")
+
+
+if __name__ == "__main__":
+    unittest.main()
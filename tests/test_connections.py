@@ -0,0 +1,35 @@
+import threading
+import unittest
+
+import database as db
+from tests.base import DatabaseTestCase
+
+
+class ConnectionTest(DatabaseTestCase):
+    def in_thread(self, func):
+        thread = threading.Thread(target=func)
+        thread.start()
+        thread.join()
+
+    def test_pragmas(self):
+        conn = db.get_connection()
+        self.assertEqual(conn.execute("PRAGMA journal_mode").fetchone()[0], "wal")
+        self.assertEqual(conn.execute("PRAGMA busy_timeout").fetchone()[0], db.BUSY_TIMEOUT_MS)
+
+    def test_ended_threads_hand_their_connection_on(self):
+        for day in range(1, 11):
+            self.in_thread(lambda: db.save_expenses(f"2024-01-{day:02d}", day, 0, 0, day))
+        self.assertEqual(db.get_connection_counts()[db.DB_NAME], 1)
+        self.assertEqual(len(db.get_data("expenses")), 10)
+
+    def test_open_transactions_are_rolled_back(self):
+        def dies_in_transaction():
+            db.get_connection().execute("BEGIN IMMEDIATE")
+            db.add_ledger_entry("2024-01-01", "علي", "", debit=1)
+        self.in_thread(dies_in_transaction)
+        db.add_ledger_entry("2024-01-02", "درهم", "", debit=1)
+        self.assertEqual(db.get_data("ledger")["name"].tolist(), ["درهم"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,48 @@
+import unittest
+
+import database as db
+from tests.base import DatabaseTestCase
+
+
+class DailySummaryTest(DatabaseTestCase):
+    def assertMatchesHistory(self):
+        incremental = self.sql("SELECT * FROM daily_summary ORDER BY date")
+        db.backfill_daily_summary()
+        rebuilt = self.sql("SELECT * FROM daily_summary ORDER BY date")
+        self.assertEqual(len(incremental), len(rebuilt))
+        for row, expected in zip(incremental, rebuilt):
+            self.assertEqual(row[0], expected[0])
+            for value, expected_value in zip(row[1:], expected[1:]):
+                self.assertAlmostEqual(value, expected_value)
+
+    def test_follows_inserts_updates_and_deletes(self):
+        db.save_production("2024-02-01", 2, 300)
+        db.save_sales("2024-02-01", "علي", 100, 0, 100, 16, 1600, 0)
+        db.save_sales("2024-02-01", "درهم", 50, 0, 50, 16, 800, 0)
+        db.save_other_sales("2024-02-01", "كيك", 70)
+        db.save_expenses("2024-02-01", 10, 20, 30, 60)
+        day = db.get_daily_summary("2024-02-01")
+        self.assertEqual((day["net_sales"], day["deficit"]), (150, 150))
+        self.assertEqual(day["profit"], 1600 + 800 + 70 - 60 - 150 * 16)
+
+        db.save_sales("2024-02-01", "علي", 120, 0, 120, 16, 1920, 0)
+        with db.transaction() as conn:
+            conn.execute("UPDATE sales SET date = '2024-02-02' WHERE distributor = 'درهم'")
+            conn.execute("DELETE FROM expenses")
+            conn.execute("UPDATE settings SET value = 18 WHERE key = 'price_distributor'")
+        self.assertEqual(db.get_daily_summary("2024-02-02")["net_sales"], 50)
+        self.assertEqual(db.get_daily_summary("2024-02-01")["loss_value"], 180 * 18)
+        self.assertMatchesHistory()
+
+    def test_saving_a_day_in_one_batch(self):
+        rows = [{"distributor": f"موزع {i}", "delivered": i, "returned": 0, "net_sales": i,
+                 "price": 16, "total_amount": i * 16, "cash_paid": 0} for i in range(1, 51)]
+        db.save_sales_batch("2024-02-03", rows)
+        db.save_sales_batch("2024-02-03", rows[:10])
+        day = db.get_daily_summary("2024-02-03")
+        self.assertEqual(day["net_sales"], sum(range(1, 51)))
+        self.assertMatchesHistory()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,55 @@
+import csv
+import io
+import unittest
+from datetime import datetime
+
+import database as db
+import exports
+from tests.base import DatabaseTestCase
+
+
+class ExportsTest(DatabaseTestCase):
+    def setUp(self):
+        super().setUp()
+        for month in (1, 2):
+            db.save_sales(f"2024-{month:02d}-10", "علي", 10, 0, 10, 16, 160, 100)
+            db.add_ledger_entry(f"2024-{month:02d}-11", "علي", "دفعة", credit=20)
+
+    def read_csv(self, sections):
+        with exports.export(sections) as f:
+            data = f.read()
+        self.assertTrue(data.startswith(b"\xef\xbb\xbf"))
+        return list(csv.reader(io.StringIO(data.decode("utf-8-sig"))))
+
+    def test_ledger_statement_keeps_a_running_balance(self):
+        rows = self.read_csv(exports.ledger_statement("علي"))
+        self.assertEqual(rows[0], exports.LEDGER_HEADERS)
+        self.assertEqual([row[0] for row in rows[1:]],
+                         ["2024-01-10", "2024-01-11", "2024-02-10", "2024-02-11"])
+        self.assertEqual([float(row[5]) for row in rows[1:]], [60, 40, 100, 80])
+
+    def test_archived_months_are_exported(self):
+        before = self.read_csv(exports.ledger_statement())
+        db.archive_months(keep_months=1, today=datetime(2024, 2, 15))
+        self.assertEqual(self.read_csv(exports.ledger_statement()), before)
+
+    def test_daily_report_sections(self):
+        rows = self.read_csv(exports.daily_report("2024-02-10"))
+        self.assertEqual(rows[0], ["البند", "القيمة"])
+        self.assertEqual(rows[3], ["المبيعات الفعلية", "10"])
+        blank = rows.index([])
+        self.assertEqual(rows[blank + 1], exports.SALES_HEADERS)
+        self.assertEqual(rows[blank + 2][:2], ["2024-02-10", "علي"])
+
+    @unittest.skipUnless(exports.XLSX_AVAILABLE, "openpyxl is not installed")
+    def test_xlsx(self):
+        import openpyxl
+        with exports.export(exports.monthly_sales(2024, 1), "xlsx") as f:
+            sheet = openpyxl.load_workbook(f).active
+            rows = list(sheet.values)
+        self.assertEqual(list(rows[0]), exports.SALES_HEADERS)
+        self.assertEqual(rows[1][:2], ("2024-01-10", "علي"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,48 @@
+import io
+import unittest
+from datetime import datetime
+
+import database as db
+import importer
+from tests.base import DatabaseTestCase
+
+SALES_CSV = """التاريخ,الموزع,المستلم,المرتجع,السعر
+2024-03-01,علي,100,10,16
+٠٢/٠٣/٢٠٢٤,هيـثم ,"1,200",0,16
+2024-03-03,,50,0,16
+not a date,علي,50,0,16
+2024-03-04,علي,abc,0,16
+2024-01-05,علي,10,0,16
+"""
+
+
+class ImporterTest(DatabaseTestCase):
+    def test_csv_rows_are_cleaned_saved_or_rejected(self):
+        db.save_sales("2024-01-10", "علي", 1, 0, 1, 16, 16, 0)
+        db.archive_months(keep_months=0, today=datetime(2024, 2, 15))
+        seen = []
+        stats = importer.import_file(io.BytesIO(SALES_CSV.encode("utf-8-sig")), "sales", "sales.csv",
+                                     chunk_rows=2, progress=seen.append)
+        self.assertEqual((stats["rows"], stats["rejected"]), (2, 4))
+        self.assertEqual(len(seen), 3)
+        self.assertEqual(seen[-1]["fraction"], 1.0)
+
+        sales = db.get_data("sales", start_date="2024-03-01", end_date="2024-03-31")
+        rows = sales.sort_values("date")[["date", "distributor", "delivered", "net_sales", "total_amount"]]
+        self.assertEqual(rows.values.tolist(), [["2024-03-01", "علي", 100, 90, 1440],
+                                                ["2024-03-02", "هيثم", 1200, 1200, 19200]])
+        self.assertEqual(db.verify_balances(), [])
+
+    def test_reimport_upserts(self):
+        data = "date,item_name,amount\n2024-03-01,كيك,70\n".encode("utf-8")
+        importer.import_file(io.BytesIO(data), "other_sales", "other.csv")
+        importer.import_file(io.BytesIO(data.replace(b"70", b"90")), "other_sales", "other.csv")
+        self.assertEqual(db.get_data("other_sales")["amount"].tolist(), [90])
+
+    def test_missing_columns(self):
+        with self.assertRaises(ValueError):
+            importer.import_file(io.BytesIO(b"date,flour_bags\n2024-03-01,2\n"), "expenses", "e.csv")
+
+
+if __name__ == "__main__":
+    unittest.main()
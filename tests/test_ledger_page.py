@@ -0,0 +1,50 @@
+import unittest
+from datetime import datetime
+
+import database as db
+from tests.base import DatabaseTestCase
+
+
+class LedgerPageTest(DatabaseTestCase):
+    def setUp(self):
+        super().setUp()
+        for month in (1, 2, 3):
+            for day in (1, 2):
+                date = f"2024-{month:02d}-{day:02d}"
+                for name in ("علي", "درهم"):
+                    db.save_sales(date, name, 10, 0, 10, 16, 160, month)
+                    db.add_ledger_entry(date, name, "دفعة", credit=day)
+                db.add_ledger_entry(date, "علي", "سلفة", debit=5)
+
+    def entries(self, name=None):
+        where, params = ("WHERE name = ?", (name,)) if name else ("", ())
+        return self.sql(f"SELECT source, id FROM ledger_entries {where} ORDER BY date DESC, source DESC, id DESC",
+                        params)
+
+    def pages(self, name=None, limit=4):
+        rows, cursor = [], None
+        while True:
+            page, cursor = db.get_ledger_page(name, after=cursor, limit=limit)
+            self.assertLessEqual(len(page), limit)
+            rows += list(zip(page["source"], page["id"].astype(int)))
+            if cursor is None:
+                return rows
+
+    def test_pages_follow_the_statement_order(self):
+        for name in (None, "علي", "درهم"):
+            self.assertEqual(self.pages(name), self.entries(name))
+
+    def test_pages_continue_into_archived_months(self):
+        expected = {name: self.entries(name) for name in (None, "علي")}
+        db.archive_months(keep_months=1, today=datetime(2024, 3, 15))
+        for name, entries in expected.items():
+            self.assertEqual(self.pages(name, limit=3), entries)
+
+    def test_date_range(self):
+        page, cursor = db.get_ledger_page(start_date="2024-02-01", end_date="2024-02-29", limit=100)
+        self.assertIsNone(cursor)
+        self.assertEqual(sorted(set(page["date"])), ["2024-02-01", "2024-02-02"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,59 @@
+import sqlite3
+import unittest
+
+import database as db
+from tests.base import DatabaseTestCase
+
+SQL_BASELINE_SALE = """INSERT INTO sales (date, distributor, delivered, returned, net_sales, price_per_unit,
+                                          total_amount, cash_paid) VALUES (?, ?, ?, ?, ?, ?, ?, ?)"""
+
+
+class MigrationTest(DatabaseTestCase):
+    def make_baseline(self):
+        # The schema and writes of the app before migrations existed
+        conn = sqlite3.connect(db.DB_NAME)
+        db._create_schema(conn)
+        conn.execute(SQL_BASELINE_SALE, ("2024-01-05", "هيثم", 100, 5, 95, 16, 1520, 1000))
+        conn.execute(SQL_BASELINE_SALE, ("2024-01-05", "هيثم", 80, 0, 80, 16, 1280, 0))  # stale duplicate
+        conn.execute(SQL_BASELINE_SALE, ("2024-01-06", "قديم", 10, 0, 10, 16, 160, 0))
+        conn.execute("INSERT INTO production (date, flour_bags, expected_production) VALUES ('2024-01-05', 2, 200)")
+        conn.execute("INSERT INTO production (date, flour_bags, expected_production) VALUES ('2024-01-05', 2, 200)")
+        conn.execute("""INSERT INTO ledger (date, name, description, debit, credit)
+                        VALUES ('2024-01-07', 'هيثم', 'لإصلاح السيارة', 0, 300)""")
+        conn.commit()
+        conn.close()
+
+    def test_upgrade_from_baseline(self):
+        self.make_baseline()
+        db.init_db()
+        self.assertEqual(db.schema_version(), len(db.MIGRATIONS))
+        # The duplicate the old pages showed and updated (lowest id) is kept
+        self.assertEqual(self.sql("SELECT id, delivered FROM sales WHERE distributor = 'هيثم'"), [(1, 100)])
+        self.assertEqual(self.sql("SELECT COUNT(*) FROM production"), [(1,)])
+        # Later migrations build their tables from the upgraded rows
+        balances = db.get_balances().set_index("name")
+        self.assertEqual((balances.loc["هيثم", "debit"], balances.loc["هيثم", "credit"]), (1520, 1300))
+        self.assertEqual(db.get_daily_summary("2024-01-05")["deficit"], 105)
+        self.assertEqual(db.search_ledger("اصلاح")[1], 1)
+        self.assertIn("قديم", db.get_distributors(active_only=False))
+        self.assertNotIn("قديم", db.get_distributors())
+
+    def test_saves_upsert_on_the_unique_keys(self):
+        db.save_sales("2024-01-05", "هيثم", 10, 0, 10, 16, 160, 0)
+        db.save_sales("2024-01-05", "هيثم", 12, 0, 12, 16, 192, 0)
+        db.save_production("2024-01-05", 1, 100)
+        db.save_production("2024-01-05", 2, 200)
+        self.assertEqual(self.sql("SELECT delivered FROM sales"), [(12,)])
+        self.assertEqual(self.sql("SELECT expected_production FROM production"), [(200,)])
+
+    def test_migrations_run_once(self):
+        db.init_db()
+        version = db.schema_version()
+        db.close_connection()
+        db._schema_ready.clear()
+        db.init_db()
+        self.assertEqual(db.schema_version(), version)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,41 @@
+import sqlite3
+import unittest
+
+import database as db
+from tests.base import DatabaseTestCase
+
+
+class SearchTest(DatabaseTestCase):
+    def test_folded_words_and_prefixes_match(self):
+        db.add_ledger_entry("2024-02-01", "محمد", "لإصلاح السيارة", debit=30)
+        db.add_ledger_entry("2024-02-02", "أحمد", "سلفة", debit=10)
+        for text in ("اصلاح", "سيارة", "السياره", "محم"):
+            page, total = db.search_ledger(text)
+            self.assertEqual(total, 1, text)
+            self.assertEqual(page.iloc[0]["name"], "محمد")
+        self.assertEqual(db.search_ledger("سلفة", name="محمد")[1], 0)
+
+    def test_updates_and_deletes_reach_the_index(self):
+        db.add_ledger_entry("2024-02-01", "محمد", "سلفة", debit=30)
+        self.assertEqual(db.search_ledger("سلفة")[1], 1)
+        with db.transaction() as conn:
+            conn.execute("UPDATE ledger SET description = 'دفعة' WHERE name = 'محمد'")
+        self.assertEqual(db.search_ledger("سلفة")[1], 0)
+        self.assertEqual(db.search_ledger("دفعة")[1], 1)
+        with db.transaction() as conn:
+            conn.execute("DELETE FROM ledger")
+        self.assertEqual(db.search_ledger("دفعة")[1], 0)
+
+    def test_other_clients_can_write_the_ledger(self):
+        db.init_db()
+        conn = sqlite3.connect(db.DB_NAME)
+        conn.execute("INSERT INTO ledger (date, name, description, debit, credit) "
+                     "VALUES ('2024-02-03', 'وجيه', 'دفعة نقدية', 0, 40)")
+        conn.commit()
+        conn.close()
+        self.assertEqual(db.search_ledger("نقديه")[1], 1)
+        self.assertEqual(db.get_balances("وجيه").iloc[0]["credit"], 40)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,40 @@
+import unittest
+from datetime import datetime
+
+import pandas as pd
+
+import database as db
+from tests.base import DatabaseTestCase
+
+
+class TypedReadsTest(DatabaseTestCase):
+    def setUp(self):
+        super().setUp()
+        for month in (1, 2):
+            db.save_sales(f"2024-{month:02d}-10", "علي", 10, 2, 8, 16, 128, 50.5)
+
+    def test_columns_are_projected_in_order(self):
+        df = db.get_data("sales", columns=["distributor", "date"])
+        self.assertEqual(list(df.columns), ["distributor", "date"])
+        with self.assertRaises(ValueError):
+            db.get_data("sales", columns=["date", "price; DROP TABLE sales"])
+
+    def test_compact_dtypes(self):
+        df = db.get_data("sales", typed=True)
+        self.assertTrue(pd.api.types.is_datetime64_dtype(df["date"]))
+        self.assertEqual(str(df["distributor"].dtype), "category")
+        self.assertEqual(str(df["net_sales"].dtype), "int32")
+        self.assertEqual(str(df["total_amount"].dtype), "float64")
+        self.assertEqual(str(db.get_data("sales", typed=True, float32=True)["total_amount"].dtype), "float32")
+        self.assertEqual(df["net_sales"].tolist(), [8, 8])
+
+    def test_archived_rows_get_the_same_dtypes(self):
+        live = db.get_data("sales", columns=["date", "distributor", "cash_paid"], typed=True)
+        db.archive_months(keep_months=1, today=datetime(2024, 2, 15))
+        merged = db.get_data("sales", columns=["date", "distributor", "cash_paid"], typed=True)
+        self.assertEqual(merged.dtypes.tolist(), live.dtypes.tolist())
+        self.assertEqual(merged["cash_paid"].tolist(), [50.5, 50.5])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,37 @@
+import sqlite3
+import unittest
+
+import database as db
+from tests.base import DatabaseTestCase
+
+
+class WriterTest(DatabaseTestCase):
+    def test_errors_reach_only_their_caller(self):
+        def fail():
+            raise ValueError("bad row")
+        futures = [db.submit(db.add_ledger_entry, "2024-05-01", "علي", "أ", debit=1),
+                   db.submit(fail),
+                   db.submit(db.add_ledger_entry, "2024-05-01", "علي", "ب", debit=2)]
+        self.assertIsNone(futures[0].result(timeout=10))
+        with self.assertRaises(ValueError):
+            futures[1].result(timeout=10)
+        self.assertIsNone(futures[2].result(timeout=10))
+        self.assertEqual(db.get_balances("علي").iloc[0]["debit"], 3)
+
+    def test_batch_that_cannot_start_fails_its_futures(self):
+        db.init_db()
+        other = sqlite3.connect(db.DB_NAME, isolation_level=None)
+        other.execute("BEGIN IMMEDIATE")
+        try:
+            future = db.submit(db.add_ledger_entry, "2024-05-01", "علي", "أ", debit=1)
+            with self.assertRaises(sqlite3.OperationalError):
+                future.result(timeout=db.BUSY_TIMEOUT_MS / 1000 + 10)
+        finally:
+            other.execute("ROLLBACK")
+            other.close()
+        # The writer is still there for later calls
+        db.submit(db.add_ledger_entry, "2024-05-01", "علي", "ب", debit=2).result(timeout=10)
+
+
+if __name__ == "__main__":
+    unittest.main()